@@ -0,0 +1,288 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+LEDGER_PROJECTION = {
+    "_id": 0, "id": 1, "symbol": 1, "action": 1, "quantity": 1, "price": 1,
+    "timestamp": 1, "realized_pnl": 1, "matched_lots": 1
+}
+
+# Upper bounds (hours) of the holding-time histogram buckets
+HOLDING_BUCKETS = [("1h", 1), ("1d", 24), ("1w", 24 * 7), ("30d", 24 * 30)]
+
+# Daily returns are taken over calendar days, since paper trades happen on any day
+PERIODS_PER_YEAR = 365
+
+
+class Ledger:
+    """One user's trades as columns, oldest first"""
+
+    def __init__(self, trades: pd.DataFrame, lots: pd.DataFrame, symbols: list):
+        # id, symbol_code, is_sell, quantity, price, timestamp, realized_pnl (NaN where not recorded)
+        self.trades = trades
+        # sell_row, buy_row (-1 if the BUY is unknown), quantity: one row per lot a SELL was matched against
+        self.lots = lots
+        # symbol_code -> symbol
+        self.symbols = symbols
+
+    @property
+    def last_trade_id(self) -> Optional[str]:
+        return self.trades["id"].iat[-1] if len(self.trades) else None
+
+    @classmethod
+    def from_trades(cls, trades) -> "Ledger":
+        builder = LedgerBuilder()
+        for trade in trades:
+            builder.add(trade)
+        return builder.build()
+
+
+class LedgerBuilder:
+    """Accumulates trade documents (sorted by timestamp) into a Ledger's columns.
+
+    Symbols and matched lots' trade ids are resolved to integers as rows arrive, so the
+    analytics themselves never hash strings.
+    """
+
+    def __init__(self):
+        self.ids, self.codes, self.is_sell, self.quantities, self.prices, self.timestamps, self.realized = [], [], [], [], [], [], []
+        self.lot_rows, self.lot_buy_rows, self.lot_quantities = [], [], []
+        self.symbol_codes: Dict[str, int] = {}
+        self.rows: Dict[str, int] = {}
+
+    def add(self, trade: dict):
+        row = len(self.ids)
+        self.ids.append(trade["id"])
+        self.rows[trade["id"]] = row
+        self.codes.append(self.symbol_codes.setdefault(trade["symbol"], len(self.symbol_codes)))
+        self.is_sell.append(trade["action"] == "SELL")
+        self.quantities.append(trade["quantity"])
+        self.prices.append(trade["price"])
+        self.timestamps.append(trade["timestamp"])
+        pnl = trade.get("realized_pnl")
+        self.realized.append(np.nan if pnl is None else pnl)
+        for lot in trade.get("matched_lots") or ():
+            self.lot_rows.append(row)
+            self.lot_buy_rows.append(self.rows.get(lot["trade_id"], -1))
+            self.lot_quantities.append(lot["quantity"])
+
+    def build(self) -> Ledger:
+        return Ledger(
+            pd.DataFrame({
+                "id": pd.Series(self.ids, dtype=object),
+                "symbol_code": np.array(self.codes, dtype=np.int64),
+                "is_sell": np.array(self.is_sell, dtype=bool),
+                "quantity": np.array(self.quantities, dtype=np.int64),
+                "price": np.array(self.prices, dtype=np.float64),
+                "timestamp": pd.to_datetime(pd.Series(self.timestamps, dtype=object)),
+                "realized_pnl": np.array(self.realized, dtype=np.float64),
+            }),
+            pd.DataFrame({
+                "sell_row": np.array(self.lot_rows, dtype=np.int64),
+                "buy_row": np.array(self.lot_buy_rows, dtype=np.int64),
+                "quantity": np.array(self.lot_quantities, dtype=np.int64),
+            }),
+            list(self.symbol_codes)
+        )
+
+
+async def load_ledger(db, user_id: str, batch_size: int = 5000) -> Ledger:
+    """Stream a user's trade history into columns with one query, never holding the documents"""
+    builder = LedgerBuilder()
+    cursor = db.paper_trades.find({"user_id": user_id}, LEDGER_PROJECTION).sort("timestamp", 1).batch_size(batch_size)
+    async for trade in cursor:
+        builder.add(trade)
+    return builder.build()
+
+
+def _fill_legacy_pnl(trades: pd.DataFrame) -> np.ndarray:
+    """Realized P&L per row, replaying average cost for SELLs stored before lots were tracked"""
+    is_sell = trades["is_sell"].to_numpy()
+    pnl = np.where(is_sell, trades["realized_pnl"].to_numpy(), 0.0)
+    missing = np.isnan(pnl)
+    if not missing.any():
+        return pnl
+
+    # Replay only symbols with a missing value, one symbol after another: a stable sort keeps
+    # each symbol's rows in time order, so the whole replay is a single pass over plain lists
+    codes = trades["symbol_code"].to_numpy()
+    rows = np.flatnonzero(np.isin(codes, np.unique(codes[missing])))
+    rows = rows[np.argsort(codes[rows], kind="stable")]
+    columns = zip(
+        rows.tolist(), codes[rows].tolist(), is_sell[rows].tolist(), missing[rows].tolist(),
+        trades["quantity"].to_numpy()[rows].tolist(), trades["price"].to_numpy()[rows].tolist(),
+    )
+    filled_rows, filled = [], []
+    current, shares, cost = None, 0, 0.0
+    for row, code, sell, unknown, quantity, price in columns:
+        if code != current:
+            current, shares, cost = code, 0, 0.0
+        if not sell:
+            shares += quantity
+            cost += quantity * price
+            continue
+        avg_cost = cost / shares if shares else 0.0
+        sold = min(quantity, shares)
+        if unknown:
+            filled_rows.append(row)
+            filled.append((price - avg_cost) * sold)
+        shares -= sold
+        cost = avg_cost * shares
+    pnl[filled_rows] = filled
+    return pnl
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return round(float(numerator / denominator), 4) if denominator else None
+
+
+def _holding_times(ledger: Ledger) -> dict:
+    """Hours from each matched lot's BUY to the SELL that closed it"""
+    lots = ledger.lots
+    timestamps = ledger.trades["timestamp"].to_numpy()
+    # Lots from before tracking or merged average-cost lots have no known BUY
+    known = lots["buy_row"].to_numpy() >= 0
+    bought_at = timestamps[lots["buy_row"].to_numpy()[known]]
+    sold_at = timestamps[lots["sell_row"].to_numpy()[known]]
+    hours = (sold_at - bought_at) / np.timedelta64(1, "h")
+    if not len(hours):
+        return {"lots": 0, "p25": None, "median": None, "p75": None, "max": None, "buckets": {}}
+
+    p25, median, p75 = np.percentile(hours, [25, 50, 75])
+    edges = [0.0] + [upper for _, upper in HOLDING_BUCKETS] + [np.inf]
+    counts, _ = np.histogram(hours, bins=edges)
+    labels = [f"<{label}" for label, _ in HOLDING_BUCKETS] + [f">={HOLDING_BUCKETS[-1][0]}"]
+    return {
+        "lots": int(len(hours)),
+        "p25": round(float(p25), 2),
+        "median": round(float(median), 2),
+        "p75": round(float(p75), 2),
+        "max": round(float(hours.max()), 2),
+        "buckets": dict(zip(labels, counts.tolist())),
+    }
+
+
+def compute_analytics(ledger: Ledger, starting_equity: float = 100000.0) -> dict:
+    """Equity curve, drawdown, risk ratios, per-symbol breakdown and holding times from a ledger"""
+    trades = ledger.trades
+    pnl = _fill_legacy_pnl(trades)
+    is_sell = trades["is_sell"].to_numpy()
+    sell_pnl = pnl[is_sell]
+    sell_times = trades["timestamp"].to_numpy()[is_sell]
+
+    # Drawdown is measured trade by trade, the equity curve reported per day
+    equity = starting_equity + np.cumsum(sell_pnl)
+    peaks = np.maximum.accumulate(np.concatenate(([starting_equity], equity)))[1:]
+    drawdowns = peaks - equity
+    worst = int(np.argmax(drawdowns)) if len(drawdowns) else None
+
+    daily_pnl = pd.Series(sell_pnl, index=sell_times).resample("1D").sum()
+    daily_equity = starting_equity + daily_pnl.cumsum()
+    daily_peaks = np.maximum(daily_equity.cummax(), starting_equity)
+    returns = daily_pnl.to_numpy() / np.concatenate(([starting_equity], daily_equity.to_numpy()[:-1]))
+
+    sharpe = sortino = None
+    if len(returns) > 1:
+        mean = returns.mean()
+        std = returns.std(ddof=1)
+        downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+        sharpe = _ratio(mean * np.sqrt(PERIODS_PER_YEAR), std)
+        sortino = _ratio(mean * np.sqrt(PERIODS_PER_YEAR), downside)
+
+    gross_profit = float(sell_pnl[sell_pnl > 0].sum())
+    gross_loss = abs(float(sell_pnl[sell_pnl < 0].sum()))
+
+    codes = trades["symbol_code"].to_numpy()
+    width = len(ledger.symbols)
+    per_symbol = zip(
+        ledger.symbols,
+        np.bincount(codes, minlength=width).tolist(),
+        np.bincount(codes, weights=is_sell, minlength=width).tolist(),
+        np.bincount(codes, weights=is_sell & (pnl > 0), minlength=width).tolist(),
+        np.bincount(codes, weights=trades["quantity"].to_numpy() * trades["price"].to_numpy(), minlength=width).tolist(),
+        np.bincount(codes, weights=pnl, minlength=width).tolist(),
+    )
+
+    return {
+        "trades_count": int(len(trades)),
+        "completed_trades": int(is_sell.sum()),
+        "total_profit": round(float(sell_pnl.sum()), 2),
+        "gross_profit": round(gross_profit, 2),
+        "gross_loss": round(gross_loss, 2),
+        "profit_factor": _ratio(gross_profit, gross_loss),
+        "win_percentage": round(float((sell_pnl > 0).mean() * 100), 2) if len(sell_pnl) else 0.0,
+        "max_drawdown": round(float(drawdowns[worst]), 2) if worst is not None else 0.0,
+        "max_drawdown_percentage": round(float(drawdowns[worst] / peaks[worst] * 100), 2) if worst is not None else 0.0,
+        "sharpe_ratio": sharpe,
+        "sortino_ratio": sortino,
+        "equity_curve": [
+            {"date": day.strftime("%Y-%m-%d"), "equity": round(value, 2), "drawdown": round(peak - value, 2)}
+            for day, value, peak in zip(daily_equity.index, daily_equity.tolist(), daily_peaks.tolist())
+        ],
+        "symbols": sorted((
+            {
+                "symbol": symbol,
+                "trades": count,
+                "completed_trades": int(sells),
+                "win_percentage": round(wins / sells * 100, 2) if sells else 0.0,
+                "volume": round(volume, 2),
+                "realized_pnl": round(realized_pnl, 2),
+            }
+            for symbol, count, sells, wins, volume, realized_pnl in per_symbol
+        ), key=lambda row: row["symbol"]),
+        "holding_hours": _holding_times(ledger),
+    }
+
+
+class AnalyticsCache:
+    """Computed analytics per user, valid until the user's newest trade changes"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        # user_id -> (last trade id, analytics), most recently used last
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, last_trade_id: Optional[str]) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] != last_trade_id:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: str, last_trade_id: Optional[str], analytics: dict):
+        self._entries[user_id] = (last_trade_id, analytics)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+async def get_user_analytics(db, cache: AnalyticsCache, user_id: str, starting_equity: float = 100000.0) -> dict:
+    """Analytics for a user, recomputed only when a trade was added since the cached result"""
+    newest = await db.paper_trades.find(
+        {"user_id": user_id}, {"_id": 0, "id": 1}
+    ).sort("timestamp", -1).limit(1).to_list(1)
+    last_trade_id = newest[0]["id"] if newest else None
+    analytics = cache.get(user_id, last_trade_id)
+    if analytics is None:
+        ledger = await load_ledger(db, user_id)
+        # NumPy/pandas work runs off the event loop
+        analytics = await asyncio.to_thread(compute_analytics, ledger, starting_equity)
+        # Key on what was actually loaded, in case a trade landed in between
+        cache.put(user_id, ledger.last_trade_id, analytics)
+    return analytics
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+CHUNK_SIZE = 256 * 1024
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class BlobInfo:
+    def __init__(self, digest: str, size: int, content_type: str):
+        self.digest = digest
+        self.size = size
+        self.content_type = content_type
+
+
+class BlobStore(ABC):
+    """Content-addressed storage for uploaded bytes, keyed by SHA-256"""
+
+    @abstractmethod
+    async def put_stream(self, chunks: AsyncIterator[bytes], content_type: str, max_size: int) -> BlobInfo:
+        ...
+
+    @abstractmethod
+    async def stat(self, digest: str) -> Optional[BlobInfo]:
+        ...
+
+    @abstractmethod
+    def open_range(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yield bytes start..end (inclusive) of a stored blob"""
+        ...
+
+    @abstractmethod
+    async def set_content_type(self, digest: str, content_type: str):
+        ...
+
+    @abstractmethod
+    async def delete(self, digest: str):
+        ...
+
+
+async def _spool(chunks: AsyncIterator[bytes], max_size: int, directory: Optional[str] = None):
+    """Write chunks to a temp file while hashing; returns (path, digest, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise BlobTooLarge()
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def _is_digest(digest: str) -> bool:
+    return len(digest) == 64 and all(c in "0123456789abcdef" for c in digest)
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under root/ab/cd/<sha256>, with a small JSON sidecar for the content type"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    async def put_stream(self, chunks: AsyncIterator[bytes], content_type: str, max_size: int) -> BlobInfo:
+        temp_path, digest, size = await _spool(chunks, max_size, directory=str(self.root))
+        path = self._path(digest)
+        if path.exists():
+            # Same bytes already stored: dedupe
+            os.unlink(temp_path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.with_suffix(".json").write_text(json.dumps({"content_type": content_type, "size": size}))
+            os.replace(temp_path, path)
+        return BlobInfo(digest, size, content_type)
+
+    async def stat(self, digest: str) -> Optional[BlobInfo]:
+        if not _is_digest(digest):
+            return None
+        path = self._path(digest)
+        if not path.exists():
+            return None
+        meta = json.loads(path.with_suffix(".json").read_text())
+        return BlobInfo(digest, meta["size"], meta["content_type"])
+
+    async def open_range(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        with open(self._path(digest), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    async def set_content_type(self, digest: str, content_type: str):
+        sidecar = self._path(digest).with_suffix(".json")
+        meta = json.loads(sidecar.read_text())
+        meta["content_type"] = content_type
+        temp = sidecar.with_suffix(".json.tmp")
+        temp.write_text(json.dumps(meta))
+        os.replace(temp, sidecar)
+
+    async def delete(self, digest: str):
+        path = self._path(digest)
+        for target in (path, path.with_suffix(".json")):
+            try:
+                os.unlink(target)
+            except FileNotFoundError:
+                pass
+
+
+class GridFSBlobStore(BlobStore):
+    """Blobs in GridFS, one file per digest with the content type in its metadata"""
+
+    def __init__(self, db, bucket_name: str = "blobs"):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        self.db = db
+        self.bucket_name = bucket_name
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE)
+
+    async def _file(self, digest: str) -> Optional[dict]:
+        return await self.db[f"{self.bucket_name}.files"].find_one({"filename": digest})
+
+    async def put_stream(self, chunks: AsyncIterator[bytes], content_type: str, max_size: int) -> BlobInfo:
+        temp_path, digest, size = await _spool(chunks, max_size)
+        try:
+            if await self._file(digest) is None:
+                with open(temp_path, "rb") as f:
+                    await self.bucket.upload_from_stream(digest, f, metadata={"content_type": content_type})
+        finally:
+            os.unlink(temp_path)
+        return BlobInfo(digest, size, content_type)
+
+    async def stat(self, digest: str) -> Optional[BlobInfo]:
+        if not _is_digest(digest):
+            return None
+        doc = await self._file(digest)
+        if doc is None:
+            return None
+        return BlobInfo(digest, doc["length"], doc.get("metadata", {}).get("content_type", "application/octet-stream"))
+
+    async def open_range(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        stream = await self.bucket.open_download_stream_by_name(digest)
+        stream.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await stream.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def set_content_type(self, digest: str, content_type: str):
+        await self.db[f"{self.bucket_name}.files"].update_one(
+            {"filename": digest}, {"$set": {"metadata.content_type": content_type}}
+        )
+
+    async def delete(self, digest: str):
+        doc = await self._file(digest)
+        if doc is not None:
+            await self.bucket.delete(doc["_id"])
+
+
+def create_blob_store(db, default_root: Path) -> BlobStore:
+    """Pick the blob store from BLOB_STORE (local or gridfs)"""
+    if os.environ.get("BLOB_STORE", "local").lower() == "gridfs":
+        return GridFSBlobStore(db)
+    return LocalBlobStore(Path(os.environ.get("BLOB_STORE_PATH", default_root)))
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class BroadcastBus(ABC):
+    """Pub/sub backplane relaying events to every worker process, including the publisher"""
+
+    # Whether events reach other processes (i.e. several uvicorn workers can share it)
+    multi_process = False
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+
+    def subscribe(self, kind: str, handler: Handler):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    @abstractmethod
+    async def publish(self, kind: str, payload: dict):
+        ...
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def _dispatch(self, kind: str, payload: dict):
+        for handler in self._handlers.get(kind, ()):
+            try:
+                await handler(payload)
+            except Exception:
+                logger.exception(f"Bus handler for {kind} failed")
+
+
+class InProcessBus(BroadcastBus):
+    """Single-process bus: events are dispatched straight to local handlers"""
+
+    async def publish(self, kind: str, payload: dict):
+        await self._dispatch(kind, payload)
+
+
+class MongoBus(BroadcastBus):
+    """Bus backed by a capped collection that every worker tails.
+
+    Tailable cursors work on a standalone mongod, unlike change streams which need a replica set.
+    """
+
+    multi_process = True
+
+    def __init__(self, db, collection: str = "bus_events", size_bytes: int = 16 * 1024 * 1024):
+        super().__init__()
+        self.db = db
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self.origin = str(uuid.uuid4())
+        self.reconnect_delay = 1.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def publish(self, kind: str, payload: dict):
+        # Deliver locally right away; the tailer skips events from this origin
+        await self._dispatch(kind, payload)
+        await self.collection.insert_one({"kind": kind, "payload": payload, "origin": self.origin})
+
+    async def start(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            # An insert before the first start creates a plain collection, which can't be tailed
+            options = await self.collection.options()
+            if not options.get("capped"):
+                logger.warning(f"Converting {self.collection_name} to a capped collection")
+                await self.db.command("convertToCapped", self.collection_name, size=self.size_bytes)
+        if self._task is None:
+            self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _tail(self):
+        last = await self.collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last_id = last["_id"] if last else None
+        while True:
+            # ObjectIds from different processes aren't ordered within a second, so "$gt last_id"
+            # could skip events. Instead replay the collection in natural (insertion) order and
+            # resume after the last event seen.
+            skipping = last_id is not None
+            skipped = []
+            cursor = self.collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while cursor.alive:
+                    async for event in cursor:
+                        if skipping:
+                            if event["_id"] == last_id:
+                                skipping = False
+                                skipped = []
+                            else:
+                                skipped.append(event)
+                            continue
+                        last_id = event["_id"]
+                        await self._deliver(event)
+                    if skipping:
+                        # Caught up without finding it: the capped collection already dropped
+                        # the last event seen, so everything still stored is newer
+                        skipping = False
+                        for event in skipped:
+                            last_id = event["_id"]
+                            await self._deliver(event)
+                        skipped = []
+                    await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Bus tailer failed, reconnecting")
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _deliver(self, event: dict):
+        if event.get("origin") != self.origin:
+            await self._dispatch(event["kind"], event["payload"])
+
+
+def create_bus(db) -> BroadcastBus:
+    """Pick the bus implementation from BROADCAST_BUS (memory or mongo)"""
+    backend = os.environ.get("BROADCAST_BUS", "memory").lower()
+    if backend == "mongo":
+        return MongoBus(db)
+    return InProcessBus()
+
+
+class LeaderLease:
+    """Mongo-backed lease so only one worker runs a singleton background job"""
+
+    def __init__(self, db, name: str, ttl: float):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.owner = str(uuid.uuid4())
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; returns False while another worker holds it"""
+        now = datetime.utcnow()
+        try:
+            await self.db.leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
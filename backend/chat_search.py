@@ -0,0 +1,208 @@
+import asyncio
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+# rowid is the message time in microseconds, so rowid order is time order and date filters are
+# rowid ranges. Tickers and author are indexed as FTS columns so filters are doclist intersections.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, tickers, author, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+"""
+
+SORTS = ("relevance", "recent")
+
+# Relevance ranks only the newest matches; bm25 over every hit of a common word is too slow
+RELEVANCE_CANDIDATES = 10000
+
+# Words as the unicode61 tokenizer sees them; anything else in a query is dropped
+QUERY_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def match_expression(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 expression: every word required, a trailing * makes the last a prefix"""
+    words = QUERY_TOKEN.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    # Prefix terms can't stream their doclist, so they're opt-in rather than implied
+    if query.rstrip().endswith("*"):
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _token(value: str) -> str:
+    # UUIDs would otherwise be split into five tokens on the hyphens
+    return re.sub(r"\W", "", value)
+
+
+def _rowid(timestamp) -> int:
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        timestamp = timestamp.timestamp()
+    return int(timestamp * 1_000_000)
+
+
+class ChatSearchIndex:
+    """On-disk SQLite FTS5 inverted index over chat messages.
+
+    Only ids are stored besides the index itself; callers load full messages from Mongo by id.
+    All SQLite work runs on one dedicated thread that owns the connection.
+    """
+
+    def __init__(self, path: Path, relevance_candidates: int = RELEVANCE_CANDIDATES):
+        self.path = Path(path)
+        self.relevance_candidates = relevance_candidates
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-search")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0)
+            # WAL lets several uvicorn workers on one host share the file
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _add_many(self, messages: List[dict]) -> int:
+        conn = self._connection()
+        added = 0
+        with conn:
+            for message in messages:
+                if conn.execute("SELECT 1 FROM messages WHERE id = ?", (message["id"],)).fetchone():
+                    continue
+                rowid = _rowid(message["timestamp"])
+                # Two messages in the same microsecond: take the next free slot
+                while conn.execute("SELECT 1 FROM messages WHERE rowid = ?", (rowid,)).fetchone():
+                    rowid += 1
+                conn.execute("INSERT INTO messages (rowid, id) VALUES (?, ?)", (rowid, message["id"]))
+                conn.execute(
+                    "INSERT INTO messages_fts (rowid, content, tickers, author) VALUES (?, ?, ?, ?)",
+                    (rowid, message["content"], " ".join(message.get("highlighted_tickers") or ()), _token(message["user_id"]))
+                )
+                added += 1
+        return added
+
+    async def add(self, message: dict) -> int:
+        return await self._run(self._add_many, [message])
+
+    async def add_many(self, messages: Iterable[dict]) -> int:
+        return await self._run(self._add_many, list(messages))
+
+    def _last_timestamp(self) -> Optional[float]:
+        rowid = self._connection().execute("SELECT MAX(rowid) FROM messages").fetchone()[0]
+        return rowid / 1_000_000 if rowid is not None else None
+
+    async def last_timestamp(self) -> Optional[float]:
+        return await self._run(self._last_timestamp)
+
+    def _search(self, query, symbol, user_id, since, until, sort, limit, cursor) -> Tuple[List[str], Optional[str]]:
+        expression = match_expression(query)
+        if expression is None:
+            return [], None
+        expression = f"content : ({expression})"
+        if symbol:
+            expression += f' AND tickers : "{_token(symbol)}"'
+        if user_id:
+            expression += f' AND author : "{_token(user_id)}"'
+
+        conn = self._connection()
+        where = ["messages_fts MATCH ?"]
+        params: list = [expression]
+        if since is not None:
+            where.append("rowid >= ?")
+            params.append(_rowid(since))
+        if until is not None:
+            where.append("rowid < ?")
+            params.append(_rowid(until))
+
+        if sort == "recent":
+            # FTS5 walks doclists backwards for rowid DESC, so this stops after limit + 1 hits
+            if cursor:
+                where.append("rowid < ?")
+                params.append(int(cursor))
+            sql = f"SELECT rowid FROM messages_fts WHERE {' AND '.join(where)} ORDER BY rowid DESC LIMIT ?"
+            rows = conn.execute(sql, params + [limit + 1]).fetchall()
+            next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        else:
+            # The candidate floor is fixed by the first page and carried in the cursor: score|rowid|floor
+            if cursor:
+                score, rowid, floor = cursor.split("|")
+                score, rowid, floor = float(score), int(rowid), int(floor)
+            else:
+                sql = f"SELECT rowid FROM messages_fts WHERE {' AND '.join(where)} ORDER BY rowid DESC LIMIT 1 OFFSET ?"
+                row = conn.execute(sql, params + [self.relevance_candidates - 1]).fetchone()
+                floor = row[0] if row else 0
+            where.append("rowid >= ?")
+            params.append(floor)
+            if cursor:
+                # bm25 is lower-is-better
+                where.append("(score > ? OR (score = ? AND rowid < ?))")
+                params += [score, score, rowid]
+            # Tickers and author only filter; they carry no weight in the score
+            sql = (
+                "SELECT rowid, bm25(messages_fts, 1.0, 0.0, 0.0) AS score FROM messages_fts "
+                f"WHERE {' AND '.join(where)} ORDER BY score, rowid DESC LIMIT ?"
+            )
+            rows = conn.execute(sql, params + [limit + 1]).fetchall()
+            next_cursor = None
+            if len(rows) > limit:
+                last_rowid, last_score = rows[limit - 1]
+                next_cursor = f"{last_score!r}|{last_rowid}|{floor}"
+
+        rowids = [row[0] for row in rows[:limit]]
+        if not rowids:
+            return [], None
+        placeholders = ",".join("?" * len(rowids))
+        ids = dict(conn.execute(f"SELECT rowid, id FROM messages WHERE rowid IN ({placeholders})", rowids).fetchall())
+        return [ids[rowid] for rowid in rowids if rowid in ids], next_cursor
+
+    async def search(self, query: str, symbol: Optional[str] = None, user_id: Optional[str] = None,
+                     since=None, until=None, sort: str = "relevance", limit: int = 20,
+                     cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """Matching message ids in rank order, plus the cursor for the next page (None at the end)"""
+        return await self._run(self._search, query, symbol, user_id, since, until, sort, limit, cursor)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+
+async def sync_from_db(index: ChatSearchIndex, db, batch_size: int = 1000) -> int:
+    """Index messages stored since the newest one already indexed (all of them on a fresh index)"""
+    query = {}
+    last = await index.last_timestamp()
+    if last is not None:
+        # A second of overlap absorbs float rounding; already-indexed ids are skipped
+        query = {"timestamp": {"$gte": datetime.fromtimestamp(last - 1, timezone.utc).replace(tzinfo=None)}}
+    fields = {"_id": 0, "id": 1, "user_id": 1, "timestamp": 1, "content": 1, "highlighted_tickers": 1}
+    added = 0
+    batch = []
+    async for message in db.messages.find(query, fields).sort([("timestamp", 1), ("id", 1)]).batch_size(batch_size):
+        batch.append(message)
+        if len(batch) >= batch_size:
+            added += await index.add_many(batch)
+            batch = []
+    if batch:
+        added += await index.add_many(batch)
+    return added
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+from typing import Dict, Iterable, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from broadcast_bus import BroadcastBus, InProcessBus
+
+
+logger = logging.getLogger(__name__)
+
+CHAT_TOPIC = "chat"
+ADMIN_TOPIC = "admin"
+MODERATOR_TOPIC = "moderator"
+
+ROLE_TOPICS = {"admin": ADMIN_TOPIC, "moderator": MODERATOR_TOPIC}
+
+
+def positions_topic(user_id: str) -> str:
+    return f"positions:{user_id}"
+
+
+def encode_frame(message: Union[str, dict]) -> str:
+    """Serialize a payload once so the same frame can be queued for every recipient"""
+    if isinstance(message, str):
+        return message
+    return json.dumps(message, default=str)
+
+
+class Connection:
+    """A socket with its own bounded outbound queue drained by a writer task"""
+
+    def __init__(self, websocket: WebSocket, user_id: str, max_queue: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.topics: Set[str] = set()
+        self.writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+
+
+class ConnectionManager:
+    def __init__(self, max_queue: int = 256, bus: Optional[BroadcastBus] = None):
+        self.max_queue = max_queue
+        self.active_connections: Dict[WebSocket, Connection] = {}
+        # A user may have several sockets open (one per tab/device)
+        self.user_connections: Dict[str, Set[Connection]] = {}
+        # Roles of connected users; admin/moderator sockets are subscribed to the role topics
+        self.user_roles: Dict[str, Set[str]] = {}
+        self.topics: Dict[str, Set[Connection]] = {}
+        self.dropped_frames = 0
+        self.evicted_connections = 0
+
+        # Frames go through the bus so sockets held by other workers receive them too
+        self.bus = bus or InProcessBus()
+        self.bus.subscribe("ws.topic", self._on_topic_event)
+        self.bus.subscribe("ws.users", self._on_users_event)
+        self.bus.subscribe("ws.roles", self._on_roles_event)
+
+    async def connect(self, websocket: WebSocket, user_id: str, topics: Iterable[str] = (), roles: Iterable[str] = ()) -> Connection:
+        await websocket.accept()
+        connection = Connection(websocket, user_id, self.max_queue)
+        connection.writer = asyncio.create_task(self._drain(connection))
+
+        self.active_connections[websocket] = connection
+        self.user_connections.setdefault(user_id, set()).add(connection)
+        for topic in (CHAT_TOPIC, positions_topic(user_id), *topics):
+            self.subscribe(connection, topic)
+        self.set_user_roles(user_id, roles)
+        return connection
+
+    def disconnect(self, websocket: WebSocket, user_id: str):
+        connection = self.active_connections.pop(websocket, None)
+        if connection is None:
+            return
+        connections = self.user_connections.get(user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self.user_connections[user_id]
+                self.user_roles.pop(user_id, None)
+        for topic in list(connection.topics):
+            self.unsubscribe(connection, topic)
+        if connection.writer is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    def set_user_roles(self, user_id: str, roles: Iterable[str]):
+        """Refresh a connected user's roles, e.g. after an approval or role change"""
+        connections = self.user_connections.get(user_id)
+        if not connections:
+            self.user_roles.pop(user_id, None)
+            return
+
+        roles = {role for role in roles if role in ROLE_TOPICS}
+        self.user_roles[user_id] = roles
+        for role, topic in ROLE_TOPICS.items():
+            for connection in connections:
+                if role in roles:
+                    self.subscribe(connection, topic)
+                else:
+                    self.unsubscribe(connection, topic)
+
+    def subscribe(self, connection: Connection, topic: str):
+        self.topics.setdefault(topic, set()).add(connection)
+        connection.topics.add(topic)
+
+    def unsubscribe(self, connection: Connection, topic: str):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.topics[topic]
+        connection.topics.discard(topic)
+
+    async def _drain(self, connection: Connection):
+        try:
+            while True:
+                frame = await connection.queue.get()
+                await connection.websocket.send_text(frame)
+                connection.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"WebSocket send failed for user {connection.user_id}: {e}")
+            self.disconnect(connection.websocket, connection.user_id)
+
+    def _enqueue(self, connection: Connection, frame: str):
+        try:
+            connection.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Slow consumer: drop the frame and evict the socket rather than stall everyone else
+            connection.dropped += 1
+            self.dropped_frames += 1
+            self._evict(connection)
+
+    def _evict(self, connection: Connection):
+        logger.warning(f"Evicting slow WebSocket consumer for user {connection.user_id}")
+        self.evicted_connections += 1
+        self.disconnect(connection.websocket, connection.user_id)
+        asyncio.ensure_future(self._close(connection.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def publish_local(self, topic: str, frame: str) -> int:
+        """Queue a frame for every local subscriber of a topic; returns the number of recipients"""
+        subscribers = self.topics.get(topic)
+        if not subscribers:
+            return 0
+        for connection in list(subscribers):
+            self._enqueue(connection, frame)
+        return len(subscribers)
+
+    def send_to_users_local(self, user_ids: Iterable[str], frame: str):
+        for user_id in user_ids:
+            for connection in list(self.user_connections.get(user_id, ())):
+                self._enqueue(connection, frame)
+
+    async def _on_topic_event(self, event: dict):
+        self.publish_local(event["topic"], event["frame"])
+
+    async def _on_users_event(self, event: dict):
+        self.send_to_users_local(event["user_ids"], event["frame"])
+
+    async def _on_roles_event(self, event: dict):
+        self.set_user_roles(event["user_id"], event["roles"])
+
+    async def publish(self, topic: str, message: Union[str, dict]):
+        """Send a frame to every subscriber of a topic on every worker"""
+        await self.bus.publish("ws.topic", {"topic": topic, "frame": encode_frame(message)})
+
+    async def send_personal_message(self, message: Union[str, dict], websocket: WebSocket):
+        connection = self.active_connections.get(websocket)
+        if connection is not None:
+            self._enqueue(connection, encode_frame(message))
+
+    async def send_to_users(self, user_ids: Iterable[str], message: Union[str, dict]):
+        await self.bus.publish("ws.users", {"user_ids": list(user_ids), "frame": encode_frame(message)})
+
+    async def update_user_roles(self, user_id: str, roles: Iterable[str]):
+        """Propagate a role change to the routing index on every worker"""
+        await self.bus.publish("ws.roles", {"user_id": user_id, "roles": list(roles)})
+
+    async def broadcast(self, message: Union[str, dict]):
+        await self.publish(CHAT_TOPIC, message)
+
+    async def send_admin_notification(self, message: Union[str, dict]):
+        """Send notifications to all connected admins"""
+        await self.publish(ADMIN_TOPIC, message)
+
+    def metrics(self) -> dict:
+        depths = [connection.queue.qsize() for connection in self.active_connections.values()]
+        return {
+            "connections": len(self.active_connections),
+            "users": len(self.user_connections),
+            "admins": sum(1 for roles in self.user_roles.values() if "admin" in roles),
+            "moderators": sum(1 for roles in self.user_roles.values() if "moderator" in roles),
+            "topics": {topic: len(subscribers) for topic, subscribers in self.topics.items()},
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "max_queue": self.max_queue,
+            "dropped_frames": self.dropped_frames,
+            "evicted_connections": self.evicted_connections
+        }
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from position_updates import merge_duplicate_open_positions
+
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing the hot queries in server.py, declared per collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_id"),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="status_created_id"),
+        IndexModel([("is_admin", ASCENDING)], name="is_admin"),
+    ],
+    "positions": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("user_id", ASCENDING), ("is_open", ASCENDING), ("symbol", ASCENDING)], name="user_open_symbol"),
+        # At most one open position per user and symbol; trade upserts depend on it
+        IndexModel([("user_id", ASCENDING), ("symbol", ASCENDING)], unique=True,
+                   partialFilterExpression={"is_open": True}, name="open_position_unique"),
+        IndexModel([("is_open", ASCENDING), ("symbol", ASCENDING)], name="open_symbol"),
+        IndexModel([("close_sweep_id", ASCENDING)], sparse=True, name="close_sweep_id"),
+    ],
+    "paper_trades": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("user_id", ASCENDING), ("timestamp", ASCENDING)], name="user_timestamp"),
+        IndexModel([("timestamp", ASCENDING)], name="timestamp"),
+    ],
+    "messages": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+        IndexModel([("highlighted_tickers", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="ticker_timestamp_id"),
+    ],
+    "image_variants": [
+        IndexModel([("source", ASCENDING)], unique=True, name="source_unique"),
+    ],
+    "performance_stats": [
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique"),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+}
+
+# (name, collection, filter, sort) for every query on a request or background hot path
+HOT_QUERIES = [
+    ("user by id", "users", {"id": "x"}, None),
+    ("user by username", "users", {"username": "x"}, None),
+    ("user by email", "users", {"email": "x"}, None),
+    ("pending users", "users", {"status": "pending"}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    ("user directory page", "users", {}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    ("admin users", "users", {"is_admin": True}, None),
+    ("open positions for user", "positions", {"user_id": "x", "is_open": True}, None),
+    ("open position for user and symbol", "positions", {"user_id": "x", "symbol": "TSLA", "is_open": True}, None),
+    ("position by id and user", "positions", {"id": "x", "user_id": "x", "is_open": True}, None),
+    ("armed open positions", "positions", {"is_open": True, "$or": [{"stop_loss": {"$ne": None}}, {"take_profit": {"$ne": None}}]}, None),
+    ("positions claimed by sweep", "positions", {"close_sweep_id": "x"}, None),
+    ("trades for user", "paper_trades", {"user_id": "x"}, [("timestamp", DESCENDING)]),
+    ("trade by id", "paper_trades", {"id": "x"}, None),
+    ("trades since (leaderboard windows)", "paper_trades", {"timestamp": {"$gte": "x"}}, None),
+    ("latest messages", "messages", {}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("message by id", "messages", {"id": "x"}, None),
+    ("messages mentioning ticker", "messages", {"highlighted_tickers": "TSLA"}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("recent ticker mentions", "messages", {"timestamp": {"$gte": "x"}, "highlighted_tickers": {"$ne": []}}, [("timestamp", ASCENDING), ("id", ASCENDING)]),
+    ("performance stats for user", "performance_stats", {"user_id": "x"}, None),
+]
+
+
+# Indexes correctness depends on, with the repair that removes what blocks building them.
+# Startup fails if one still can't be built after its repair.
+REQUIRED_INDEXES = {
+    ("positions", "open_position_unique"): lambda db: merge_duplicate_open_positions(db.positions),
+}
+
+
+async def ensure_indexes(db):
+    """Create every declared index; safe to run on each startup"""
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                repair = REQUIRED_INDEXES.get((collection, name))
+                if repair is None:
+                    # e.g. duplicate usernames in old data block a unique index; keep starting up
+                    logger.warning(f"Could not create index {name} on {collection}: {e}")
+                    continue
+                logger.error(f"Could not create required index {name} on {collection}: {e}; repairing existing data")
+                repaired = await repair(db)
+                logger.error(f"Repaired {repaired} documents on {collection}, retrying index {name}")
+                await db[collection].create_indexes([index])
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+
+async def explain_hot_queries(db) -> List[dict]:
+    """Run explain() on each hot query and flag the ones that fall back to a COLLSCAN"""
+    report = []
+    for name, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query).limit(50)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        winning_plan = plan.get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning_plan.get("queryPlan", winning_plan))
+        report.append({
+            "query": name,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return report
+
+
+async def _main(explain: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    await ensure_indexes(db)
+    print("Indexes ensured")
+    if explain:
+        collscans = 0
+        for entry in await explain_hot_queries(db):
+            flag = "COLLSCAN" if entry["collscan"] else "ok"
+            collscans += entry["collscan"]
+            print(f"{flag:9} {entry['collection']:18} {entry['query']:36} {' <- '.join(entry['stages'])}")
+        client.close()
+        sys.exit(1 if collscans else 0)
+    client.close()
+
+
+if __name__ == "__main__":
+    # python db_indexes.py [--explain]
+    asyncio.run(_main("--explain" in sys.argv[1:]))
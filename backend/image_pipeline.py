@@ -0,0 +1,133 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+# Longest-edge sizes rendered for every uploaded image
+VARIANT_SIZES = (64, 256, 1024)
+VARIANT_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# Raster formats accepted for upload; anything else (SVG in particular) could carry script
+ALLOWED_IMAGE_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp")
+
+# Decoded pixel budget, guards the worker against decompression bombs
+MAX_PIXELS = 40_000_000
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def variant_key(size: int, fmt: str) -> str:
+    return f"{size}.{fmt}"
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Content type from an upload's leading magic bytes; None unless it is an allowed raster format"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def render_variants(data: bytes) -> Tuple[str, Dict[str, bytes]]:
+    """Decode, normalize and re-encode an image at each variant size (runs in a worker process)"""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_type = Image.MIME.get(image.format, "application/octet-stream")
+        if source_type not in ALLOWED_IMAGE_TYPES:
+            raise InvalidImage(f"Unsupported image format: {image.format}")
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except Exception as e:
+        raise InvalidImage(str(e))
+
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants = {}
+    for size in VARIANT_SIZES:
+        resized = image.copy()
+        # Never upscale; keep aspect ratio
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for fmt in VARIANT_FORMATS:
+            buffer = io.BytesIO()
+            if fmt == "jpeg":
+                flat = resized
+                if has_alpha:
+                    flat = Image.new("RGB", resized.size, (255, 255, 255))
+                    flat.paste(resized, mask=resized.getchannel("A"))
+                flat.save(buffer, "JPEG", quality=85, optimize=True, progressive=True)
+            else:
+                resized.save(buffer, "WEBP", quality=80, method=4)
+            variants[variant_key(size, fmt)] = buffer.getvalue()
+    return source_type, variants
+
+
+class ImagePipeline:
+    """Renders size/format variants off the event loop and caches them by source content hash"""
+
+    def __init__(self, blob_store, db, max_workers: Optional[int] = None):
+        self.blob_store = blob_store
+        self.db = db
+        self.max_workers = max_workers or int(os.environ.get("IMAGE_WORKERS", "2"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def variants_for(self, source_digest: str, url_for) -> dict:
+        """Return {"content_type", "variants": {"64.webp": url, ...}} for a stored image.
+
+        A source that fails to decode is deleted from the blob store before InvalidImage is raised.
+        """
+        cached = await self.db.image_variants.find_one({"source": source_digest}, {"_id": 0})
+        if cached:
+            return {"content_type": cached["content_type"], "variants": {k: url_for(d) for k, d in cached["variants"].items()}}
+
+        info = await self.blob_store.stat(source_digest)
+        data = b"".join([chunk async for chunk in self.blob_store.open_range(source_digest, 0, info.size - 1)])
+        loop = asyncio.get_running_loop()
+        try:
+            source_type, rendered = await loop.run_in_executor(self.executor, render_variants, data)
+        except InvalidImage:
+            # Bytes that don't decode as an image must not stay servable
+            await self.blob_store.delete(source_digest)
+            raise
+        if source_type != info.content_type:
+            # Serve the source under the format Pillow actually decoded
+            await self.blob_store.set_content_type(source_digest, source_type)
+
+        digests = {}
+        for key, payload in rendered.items():
+            fmt = key.split(".", 1)[1]
+            blob = await self.blob_store.put_stream(_single(payload), VARIANT_FORMATS[fmt], max_size=len(payload))
+            digests[key] = blob.digest
+
+        await self.db.image_variants.update_one(
+            {"source": source_digest},
+            {"$set": {"source": source_digest, "content_type": source_type, "variants": digests}},
+            upsert=True
+        )
+        return {"content_type": source_type, "variants": {k: url_for(d) for k, d in digests.items()}}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async def _single(data: bytes):
+    yield data
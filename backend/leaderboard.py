@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+METRICS = ("total_profit", "win_percentage", "trades_count", "average_gain")
+
+# Calendar windows in UTC; "weekly" starts on Monday
+WINDOWS = ("daily", "weekly", "all")
+
+
+def window_start(window: str, now: datetime) -> Optional[datetime]:
+    """Start of the window containing `now`; None for all-time"""
+    if window == "all":
+        return None
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == "daily":
+        return day
+    if window == "weekly":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Unknown leaderboard window: {window}")
+
+
+def _metrics(realized_pnl: float, completed: int, wins: int, trades: int) -> Dict[str, float]:
+    # Same shape and rounding as PerformanceStats.to_metrics
+    return {
+        "total_profit": round(realized_pnl, 2),
+        "win_percentage": round(wins / completed * 100, 2) if completed else 0.0,
+        "trades_count": trades,
+        "average_gain": round(realized_pnl / completed, 2) if completed else 0.0,
+    }
+
+
+class WindowBoard:
+    """Per-user stats for one window, ranked by each metric.
+
+    Each metric keeps a SortedList of (-value, user_id), so an update, a user's rank and the
+    start of a page are all O(log n).
+    """
+
+    def __init__(self, start: Optional[datetime] = None):
+        self.start = start
+        # user_id -> [realized_pnl, completed, wins, trades]
+        self._stats: Dict[str, list] = {}
+        # user_id -> current metric values, i.e. the keys held in the rankings
+        self._values: Dict[str, Dict[str, float]] = {}
+        self._rankings = {metric: SortedList() for metric in METRICS}
+
+    def __len__(self):
+        return len(self._stats)
+
+    def set(self, user_id: str, realized_pnl: float, completed: int, wins: int, trades: int):
+        self._stats[user_id] = [realized_pnl, completed, wins, trades]
+        self._rerank(user_id)
+
+    def add(self, user_id: str, realized_pnl: Optional[float]):
+        """Count one trade; `realized_pnl` is None for a BUY"""
+        stats = self._stats.setdefault(user_id, [0.0, 0, 0, 0])
+        stats[3] += 1
+        if realized_pnl is not None:
+            stats[0] += realized_pnl
+            stats[1] += 1
+            stats[2] += realized_pnl > 0
+        self._rerank(user_id)
+
+    def _rerank(self, user_id: str):
+        values = _metrics(*self._stats[user_id])
+        previous = self._values.get(user_id)
+        for metric, ranking in self._rankings.items():
+            if previous is not None:
+                ranking.remove((-previous[metric], user_id))
+            ranking.add((-values[metric], user_id))
+        self._values[user_id] = values
+
+    def top(self, metric: str, offset: int = 0, limit: int = 25) -> List[Tuple[int, str, float]]:
+        """(rank, user_id, value) for ranks offset+1 .. offset+limit; ties are ordered by user id"""
+        ranking = self._rankings[metric]
+        return [
+            (offset + i + 1, user_id, -negated)
+            for i, (negated, user_id) in enumerate(ranking.islice(offset, offset + limit))
+        ]
+
+    def rank(self, metric: str, user_id: str) -> Optional[Tuple[int, float]]:
+        values = self._values.get(user_id)
+        if values is None:
+            return None
+        return self._rankings[metric].index((-values[metric], user_id)) + 1, values[metric]
+
+
+class Leaderboard:
+    """Daily, weekly and all-time boards kept current from trade events.
+
+    Calendar windows roll over lazily: the first update or read after midnight (or Monday)
+    starts an empty board.
+    """
+
+    def __init__(self, clock=datetime.utcnow):
+        self._clock = clock
+        self._boards: Dict[str, WindowBoard] = {window: WindowBoard() for window in WINDOWS}
+
+    def board(self, window: str) -> WindowBoard:
+        start = window_start(window, self._clock())
+        board = self._boards[window]
+        if board.start != start:
+            board = self._boards[window] = WindowBoard(start)
+        return board
+
+    def load(self, window: str, rows: Iterable[dict]):
+        """Replace a window's board with rows of user_id, realized_pnl, completed, wins, trades"""
+        board = self._boards[window] = WindowBoard(window_start(window, self._clock()))
+        for row in rows:
+            board.set(row["user_id"], row["realized_pnl"], row["completed"], row["wins"], row["trades"])
+
+    def record(self, user_id: str, timestamp: datetime, realized_pnl: Optional[float] = None,
+               all_time: Optional[dict] = None):
+        """Count a trade in every window it falls into.
+
+        `all_time` is the user's full post-trade row (see stats_row); when given it replaces the
+        user's all-time entry instead of adding one trade to it.
+        """
+        for window in WINDOWS:
+            board = self.board(window)
+            if board.start is None and all_time is not None:
+                board.set(user_id, all_time["realized_pnl"], all_time["completed"], all_time["wins"], all_time["trades"])
+            elif board.start is None or timestamp >= board.start:
+                board.add(user_id, realized_pnl)
+
+    def top(self, window: str, metric: str, offset: int = 0, limit: int = 25) -> List[Tuple[int, str, float]]:
+        return self.board(window).top(metric, offset, limit)
+
+    def rank(self, window: str, user_id: str) -> Dict[str, Optional[Tuple[int, float]]]:
+        board = self.board(window)
+        return {metric: board.rank(metric, user_id) for metric in METRICS}
+
+
+def stats_row(doc: dict) -> dict:
+    """Leaderboard row from a performance_stats document"""
+    return {
+        "user_id": doc["user_id"], "realized_pnl": doc.get("realized_pnl", 0.0), "completed": doc.get("completed_trades", 0),
+        "wins": doc.get("winning_trades", 0), "trades": doc.get("trades_count", 0),
+    }
+
+
+def window_pipeline(start: Optional[datetime]) -> list:
+    """Aggregation of paper_trades into leaderboard rows for trades since `start` (all trades if None)"""
+    # Same rule as the live path (WindowBoard.add): a trade completes only if it has a realized_pnl,
+    # so unmatched SELLs and SELLs from before lot tracking count as trades but not completions
+    pnl = {"$ifNull": ["$realized_pnl", 0]}
+    completed = {"$ne": [{"$ifNull": ["$realized_pnl", None]}, None]}
+    pipeline = [] if start is None else [{"$match": {"timestamp": {"$gte": start}}}]
+    return pipeline + [
+        {"$group": {
+            "_id": "$user_id",
+            "realized_pnl": {"$sum": pnl},
+            "completed": {"$sum": {"$cond": [completed, 1, 0]}},
+            "wins": {"$sum": {"$cond": [{"$gt": [pnl, 0]}, 1, 0]}},
+            "trades": {"$sum": 1},
+        }},
+        {"$project": {"_id": 0, "user_id": "$_id", "realized_pnl": 1, "completed": 1, "wins": 1, "trades": 1}},
+    ]
+
+
+async def rebuild_leaderboard(db, leaderboard: Leaderboard):
+    """Rebuild every window from trades; all-time prefers the stored performance aggregates"""
+    # Aggregates exist only for users whose stats were computed, but they replay legacy SELLs at
+    # average cost, so they win over the raw trade totals wherever present
+    rows = {row["user_id"]: row async for row in db.paper_trades.aggregate(window_pipeline(None))}
+    cursor = db.performance_stats.find(
+        {}, {"_id": 0, "user_id": 1, "realized_pnl": 1, "completed_trades": 1, "winning_trades": 1, "trades_count": 1}
+    )
+    async for doc in cursor:
+        rows[doc["user_id"]] = stats_row(doc)
+    leaderboard.load("all", rows.values())
+    for window in WINDOWS:
+        if window != "all":
+            start = leaderboard.board(window).start
+            leaderboard.load(window, [row async for row in db.paper_trades.aggregate(window_pipeline(start))])
@@ -0,0 +1,84 @@
+from collections import deque
+from typing import Iterable, List, Optional
+
+COST_METHODS = ("fifo", "lifo", "average")
+
+
+class Fill:
+    """Outcome of matching a SELL against open lots"""
+
+    def __init__(self, quantity: int, realized_pnl: float, matched: List[dict]):
+        self.quantity = quantity
+        self.realized_pnl = realized_pnl
+        # [{"trade_id", "quantity", "price"}] for each lot (or part of one) the sell consumed
+        self.matched = matched
+
+
+class LotBook:
+    """Open lots for one position, matched first-in-first-out, last-in-first-out or at average cost.
+
+    Lots sit in a deque, so each sell pops from one end and costs O(1) per lot it consumes.
+    Under "average" all shares are kept as a single merged lot.
+    """
+
+    def __init__(self, method: str = "fifo", lots: Iterable[dict] = ()):
+        if method not in COST_METHODS:
+            raise ValueError(f"Unknown cost basis method: {method}")
+        self.method = method
+        # [trade_id, quantity, price]
+        self._lots: deque = deque()
+        self.quantity = 0
+        self.cost = 0.0
+        for lot in lots:
+            self.buy(lot["quantity"], lot["price"], lot.get("trade_id"))
+
+    @classmethod
+    def from_position(cls, position: dict) -> "LotBook":
+        """Lots stored on a position document; positions opened before lot tracking become one lot"""
+        lots = position.get("lots")
+        if lots is None:
+            lots = [{"trade_id": None, "quantity": position.get("quantity", 0), "price": position.get("avg_price", 0.0)}]
+        return cls(position.get("cost_method") or "fifo", lots)
+
+    @property
+    def avg_price(self) -> float:
+        return self.cost / self.quantity if self.quantity else 0.0
+
+    def buy(self, quantity: int, price: float, trade_id: Optional[str] = None):
+        if quantity <= 0:
+            return
+        self.quantity += quantity
+        self.cost += quantity * price
+        if self.method == "average" and self._lots:
+            lot = self._lots[0]
+            lot[0], lot[1], lot[2] = None, self.quantity, self.avg_price
+        else:
+            self._lots.append([trade_id, quantity, price])
+
+    def sell(self, quantity: int, price: float) -> Fill:
+        """Consume up to `quantity` shares; selling more than is held only matches what is held"""
+        take_from_front = self.method != "lifo"
+        remaining = min(quantity, self.quantity)
+        matched = []
+        realized_pnl = 0.0
+        while remaining:
+            lot = self._lots[0] if take_from_front else self._lots[-1]
+            take = min(lot[1], remaining)
+            matched.append({"trade_id": lot[0], "quantity": take, "price": lot[2]})
+            realized_pnl += (price - lot[2]) * take
+            lot[1] -= take
+            remaining -= take
+            self.quantity -= take
+            self.cost -= take * lot[2]
+            if lot[1] == 0:
+                if take_from_front:
+                    self._lots.popleft()
+                else:
+                    self._lots.pop()
+        if not self.quantity:
+            # Don't let float residue survive an emptied book
+            self.cost = 0.0
+        return Fill(sum(lot["quantity"] for lot in matched), realized_pnl, matched)
+
+    def to_document(self) -> List[dict]:
+        return [{"trade_id": trade_id, "quantity": quantity, "price": price} for trade_id, quantity, price in self._lots]
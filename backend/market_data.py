@@ -0,0 +1,130 @@
+import asyncio
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+
+# Mock prices for demonstration - in production, integrate with Alpha Vantage or similar
+MOCK_PRICES = {
+    "TSLA": 250.75,
+    "AAPL": 185.20,
+    "MSFT": 420.50,
+    "NVDA": 875.30,
+    "GOOGL": 142.80,
+    "AMZN": 155.90,
+    "META": 485.60,
+    "NFLX": 425.20,
+    "AMD": 198.40,
+    "INTC": 45.60
+}
+
+
+class QuoteProvider(ABC):
+    """Source of last-trade prices; subclass to plug in a real quote feed"""
+
+    @abstractmethod
+    async def get_price(self, symbol: str) -> float:
+        ...
+
+
+class MockQuoteProvider(QuoteProvider):
+    """Mock prices with ±5% random variation to simulate price movement"""
+
+    def __init__(self, base_prices: Optional[Dict[str, float]] = None, variation: float = 0.05, seed: Optional[int] = None):
+        self.base_prices = base_prices if base_prices is not None else MOCK_PRICES
+        self.variation = variation
+        # A fixed seed makes the stub fully deterministic for offline tests
+        self._random = random.Random(seed)
+
+    async def get_price(self, symbol: str) -> float:
+        base_price = self.base_prices.get(symbol.upper(), 100.0)
+        variation = self._random.uniform(-self.variation, self.variation)
+        return round(base_price * (1 + variation), 2)
+
+
+class QuoteCache:
+    """Process-wide price cache with TTL, LRU eviction and single-flight misses"""
+
+    def __init__(self, provider: QuoteProvider, ttl: float = 5.0, max_symbols: int = 5000, clock=time.monotonic):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_symbols = max_symbols
+        self._clock = clock
+        # symbol -> (price, fetched_at), most recently used last
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, symbol: str) -> Optional[float]:
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        price, fetched_at = entry
+        if self._clock() - fetched_at > self.ttl:
+            del self._entries[symbol]
+            return None
+        self._entries.move_to_end(symbol)
+        return price
+
+    def _store(self, symbol: str, price: float):
+        self._entries[symbol] = (price, self._clock())
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_symbols:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _fetch(self, symbol: str) -> float:
+        try:
+            price = await self.provider.get_price(symbol)
+            self._store(symbol, price)
+            return price
+        finally:
+            self._inflight.pop(symbol, None)
+
+    async def get_price(self, symbol: str) -> float:
+        symbol = symbol.upper()
+        price = self._lookup(symbol)
+        if price is not None:
+            self.hits += 1
+            return price
+
+        future = self._inflight.get(symbol)
+        if future is not None:
+            # Another caller is already fetching this symbol; share its result
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.ensure_future(self._fetch(symbol))
+        self._inflight[symbol] = future
+        return await asyncio.shield(future)
+
+    async def get_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Fetch several symbols concurrently, each at most once"""
+        unique = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        prices = await asyncio.gather(*(self.get_price(symbol) for symbol in unique))
+        return dict(zip(unique, prices))
+
+    def invalidate(self, symbol: Optional[str] = None):
+        if symbol is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(symbol.upper(), None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_symbols": self.max_symbols,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+        }
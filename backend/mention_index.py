@@ -0,0 +1,126 @@
+import heapq
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Trending windows by name, in seconds
+WINDOWS = {"5m": 5 * 60, "1h": 60 * 60, "24h": 24 * 60 * 60}
+
+
+class MentionIndex:
+    """Per-symbol mention counts in fixed time buckets, plus the newest message ids per symbol.
+
+    Each window keeps a running Counter that gains mentions as they arrive and loses whole
+    buckets as they slide out, so trending queries never rescan history.
+    """
+
+    def __init__(self, bucket_seconds: int = 30, recent_per_symbol: int = 200, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.recent_per_symbol = recent_per_symbol
+        self._clock = clock
+        # Window lengths in buckets
+        self._spans = {name: max(1, seconds // bucket_seconds) for name, seconds in WINDOWS.items()}
+        self._retained = max(self._spans.values())
+        self._reset()
+
+    def _reset(self):
+        # bucket number -> mentions per symbol in that bucket
+        self._buckets: Dict[int, Counter] = {}
+        self._oldest_bucket = 0
+        self._totals: Dict[str, Counter] = {name: Counter() for name in WINDOWS}
+        # First bucket each window has not yet expired
+        self._expire_from: Dict[str, Optional[int]] = {name: None for name in WINDOWS}
+        # symbol -> sorted [(timestamp, message_id)], newest last
+        self._recent: Dict[str, List[Tuple[float, str]]] = {}
+        self._positions: Dict[str, Dict[str, Tuple[float, str]]] = {}
+
+    def _bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def _advance(self, now_bucket: int):
+        """Subtract buckets that have slid out of each window, then drop ones no window needs"""
+        for name, span in self._spans.items():
+            first_live = now_bucket - span + 1
+            start = self._expire_from[name]
+            if start is None:
+                self._expire_from[name] = first_live
+                continue
+            if start >= first_live:
+                continue
+            # Skip idle gaps instead of stepping through empty buckets
+            start = max(start, self._oldest_bucket)
+            totals = self._totals[name]
+            for bucket in range(start, first_live):
+                counts = self._buckets.get(bucket)
+                if counts:
+                    totals.subtract(counts)
+            for symbol in [s for s, n in totals.items() if n <= 0]:
+                del totals[symbol]
+            self._expire_from[name] = first_live
+
+        # The longest window expires last, so whatever it has passed can go
+        expired_before = self._expire_from[max(self._spans, key=self._spans.get)]
+        while self._buckets and self._oldest_bucket < expired_before:
+            self._buckets.pop(self._oldest_bucket, None)
+            self._oldest_bucket = min(self._buckets) if self._buckets else expired_before
+
+    def add(self, message_id: str, symbols: Iterable[str], timestamp: float):
+        symbols = list(symbols)
+        if not symbols or message_id in self._positions.get(symbols[0], ()):
+            return
+        now_bucket = self._bucket(max(self._clock(), timestamp))
+        self._advance(now_bucket)
+        bucket = self._bucket(timestamp)
+
+        if bucket > now_bucket - self._retained:
+            if not self._buckets or bucket < self._oldest_bucket:
+                self._oldest_bucket = bucket
+            self._buckets.setdefault(bucket, Counter()).update(symbols)
+            for name, span in self._spans.items():
+                if bucket > now_bucket - span:
+                    self._totals[name].update(symbols)
+
+        key = (timestamp, message_id)
+        for symbol in symbols:
+            positions = self._positions.setdefault(symbol, {})
+            if message_id in positions:
+                continue
+            recent = self._recent.setdefault(symbol, [])
+            if not recent or key > recent[-1]:
+                recent.append(key)
+            else:
+                insort(recent, key)
+            positions[message_id] = key
+            # Trim in batches so appends stay amortized O(1)
+            if len(recent) >= 2 * self.recent_per_symbol:
+                for _, old_id in recent[:-self.recent_per_symbol]:
+                    del positions[old_id]
+                del recent[:-self.recent_per_symbol]
+
+    def load(self, messages: Iterable[Tuple[str, List[str], float]]):
+        """Rebuild from (message_id, symbols, timestamp) tuples, e.g. the last 24h of chat"""
+        self._reset()
+        for message_id, symbols, timestamp in messages:
+            self.add(message_id, symbols, timestamp)
+
+    def trending(self, window: str, limit: int = 10) -> List[dict]:
+        self._advance(self._bucket(self._clock()))
+        top = heapq.nlargest(limit, self._totals[window].items(), key=lambda item: (item[1], item[0]))
+        return [{"symbol": symbol, "mentions": count} for symbol, count in top]
+
+    def message_ids(self, symbol: str, limit: int, before: Optional[str] = None) -> Optional[List[str]]:
+        """Ids of up to `limit` messages mentioning symbol (older than `before`), oldest first.
+
+        Returns None when the retained ids can't fill the page, so the caller queries the database.
+        """
+        recent = self._recent.get(symbol, [])
+        end = len(recent)
+        if before is not None:
+            key = self._positions.get(symbol, {}).get(before)
+            if key is None:
+                return None
+            end = bisect_left(recent, key)
+        if end < limit:
+            return None
+        return [message_id for _, message_id in recent[end - limit:end]]
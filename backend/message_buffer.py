@@ -0,0 +1,73 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class RecentMessages:
+    """Bounded in-memory buffer of the newest chat messages, ordered by (timestamp, id).
+
+    Lookups return None when the buffer cannot answer them on its own, so the caller
+    falls back to a keyset query on db.messages.
+    """
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = capacity
+        self._keys: List[Tuple] = []
+        self._messages: List = []
+        self._keys_by_id: Dict[str, Tuple] = {}
+        # True while the buffer holds every message ever stored (small collections)
+        self.complete = False
+
+    def load(self, messages: Iterable, complete: bool):
+        """Seed the buffer from the newest messages in the database, oldest first"""
+        self._keys, self._messages, self._keys_by_id = [], [], {}
+        for message in messages:
+            self.add(message)
+        self.complete = complete
+
+    def add(self, message):
+        key = (message.timestamp, message.id)
+        if message.id in self._keys_by_id:
+            return
+        if not self._keys or key > self._keys[-1]:
+            self._keys.append(key)
+            self._messages.append(message)
+        else:
+            # Out-of-order arrival (e.g. relayed from another worker)
+            i = bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self._messages.insert(i, message)
+        self._keys_by_id[message.id] = key
+
+        # Trim in batches so appends stay amortized O(1)
+        if len(self._keys) >= 2 * self.capacity:
+            for old in self._messages[:-self.capacity]:
+                del self._keys_by_id[old.id]
+            del self._keys[:-self.capacity]
+            del self._messages[:-self.capacity]
+            self.complete = False
+
+    def latest(self, limit: int) -> Optional[List]:
+        if len(self._messages) >= limit or self.complete:
+            return self._messages[-limit:] if limit else []
+        return None
+
+    def after(self, message_id: str, limit: int) -> Optional[List]:
+        """Messages newer than message_id, oldest first"""
+        key = self._keys_by_id.get(message_id)
+        if key is None:
+            return None
+        i = bisect_right(self._keys, key)
+        return self._messages[i:i + limit]
+
+    def before(self, message_id: str, limit: int) -> Optional[List]:
+        """Up to `limit` messages older than message_id, oldest first"""
+        key = self._keys_by_id.get(message_id)
+        if key is None:
+            return None
+        i = bisect_left(self._keys, key)
+        if i < limit and not self.complete:
+            return None
+        return self._messages[max(0, i - limit):i]
+
+    def __len__(self):
+        return len(self._messages)
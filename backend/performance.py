@@ -0,0 +1,173 @@
+import asyncio
+import weakref
+from typing import Dict, List, Optional
+
+
+# Per-user locks so two trades for the same user don't race on the stats document
+_stats_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def stats_lock(user_id: str) -> asyncio.Lock:
+    """Return the in-process lock guarding a user's stats aggregate"""
+    lock = _stats_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _stats_locks[user_id] = lock
+    return lock
+
+
+class PerformanceStats:
+    """Running trading stats for one user, updated in O(1) per trade"""
+
+    def __init__(
+        self,
+        user_id: str,
+        holdings: Optional[Dict[str, dict]] = None,
+        realized_pnl: float = 0.0,
+        winning_trades: int = 0,
+        completed_trades: int = 0,
+        trades_count: int = 0,
+        last_trade_id: Optional[str] = None,
+        version: int = 0,
+    ):
+        self.user_id = user_id
+        # symbol -> {"shares": int, "total_cost": float}, average-cost ledger for SELLs without realized_pnl
+        self.holdings = holdings or {}
+        self.realized_pnl = realized_pnl
+        self.winning_trades = winning_trades
+        self.completed_trades = completed_trades
+        self.trades_count = trades_count
+        self.last_trade_id = last_trade_id
+        self.version = version
+
+    def apply_trade(self, trade: dict):
+        """Fold a single BUY/SELL trade into the aggregate"""
+        self.trades_count += 1
+        self.last_trade_id = trade.get("id")
+
+        holding = self.holdings.setdefault(trade["symbol"], {"shares": 0, "total_cost": 0.0})
+
+        if trade["action"] == "BUY":
+            holding["shares"] += trade["quantity"]
+            holding["total_cost"] += trade["quantity"] * trade["price"]
+        elif trade["action"] == "SELL" and trade.get("realized_pnl") is not None:
+            # Matched against lots when the trade was written, so the stats only add it up
+            self._record_sale(trade["realized_pnl"])
+            if holding["shares"] > 0:
+                sold = min(sum(lot["quantity"] for lot in trade.get("matched_lots") or ()), holding["shares"])
+                holding["total_cost"] -= holding["total_cost"] / holding["shares"] * sold
+                holding["shares"] -= sold
+        elif trade["action"] == "SELL" and holding["shares"] > 0:
+            # Trades from before lot tracking: fall back to average cost
+            avg_cost = holding["total_cost"] / holding["shares"]
+            sell_quantity = min(trade["quantity"], holding["shares"])
+            self._record_sale((trade["price"] - avg_cost) * sell_quantity)
+
+            # Remaining shares keep the same average cost
+            holding["shares"] -= sell_quantity
+            if holding["shares"] > 0:
+                holding["total_cost"] = avg_cost * holding["shares"]
+            else:
+                holding["total_cost"] = 0.0
+
+    def _record_sale(self, profit_loss: float):
+        self.realized_pnl += profit_loss
+        self.completed_trades += 1
+        if profit_loss > 0:
+            self.winning_trades += 1
+
+    def to_metrics(self) -> dict:
+        """Metrics in the shape stored on the user document"""
+        if not self.completed_trades:
+            return {
+                "total_profit": 0.0,
+                "win_percentage": 0.0,
+                "trades_count": self.trades_count,
+                "average_gain": 0.0
+            }
+
+        return {
+            "total_profit": round(self.realized_pnl, 2),
+            "win_percentage": round((self.winning_trades / self.completed_trades) * 100, 2),
+            "trades_count": self.trades_count,
+            "average_gain": round(self.realized_pnl / self.completed_trades, 2)
+        }
+
+    def to_document(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "holdings": self.holdings,
+            "realized_pnl": self.realized_pnl,
+            "winning_trades": self.winning_trades,
+            "completed_trades": self.completed_trades,
+            "trades_count": self.trades_count,
+            "last_trade_id": self.last_trade_id,
+            "version": self.version,
+        }
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "PerformanceStats":
+        return cls(
+            user_id=doc["user_id"],
+            holdings=doc.get("holdings") or {},
+            realized_pnl=doc.get("realized_pnl", 0.0),
+            winning_trades=doc.get("winning_trades", 0),
+            completed_trades=doc.get("completed_trades", 0),
+            trades_count=doc.get("trades_count", 0),
+            last_trade_id=doc.get("last_trade_id"),
+            version=doc.get("version", 0),
+        )
+
+
+async def rebuild_performance_stats(db, user_id: str) -> PerformanceStats:
+    """Replay a user's full trade history from a streaming cursor and persist the result"""
+    stats = PerformanceStats(user_id)
+    cursor = db.paper_trades.find(
+        {"user_id": user_id},
+        {"_id": 0, "id": 1, "symbol": 1, "action": 1, "quantity": 1, "price": 1, "realized_pnl": 1, "matched_lots": 1}
+    ).sort("timestamp", 1)
+    async for trade in cursor:
+        stats.apply_trade(trade)
+
+    existing = await db.performance_stats.find_one({"user_id": user_id}, {"version": 1})
+    stats.version = (existing or {}).get("version", 0) + 1
+    await db.performance_stats.replace_one({"user_id": user_id}, stats.to_document(), upsert=True)
+    return stats
+
+
+async def get_performance_stats(db, user_id: str) -> PerformanceStats:
+    """Load a user's stats aggregate, rebuilding it if it has never been computed"""
+    doc = await db.performance_stats.find_one({"user_id": user_id}, {"_id": 0})
+    if doc is None:
+        return await rebuild_performance_stats(db, user_id)
+    return PerformanceStats.from_document(doc)
+
+
+async def record_trades(db, user_id: str, trades: List[dict]) -> PerformanceStats:
+    """Apply a user's already-inserted trades, in order, to their aggregate and return the updated aggregate"""
+    async with stats_lock(user_id):
+        doc = await db.performance_stats.find_one({"user_id": user_id}, {"_id": 0})
+        if doc is None:
+            # First trade (or missing aggregate): the replay already includes every one of these
+            return await rebuild_performance_stats(db, user_id)
+
+        stats = PerformanceStats.from_document(doc)
+        previous_version = stats.version
+        for trade in trades:
+            stats.apply_trade(trade)
+        stats.version = previous_version + 1
+
+        # Optimistic write: another worker may have updated the aggregate meanwhile
+        result = await db.performance_stats.replace_one(
+            {"user_id": user_id, "version": previous_version},
+            stats.to_document()
+        )
+        if result.matched_count == 0:
+            stats = await rebuild_performance_stats(db, user_id)
+
+        return stats
+
+
+async def record_trade(db, trade: dict) -> PerformanceStats:
+    """Apply an already-inserted trade to its user's aggregate and return the updated aggregate"""
+    return await record_trades(db, trade["user_id"], [trade])
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from connection_manager import ConnectionManager, encode_frame, positions_topic
+
+
+logger = logging.getLogger(__name__)
+
+
+class PositionStreamer:
+    """Pushes marked-to-market position deltas to users connected to this worker.
+
+    Prices are sampled once per interval for the union of watched symbols, so each
+    user receives at most one frame per interval, and only when something changed.
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        load_positions: Callable[[str], Awaitable[List[dict]]],
+        get_prices: Callable[[Iterable[str]], Awaitable[Dict[str, float]]],
+        interval: float = 1.0,
+    ):
+        self.manager = manager
+        self.load_positions = load_positions
+        self.get_prices = get_prices
+        self.interval = interval
+        # user_id -> {position_id: position}
+        self._positions: Dict[str, Dict[str, dict]] = {}
+        # user_id -> {position_id: (current_price, unrealized_pnl, quantity)} last pushed
+        self._last_sent: Dict[str, Dict[str, tuple]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.frames_sent = 0
+
+    async def watch(self, user_id: str):
+        """Start streaming a user's positions (called when their socket connects)"""
+        if user_id not in self._positions:
+            await self.refresh(user_id)
+
+    def unwatch(self, user_id: str):
+        self._positions.pop(user_id, None)
+        self._last_sent.pop(user_id, None)
+
+    async def refresh(self, user_id: str):
+        """Reload a watched user's open positions after a trade, close or auto-close.
+
+        Positions that are no longer open are pushed as a removal delta, whichever path closed them.
+        """
+        previous = self._positions.get(user_id, {})
+        positions = await self.load_positions(user_id)
+        self._positions[user_id] = {position["id"]: position for position in positions}
+        last_sent = self._last_sent.setdefault(user_id, {})
+        for position_id in list(last_sent):
+            if position_id not in self._positions[user_id]:
+                del last_sent[position_id]
+        removed = [position_id for position_id in previous if position_id not in self._positions[user_id]]
+        if removed:
+            self.manager.publish_local(positions_topic(user_id), encode_frame({"type": "positions", "data": [], "removed": removed}))
+
+    def is_watched(self, user_id: str) -> bool:
+        return user_id in self._positions
+
+    async def tick(self) -> int:
+        """Mark every watched position to market and push one delta frame per changed user"""
+        # Sockets evicted or closed since the last tick no longer need updates
+        for user_id in [u for u in self._positions if u not in self.manager.user_connections]:
+            self.unwatch(user_id)
+
+        symbols = {position["symbol"] for positions in self._positions.values() for position in positions.values()}
+        if not symbols:
+            return 0
+        prices = await self.get_prices(symbols)
+
+        pushed = 0
+        for user_id, positions in self._positions.items():
+            last_sent = self._last_sent.setdefault(user_id, {})
+            changes = []
+            for position_id, position in positions.items():
+                current_price = prices[position["symbol"]]
+                unrealized_pnl = round((current_price - position["avg_price"]) * position["quantity"], 2)
+                marks = (current_price, unrealized_pnl, position["quantity"])
+                if last_sent.get(position_id) == marks:
+                    continue
+                last_sent[position_id] = marks
+                changes.append({
+                    "id": position_id,
+                    "symbol": position["symbol"],
+                    "quantity": position["quantity"],
+                    "avg_price": position["avg_price"],
+                    "current_price": current_price,
+                    "unrealized_pnl": unrealized_pnl
+                })
+            if changes:
+                self.manager.publish_local(positions_topic(user_id), encode_frame({"type": "positions", "data": changes}))
+                pushed += 1
+
+        self.frames_sent += pushed
+        return pushed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Position stream tick failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
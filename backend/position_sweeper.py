@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from trigger_book import TriggerBook
+
+
+logger = logging.getLogger(__name__)
+
+
+class PositionSweeper:
+    """Background task that checks every open position's stop-loss/take-profit on a fixed tick"""
+
+    def __init__(
+        self,
+        trigger_book: TriggerBook,
+        get_prices: Callable[[Iterable[str]], Awaitable[Dict[str, float]]],
+        close_positions: Callable[[List[Tuple[dict, float, str]]], Awaitable[None]],
+        interval: float = 5.0,
+        lease=None,
+    ):
+        self.trigger_book = trigger_book
+        self.get_prices = get_prices
+        self.close_positions = close_positions
+        self.interval = interval
+        # With several workers only the lease holder sweeps, so positions aren't closed twice
+        self.lease = lease
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep_once(self) -> int:
+        """Run one pass over all symbols with armed positions and return how many were closed"""
+        symbols = self.trigger_book.symbols()
+        if not symbols:
+            return 0
+
+        # One price per symbol, however many users hold it
+        prices = await self.get_prices(symbols)
+
+        triggered = [
+            (entry, prices[symbol], reason)
+            for symbol in symbols
+            for entry, reason in self.trigger_book.crossed(symbol, prices[symbol])
+        ]
+        if triggered:
+            await self.close_positions(triggered)
+        return len(triggered)
+
+    async def _run(self):
+        while True:
+            try:
+                if self.lease is None or await self.lease.acquire():
+                    await self.sweep_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Position sweep failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,156 @@
+import asyncio
+import weakref
+from datetime import datetime
+from typing import Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from lots import Fill, LotBook
+
+_trade_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def trade_lock(user_id: str) -> asyncio.Lock:
+    """Return the in-process lock that keeps one user's trades applied in order"""
+    lock = _trade_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _trade_locks[user_id] = lock
+    return lock
+
+
+def _existing_or(field: str, value):
+    return {"$ifNull": [f"${field}", {"$literal": value}]}
+
+
+def buy_pipeline(new_position: dict, quantity: int, price: float, trade_id: Optional[str] = None,
+                 stop_loss: Optional[float] = None, take_profit: Optional[float] = None) -> list:
+    """Update pipeline adding a lot to the open position, or filling in `new_position` on upsert"""
+    held = {"$ifNull": ["$quantity", 0]}
+    total = {"$add": [held, quantity]}
+    # Positions opened before lot tracking carry their shares as one lot at the average price
+    lots = {"$ifNull": ["$lots", {"$cond": [
+        {"$gt": [held, 0]}, [{"trade_id": None, "quantity": "$quantity", "price": "$avg_price"}], []
+    ]}]}
+    updates = {field: _existing_or(field, value) for field, value in new_position.items() if field != "_id"}
+    updates.update({
+        "quantity": total,
+        # Fields in one $set stage all see the document as it was, so held is the old quantity
+        "avg_price": {"$cond": [
+            {"$gt": [held, 0]},
+            {"$round": [{"$divide": [{"$add": [{"$multiply": ["$avg_price", held]}, price * quantity]}, total]}, 2]},
+            price
+        ]},
+        "lots": {"$concatArrays": [lots, [{"trade_id": {"$literal": trade_id}, "quantity": quantity, "price": price}]]},
+        "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+    })
+    if stop_loss is not None:
+        updates["stop_loss"] = {"$literal": stop_loss}
+    if take_profit is not None:
+        updates["take_profit"] = {"$literal": take_profit}
+    return [{"$set": updates}]
+
+
+def sell_update(position: dict, book: LotBook, fill: Fill, closed_at: datetime, close_fields: Optional[dict] = None) -> dict:
+    """Update writing back `book` after `fill` was matched against it, closing the position when it is empty"""
+    fields = {
+        "lots": book.to_document(),
+        "quantity": book.quantity,
+        "avg_price": round(book.avg_price, 2) if book.quantity else position["avg_price"],
+        "realized_pnl": round(position.get("realized_pnl", 0.0) + fill.realized_pnl, 2),
+        "version": position.get("version", 0) + 1,
+    }
+    if not book.quantity:
+        fields.update({"is_open": False, "closed_at": closed_at, "auto_close_reason": "MANUAL", **(close_fields or {})})
+    return {"$set": fields}
+
+
+async def apply_trade(positions, new_position: dict, action: str, quantity: Optional[int], price: float,
+                      trade_id: Optional[str] = None, stop_loss: Optional[float] = None, take_profit: Optional[float] = None,
+                      close_fields: Optional[dict] = None) -> Tuple[Optional[dict], bool, Optional[Fill]]:
+    """Apply a trade to the user's open position.
+
+    Relies on the unique partial index on (user_id, symbol) for open positions. A BUY is one
+    atomic round trip; a SELL matches lots in Python and writes back only if the position's
+    version is unchanged, retrying otherwise. Returns the position after the update (None for a
+    SELL with nothing open), whether it was closed, and for a SELL the matched lots and realized P&L.
+    A SELL with quantity None sells every share; `close_fields` are extra fields set on the
+    position if the SELL closes it.
+    """
+    key = {"user_id": new_position["user_id"], "symbol": new_position["symbol"], "is_open": True}
+    if action == "BUY":
+        pipeline = buy_pipeline(new_position, quantity, price, trade_id, stop_loss, take_profit)
+        for attempt in range(3):
+            try:
+                position = await positions.find_one_and_update(
+                    key, pipeline, upsert=True, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+                )
+                return position, False, None
+            except DuplicateKeyError:
+                # Another trade opened the position first; the retry updates it instead
+                if attempt == 2:
+                    raise
+
+    if action == "SELL":
+        while True:
+            position = await positions.find_one(key, {"_id": 0})
+            if position is None:
+                return None, False, None
+            book = LotBook.from_position(position)
+            fill = book.sell(book.quantity if quantity is None else quantity, price)
+            # Positions written before versioning have no version field yet
+            version = position["version"] if "version" in position else {"$exists": False}
+            updated = await positions.find_one_and_update(
+                {"id": position["id"], "is_open": True, "version": version},
+                sell_update(position, book, fill, datetime.utcnow(), close_fields),
+                projection={"_id": 0}, return_document=ReturnDocument.AFTER
+            )
+            if updated is not None:
+                return updated, not updated["is_open"], fill
+            # Another worker changed the position between the read and the write; match again
+
+    return None, False, None
+
+
+async def merge_duplicate_open_positions(positions) -> int:
+    """Fold extra open positions for one user and symbol into the oldest; returns how many were folded.
+
+    Data written before the open_position_unique index existed can hold duplicates, which block
+    building it. Each duplicate is first claimed by closing it with `merged_into` (its lots are
+    left on it for audit), so concurrent runs never fold the same shares twice.
+    """
+    groups = positions.aggregate([
+        {"$match": {"is_open": True}},
+        {"$sort": {"opened_at": 1, "id": 1}},
+        {"$group": {"_id": {"user_id": "$user_id", "symbol": "$symbol"}, "ids": {"$push": "$id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ])
+    merged = 0
+    async for group in groups:
+        keep_id = group["ids"][0]
+        for duplicate_id in group["ids"][1:]:
+            duplicate = await positions.find_one_and_update(
+                {"id": duplicate_id, "is_open": True},
+                {"$set": {"is_open": False, "closed_at": datetime.utcnow(), "auto_close_reason": "MERGED", "merged_into": keep_id}},
+                projection={"_id": 0}
+            )
+            if duplicate is None:
+                continue
+            while True:
+                keep = await positions.find_one({"id": keep_id}, {"_id": 0})
+                book = LotBook.from_position(keep)
+                for lot in LotBook.from_position(duplicate).to_document():
+                    book.buy(lot["quantity"], lot["price"], lot["trade_id"])
+                version = keep["version"] if "version" in keep else {"$exists": False}
+                result = await positions.update_one({"id": keep_id, "version": version}, {"$set": {
+                    "lots": book.to_document(),
+                    "quantity": book.quantity,
+                    "avg_price": round(book.avg_price, 2),
+                    "realized_pnl": round(keep.get("realized_pnl", 0.0) + duplicate.get("realized_pnl", 0.0), 2),
+                    "version": keep.get("version", 0) + 1,
+                }})
+                if result.modified_count:
+                    break
+            merged += 1
+    return merged
@@ -0,0 +1,133 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from pymongo import ReturnDocument
+
+# route -> (burst, refill tokens per second)
+Rules = Dict[str, Tuple[float, float]]
+
+
+class RateLimiter(ABC):
+    """Token buckets keyed by (route, user id).
+
+    Each bucket holds up to `burst` tokens and refills at `rate` tokens per second; a request
+    spends one token. hit() returns 0 when the request may proceed, otherwise the number of
+    seconds until a token will be available (the Retry-After value).
+    """
+
+    def __init__(self, rules: Rules):
+        self.rules = rules
+        self.allowed = 0
+        self.limited = 0
+
+    @abstractmethod
+    async def hit(self, route: str, key: str) -> float:
+        ...
+
+    def _count(self, retry_after: float) -> float:
+        if retry_after:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "limited": self.limited}
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """Buckets in a dict on this worker; with N workers a user gets up to N times the limit.
+
+    At most `max_keys` buckets are kept: past that the least recently used one is evicted in
+    O(1), which at worst hands that idle user a fresh burst.
+    """
+
+    def __init__(self, rules: Rules, max_keys: int = 100000, clock=time.monotonic):
+        super().__init__(rules)
+        self.max_keys = max_keys
+        self._clock = clock
+        # (route, key) -> [tokens, updated_at], most recently used last
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self.evictions = 0
+
+    async def hit(self, route: str, key: str) -> float:
+        burst, rate = self.rules[route]
+        now = self._clock()
+        bucket = self._buckets.get((route, key))
+        if bucket is None:
+            while len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            bucket = self._buckets[(route, key)] = [burst, now]
+        else:
+            self._buckets.move_to_end((route, key))
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return self._count(0.0)
+        return self._count((1 - bucket[0]) / rate)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "memory", "buckets": len(self._buckets), "evictions": self.evictions}
+
+
+class MongoRateLimiter(RateLimiter):
+    """Buckets in a Mongo collection, updated atomically so every worker shares one limit"""
+
+    def __init__(self, db, rules: Rules, collection: str = "rate_limits", clock=time.time):
+        super().__init__(rules)
+        self.collection = db[collection]
+        self._clock = clock
+
+    async def hit(self, route: str, key: str) -> float:
+        burst, rate = self.rules[route]
+        now = self._clock()
+        refilled = {"$min": [burst, {"$add": [
+            {"$ifNull": ["$tokens", burst]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, rate]}
+        ]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": f"{route}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    # TTL index drops buckets once they would have refilled anyway
+                    "expires_at": datetime.utcnow() + timedelta(seconds=burst / rate)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return self._count(0.0)
+        return self._count((1 - bucket["tokens"]) / rate)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "mongo"}
+
+
+def rules_from_env(defaults: Rules) -> Rules:
+    """Override (burst, per-second) defaults with RATE_LIMIT_<ROUTE>_BURST / _PER_SECOND"""
+    rules = {}
+    for route, (burst, rate) in defaults.items():
+        prefix = f"RATE_LIMIT_{route.upper()}"
+        rules[route] = (
+            float(os.environ.get(f"{prefix}_BURST", burst)),
+            float(os.environ.get(f"{prefix}_PER_SECOND", rate))
+        )
+    return rules
+
+
+def create_rate_limiter(db, rules: Rules) -> RateLimiter:
+    """Pick the limiter backend from RATE_LIMIT_BACKEND (memory or mongo)"""
+    if os.environ.get("RATE_LIMIT_BACKEND", "memory").lower() == "mongo":
+        return MongoRateLimiter(db, rules)
+    return InMemoryRateLimiter(rules)
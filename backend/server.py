@@ -1,19 +1,47 @@
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, File, UploadFile
+from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, File, UploadFile, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+import asyncio
+import math
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
-import re
 from enum import Enum
 import base64
 import hashlib
+from collections import deque
+
+from analytics import AnalyticsCache, get_user_analytics
+from blob_store import BlobTooLarge, create_blob_store
+from broadcast_bus import LeaderLease, create_bus
+from chat_search import SORTS, ChatSearchIndex, sync_from_db
+from connection_manager import ConnectionManager, positions_topic
+from db_indexes import ensure_indexes, explain_hot_queries
+from image_pipeline import ALLOWED_IMAGE_TYPES, ImagePipeline, InvalidImage, sniff_image_type
+from leaderboard import METRICS, WINDOWS as LEADERBOARD_WINDOWS, Leaderboard, rebuild_leaderboard, stats_row
+from lots import COST_METHODS, Fill, LotBook
+from market_data import MockQuoteProvider, QuoteCache
+from mention_index import WINDOWS, MentionIndex
+from message_buffer import RecentMessages
+from performance import get_performance_stats, record_trades
+from position_stream import PositionStreamer
+from position_sweeper import PositionSweeper
+from position_updates import apply_trade, sell_update, trade_lock
+from rate_limit import create_rate_limiter, rules_from_env
+from tickers import TickerExtractor, load_symbol_universe
+from trade_export import EXPORT_PROJECTION, FORMATS as EXPORT_FORMATS, export_chunks, parquet_available
+from trigger_book import ENTRY_FIELDS, TriggerBook
+from user_cache import UserCache
+from write_behind import WriteBehindQueue
 
 
 ROOT_DIR = Path(__file__).parent
@@ -30,45 +58,76 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.user_connections: Dict[str, WebSocket] = {}
+# Pub/sub backplane shared by all uvicorn workers (BROADCAST_BUS=memory|mongo)
+bus = create_bus(db)
 
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        self.user_connections[user_id] = websocket
+# Newest chat messages kept in memory so history requests rarely touch the database
+recent_messages = RecentMessages(capacity=int(os.environ.get("RECENT_MESSAGES_CAPACITY", "500")))
 
-    def disconnect(self, websocket: WebSocket, user_id: str):
-        self.active_connections.remove(websocket)
-        if user_id in self.user_connections:
-            del self.user_connections[user_id]
+# Full-text chat search index on local disk, shared by the workers on this host
+chat_search = ChatSearchIndex(Path(os.environ.get("SEARCH_INDEX_PATH", ROOT_DIR / "search" / "chat.db")))
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+# $TICKER mentions in time buckets for trending windows, plus recent message ids per symbol
+mention_index = MentionIndex()
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
-
-    async def send_admin_notification(self, message: str):
-        """Send notifications to all connected admins"""
-        admin_users = await db.users.find({"is_admin": True}).to_list(1000)
-        admin_ids = [user["id"] for user in admin_users]
-        
-        for user_id in admin_ids:
-            if user_id in self.user_connections:
-                try:
-                    await self.user_connections[user_id].send_text(message)
-                except:
-                    pass
+# WebSocket connection manager with per-connection send queues
+manager = ConnectionManager(
+    max_queue=int(os.environ.get("WS_SEND_QUEUE_SIZE", "256")),
+    bus=bus
+)
+
+# Identity, approval and role fields of hot user records, looked up on almost every request
+USER_CACHE_PROJECTION = {
+    "_id": 0, "id": 1, "username": 1, "email": 1, "status": 1,
+    "is_admin": 1, "is_moderator": 1, "avatar_url": 1, "avatar_variants": 1
+}
+
+user_cache = UserCache(
+    lambda user_id: db.users.find_one({"id": user_id}, USER_CACHE_PROJECTION),
+    ttl=float(os.environ.get("USER_CACHE_TTL_SECONDS", "30")),
+    max_entries=int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+)
+
+# How sells are matched against the lots of newly opened positions (COST_BASIS_METHOD=fifo|lifo|average)
+COST_BASIS_METHOD = os.environ.get("COST_BASIS_METHOD", "fifo").lower()
+if COST_BASIS_METHOD not in COST_METHODS:
+    raise ValueError(f"COST_BASIS_METHOD must be one of {', '.join(COST_METHODS)}")
+
+# Portfolio analytics per user, recomputed only after the user's next trade
+analytics_cache = AnalyticsCache(max_entries=int(os.environ.get("ANALYTICS_CACHE_MAX_ENTRIES", "1000")))
+ANALYTICS_STARTING_EQUITY = float(os.environ.get("ANALYTICS_STARTING_EQUITY", "100000"))
+
+# Daily/weekly/all-time rankings per metric, updated on every trade
+leaderboard = Leaderboard()
+
+# $TICKER extraction, optionally limited to listed symbols (SYMBOL_UNIVERSE_FILE, one per line)
+ticker_extractor = TickerExtractor(load_symbol_universe(os.environ.get("SYMBOL_UNIVERSE_FILE")))
+
+# Utility function to get a user through the cache
+async def get_user(user_id: str) -> Optional[dict]:
+    return await user_cache.get(user_id)
+
+async def invalidate_user(user_id: str):
+    """Drop a user's cached record on every worker; call after each write to db.users"""
+    await bus.publish("users.invalidate", {"user_id": user_id})
+
+async def on_user_invalidated(event: dict):
+    user_cache.invalidate(event["user_id"])
 
-manager = ConnectionManager()
+bus.subscribe("users.invalidate", on_user_invalidated)
+
+# Token-bucket flood control per user and route: (burst, refill per second)
+rate_limiter = create_rate_limiter(db, rules_from_env({"messages": (10, 1), "trades": (20, 2)}))
+
+# Utility function to reject a request once the user's bucket for the route is empty
+async def enforce_rate_limit(route: str, user_id: str):
+    retry_after = await rate_limiter.hit(route, user_id)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, slow down",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
 
 # Define Enums
 class UserStatus(str, Enum):
@@ -84,6 +143,7 @@ class User(BaseModel):
     is_admin: bool = False
     status: UserStatus = UserStatus.PENDING
     avatar_url: Optional[str] = None
+    avatar_variants: Optional[Dict[str, str]] = None  # "64.webp" -> URL, etc.
     total_profit: float = 0.0
     win_percentage: float = 0.0
     trades_count: int = 0
@@ -92,6 +152,22 @@ class User(BaseModel):
     approved_at: Optional[datetime] = None
     approved_by: Optional[str] = None
 
+class UserSummary(BaseModel):
+    """Compact user read model for directory listings"""
+    id: str
+    username: str
+    real_name: Optional[str] = None
+    email: Optional[str] = None
+    status: UserStatus = UserStatus.PENDING
+    is_admin: bool = False
+    is_moderator: bool = False
+    is_online: bool = False
+    avatar_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+
+USER_SUMMARY_PROJECTION = {"_id": 0, **{field: 1 for field in UserSummary.model_fields}}
+
 class UserCreate(BaseModel):
     username: str
     email: str
@@ -154,6 +230,8 @@ class PaperTrade(BaseModel):
     is_closed: bool = False
     stop_loss: Optional[float] = None
     take_profit: Optional[float] = None
+    realized_pnl: Optional[float] = None  # SELLs only, against the lots they matched
+    matched_lots: Optional[List[dict]] = None  # [{"trade_id", "quantity", "price"}]
 
 class Position(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -171,6 +249,10 @@ class Position(BaseModel):
     closed_at: Optional[datetime] = None
     notes: Optional[str] = None
     auto_close_reason: Optional[str] = None  # "STOP_LOSS", "TAKE_PROFIT", "MANUAL"
+    realized_pnl: float = 0.0  # Summed over this position's SELLs
+    lots: Optional[List[dict]] = None  # Open lots [{"trade_id", "quantity", "price"}]
+    cost_method: str = "fifo"  # "fifo", "lifo" or "average"; fixed when the position opens
+    version: int = 0
 
 class PaperTradeCreate(BaseModel):
     symbol: str
@@ -184,9 +266,16 @@ class PaperTradeCreate(BaseModel):
 # Utility function to extract stock tickers from message
 def extract_stock_tickers(content: str) -> List[str]:
     """Extract stock tickers that start with $ from message content"""
-    pattern = r'\$([A-Z]{1,5})'
-    matches = re.findall(pattern, content.upper())
-    return matches
+    return ticker_extractor.extract(content)
+
+# Utility function to list the roles held by a user document
+def user_roles(user: dict) -> List[str]:
+    roles = []
+    if user.get("is_admin"):
+        roles.append("admin")
+    if user.get("is_moderator"):
+        roles.append("moderator")
+    return roles
 
 # Utility functions for authentication and image processing
 def hash_password(password: str) -> str:
@@ -197,259 +286,336 @@ def verify_password(password: str, hashed: str) -> bool:
     """Verify a password against its hash"""
     return hash_password(password) == hashed
 
-def process_uploaded_image(file_content: bytes, max_size: int = 1024 * 1024) -> str:
-    """Process uploaded image and return base64 data URL"""
-    if len(file_content) > max_size:
-        raise HTTPException(status_code=400, detail="Image too large (max 1MB)")
+# Uploaded images live in a content-addressed blob store; documents keep only a short URL
+blob_store = create_blob_store(db, ROOT_DIR / "blobs")
+BLOB_URL_PREFIX = os.environ.get("BLOB_URL_PREFIX", "/api/blobs")
+
+def blob_url(digest: str) -> str:
+    return f"{BLOB_URL_PREFIX}/{digest}"
+
+async def single_chunk(data: bytes):
+    yield data
+
+async def read_upload_chunks(file: UploadFile, first: bytes = b""):
+    if first:
+        yield first
+    while True:
+        chunk = await file.read(256 * 1024)
+        if not chunk:
+            break
+        yield chunk
+
+# Resized WebP/JPEG variants are rendered in a process pool and cached by content hash
+image_pipeline = ImagePipeline(blob_store, db)
+
+async def store_uploaded_image(file: UploadFile, max_size: int = 1024 * 1024) -> dict:
+    """Stream an uploaded image into the blob store and render its size variants"""
+    # Trust the file's magic bytes, never the client's Content-Type
+    first = await file.read(256 * 1024)
+    content_type = sniff_image_type(first)
+    if content_type is None:
+        raise HTTPException(status_code=400, detail="File must be a PNG, JPEG, GIF or WebP image")
+    
+    try:
+        blob = await blob_store.put_stream(read_upload_chunks(file, first), content_type, max_size)
+    except BlobTooLarge:
+        raise HTTPException(status_code=400, detail=f"Image too large (max {max_size // (1024 * 1024)}MB)")
+    
+    try:
+        processed = await image_pipeline.variants_for(blob.digest, blob_url)
+    except InvalidImage:
+        # variants_for has already deleted the undecodable blob
+        raise HTTPException(status_code=400, detail="File is not a valid image")
+    return {"url": blob_url(blob.digest), **processed}
+
+async def migrate_inline_image(data_url: str) -> Optional[dict]:
+    """Store a legacy base64 data-URL image as a blob; None if it isn't a supported image"""
+    data = base64.b64decode(data_url.partition(",")[2], validate=True)
+    content_type = sniff_image_type(data)
+    if content_type is None:
+        return None
+    blob = await blob_store.put_stream(single_chunk(data), content_type, max_size=10 * 1024 * 1024)
+    try:
+        return await image_pipeline.variants_for(blob.digest, blob_url)
+    except InvalidImage:
+        return None
+
+async def migrate_inline_avatars():
+    """Move legacy base64 data-URL avatars and message images into the blob store"""
+    # A bad record is logged and left for later; it must never stop the app from starting
+    async for user in db.users.find({"avatar_url": {"$regex": "^data:"}}, {"id": 1, "avatar_url": 1}):
+        try:
+            image = await migrate_inline_image(user["avatar_url"])
+            # Unsupported inline images (e.g. SVG) are dropped rather than served from our origin
+            update = {"avatar_url": None, "avatar_variants": None}
+            if image is not None:
+                update = {"avatar_url": image["variants"]["256.webp"], "avatar_variants": image["variants"]}
+            await db.users.update_one(
+                {"id": user["id"]},
+                {"$set": update, "$unset": {"avatar_file": ""}}
+            )
+            await invalidate_user(user["id"])
+        except Exception as e:
+            logger.error(f"Failed to migrate inline avatar for user {user.get('id')}: {e}")
     
-    # Convert to base64 data URL
-    base64_content = base64.b64encode(file_content).decode('utf-8')
-    return f"data:image/jpeg;base64,{base64_content}"
+    # Messages snapshot the sender's avatar and may embed a posted image
+    for field, variant in (("avatar_url", "256.webp"), ("image_url", "1024.webp")):
+        async for message in db.messages.find({field: {"$regex": "^data:"}}, {"id": 1, field: 1}):
+            try:
+                image = await migrate_inline_image(message[field])
+                url = image["variants"][variant] if image is not None else None
+                await db.messages.update_one({"id": message["id"]}, {"$set": {field: url}})
+            except Exception as e:
+                logger.error(f"Failed to migrate inline {field} for message {message.get('id')}: {e}")
+
+# Shared quote cache in front of the price provider (mock for now - can integrate with Alpha Vantage later)
+quote_cache = QuoteCache(
+    MockQuoteProvider(),
+    ttl=float(os.environ.get("QUOTE_CACHE_TTL_SECONDS", "5")),
+    max_symbols=int(os.environ.get("QUOTE_CACHE_MAX_SYMBOLS", "5000"))
+)
+
+# Open positions indexed by stop-loss/take-profit level, kept in sync on open/close/modify
+trigger_book = TriggerBook()
 
-# Utility function to get stock price (mock for now - can integrate with Alpha Vantage later)
+async def publish_trigger_change(position: dict, removed: bool = False):
+    """Apply a position change to the trigger book on every worker"""
+    await bus.publish("trigger_book", {
+        "removed": removed,
+        "position": {field: position.get(field) for field in ENTRY_FIELDS}
+    })
+
+async def on_trigger_change(event: dict):
+    if event["removed"]:
+        trigger_book.remove(event["position"]["id"])
+    else:
+        trigger_book.upsert(event["position"])
+
+bus.subscribe("trigger_book", on_trigger_change)
+
+# Utility function to get stock price
 async def get_current_stock_price(symbol: str) -> float:
-    """Get current stock price (mock implementation for now)"""
-    # Mock prices for demonstration - in production, integrate with Alpha Vantage or similar
-    mock_prices = {
-        "TSLA": 250.75,
-        "AAPL": 185.20,
-        "MSFT": 420.50,
-        "NVDA": 875.30,
-        "GOOGL": 142.80,
-        "AMZN": 155.90,
-        "META": 485.60,
-        "NFLX": 425.20,
-        "AMD": 198.40,
-        "INTC": 45.60
-    }
-    # Add some random variation to simulate price movement
-    import random
-    base_price = mock_prices.get(symbol.upper(), 100.0)
-    variation = random.uniform(-0.05, 0.05)  # ±5% variation
-    return round(base_price * (1 + variation), 2)
+    """Get current stock price through the shared quote cache"""
+    return await quote_cache.get_price(symbol)
 
 # Utility function to manage positions
-async def update_or_create_position(user_id: str, symbol: str, action: str, quantity: int, price: float, trade_id: str, stop_loss: float = None, take_profit: float = None):
-    """Update existing position or create new one"""
-    existing_position = await db.positions.find_one({
-        "user_id": user_id,
-        "symbol": symbol.upper(),
-        "is_open": True
-    })
-    
-    if action == "BUY":
-        if existing_position:
-            # Add to existing position
-            new_quantity = existing_position["quantity"] + quantity
-            new_avg_price = ((existing_position["avg_price"] * existing_position["quantity"]) + (price * quantity)) / new_quantity
-            
-            # Update stop loss and take profit if provided
-            update_data = {
-                "quantity": new_quantity,
-                "avg_price": round(new_avg_price, 2)
-            }
-            
-            if stop_loss is not None:
-                update_data["stop_loss"] = stop_loss
-            if take_profit is not None:
-                update_data["take_profit"] = take_profit
-            
-            await db.positions.update_one(
-                {"id": existing_position["id"]},
-                {"$set": update_data}
-            )
-            
-            # Update trade with position_id
-            await db.paper_trades.update_one(
-                {"id": trade_id},
-                {"$set": {"position_id": existing_position["id"]}}
-            )
-            
-            return existing_position["id"]
-        else:
-            # Create new position
-            position = Position(
-                user_id=user_id,
-                symbol=symbol.upper(),
-                quantity=quantity,
-                avg_price=price,
-                entry_price=price,
-                stop_loss=stop_loss,
-                take_profit=take_profit
-            )
-            await db.positions.insert_one(position.dict())
-            
-            # Update trade with position_id
-            await db.paper_trades.update_one(
-                {"id": trade_id},
-                {"$set": {"position_id": position.id}}
-            )
-            
-            return position.id
-    
-    elif action == "SELL" and existing_position:
-        if quantity >= existing_position["quantity"]:
-            # Close entire position
-            await db.positions.update_one(
-                {"id": existing_position["id"]},
-                {"$set": {
-                    "is_open": False,
-                    "closed_at": datetime.utcnow(),
-                    "quantity": 0,
-                    "auto_close_reason": "MANUAL"
-                }}
-            )
-            
-            # Update trade with position_id
-            await db.paper_trades.update_one(
-                {"id": trade_id},
-                {"$set": {"position_id": existing_position["id"], "is_closed": True}}
-            )
-        else:
-            # Partial close
-            new_quantity = existing_position["quantity"] - quantity
-            await db.positions.update_one(
-                {"id": existing_position["id"]},
-                {"$set": {"quantity": new_quantity}}
-            )
-            
-            # Update trade with position_id
-            await db.paper_trades.update_one(
-                {"id": trade_id},
-                {"$set": {"position_id": existing_position["id"]}}
-            )
-        
-        return existing_position["id"]
+async def update_or_create_position(user_id: str, symbol: str, action: str, quantity: int, price: float, trade_id: str = None,
+                                    stop_loss: float = None, take_profit: float = None, close_fields: dict = None):
+    """Apply a trade to the user's open position; returns (position_id, closed, fill)"""
+    new_position = Position(
+        user_id=user_id,
+        symbol=symbol.upper(),
+        quantity=0,
+        avg_price=price,
+        entry_price=price,
+        stop_loss=stop_loss,
+        take_profit=take_profit,
+        cost_method=COST_BASIS_METHOD
+    )
+    position, closed, fill = await apply_trade(
+        db.positions, new_position.dict(), action, quantity, price, trade_id=trade_id,
+        stop_loss=stop_loss, take_profit=take_profit, close_fields=close_fields
+    )
+    if position is None:
+        return None, False, None
     
-    return None
+    await publish_trigger_change(position, removed=closed)
+    return position["id"], closed, fill
+
+# Utility function to record a sell's matched lots on its trade
+def record_fill(trade: PaperTrade, fill: Optional[Fill]):
+    if fill is not None:
+        trade.realized_pnl = round(fill.realized_pnl, 2)
+        trade.matched_lots = fill.matched
+
+# Utility functions for the background stop-loss/take-profit sweeper
+async def load_trigger_positions() -> List[dict]:
+    """Load every open position that has a stop-loss or take-profit level set"""
+    cursor = db.positions.find(
+        {"is_open": True, "$or": [{"stop_loss": {"$ne": None}}, {"take_profit": {"$ne": None}}]},
+        {"_id": 0, "id": 1, "user_id": 1, "symbol": 1, "quantity": 1, "avg_price": 1, "stop_loss": 1, "take_profit": 1}
+    )
+    return [position async for position in cursor]
 
-# Utility function to update position P&L and check for auto-close triggers
-async def update_positions_pnl(user_id: str):
-    """Update current P&L for all open positions and check for stop-loss/take-profit triggers"""
-    open_positions = await db.positions.find({"user_id": user_id, "is_open": True}).to_list(1000)
+async def close_triggered_positions(triggered: List[tuple]):
+    """Auto-close positions whose stop-loss/take-profit was crossed, in bulk"""
+    sweep_id = str(uuid.uuid4())
+    closed_at = datetime.utcnow()
     
-    for position in open_positions:
-        current_price = await get_current_stock_price(position["symbol"])
-        unrealized_pnl = (current_price - position["avg_price"]) * position["quantity"]
-        
-        # Check for auto-close triggers
-        should_close = False
-        close_reason = None
-        
-        # Check stop-loss (price dropped below stop-loss level)
-        if position.get("stop_loss") and current_price <= position["stop_loss"]:
-            should_close = True
-            close_reason = "STOP_LOSS"
-        
-        # Check take-profit (price reached take-profit level)
-        elif position.get("take_profit") and current_price >= position["take_profit"]:
-            should_close = True
-            close_reason = "TAKE_PROFIT"
-        
-        if should_close:
-            # Auto-close the position
-            realized_pnl = (current_price - position["avg_price"]) * position["quantity"]
-            
-            # Create a SELL trade to record the auto-close
-            close_trade = PaperTrade(
-                user_id=user_id,
-                symbol=position["symbol"],
-                action="SELL",
-                quantity=position["quantity"],
-                price=current_price,
-                position_id=position["id"],
-                is_closed=True,
-                notes=f"Auto-closed by {close_reason.replace('_', ' ').lower()} at ${current_price}"
-            )
-            
-            await db.paper_trades.insert_one(close_trade.dict())
-            
-            # Close the position
-            await db.positions.update_one(
-                {"id": position["id"]},
-                {"$set": {
-                    "is_open": False,
-                    "closed_at": datetime.utcnow(),
-                    "current_price": current_price,
-                    "unrealized_pnl": round(realized_pnl, 2),
-                    "auto_close_reason": close_reason
-                }}
-            )
-            
-            print(f"Auto-closed position {position['symbol']} - {close_reason}: ${realized_pnl:.2f}")
-            
+    # Only positions still open are claimed, so a concurrent manual close wins
+    await db.positions.bulk_write([
+        UpdateOne(
+            {"id": position["id"], "is_open": True},
+            {"$set": {
+                "is_open": False,
+                "closed_at": closed_at,
+                "current_price": price,
+                "auto_close_reason": reason,
+                "close_sweep_id": sweep_id
+            }}
+        )
+        for position, price, reason in triggered
+    ], ordered=False)
+    claimed = {
+        p["id"]: p for p in await db.positions.find(
+            {"close_sweep_id": sweep_id},
+            {"_id": 0, "id": 1, "quantity": 1, "avg_price": 1, "lots": 1, "cost_method": 1, "realized_pnl": 1, "version": 1}
+        ).to_list(None)
+    }
+    # Leave the trigger book alone until the claim is stored, so a failed write is retried next sweep
+    for position, _, _ in triggered:
+        if position["id"] in claimed:
+            await publish_trigger_change(position, removed=True)
         else:
-            # Update position with current price and P&L
-            await db.positions.update_one(
-                {"id": position["id"]},
-                {"$set": {
-                    "current_price": current_price,
-                    "unrealized_pnl": round(unrealized_pnl, 2)
-                }}
-            )
+            # Already closed elsewhere, and that close publishes the removal; drop the local entry
+            # too so a lost event can't re-trigger it every sweep
+            trigger_book.remove(position["id"])
+    
+    close_trades = []
+    fills = []
+    for position, price, reason in triggered:
+        if position["id"] not in claimed:
+            continue
+        # Create a SELL trade to record the auto-close, matched against every open lot
+        book = LotBook.from_position(claimed[position["id"]])
+        fill = book.sell(book.quantity, price)
+        # Write the emptied book and realized P&L back, as a manual close does
+        fills.append(UpdateOne(
+            {"id": position["id"], "close_sweep_id": sweep_id},
+            sell_update(claimed[position["id"]], book, fill, closed_at, {
+                "current_price": price,
+                "unrealized_pnl": round(fill.realized_pnl, 2),
+                "auto_close_reason": reason
+            })
+        ))
+        close_trade = PaperTrade(
+            user_id=position["user_id"],
+            symbol=position["symbol"],
+            action="SELL",
+            quantity=fill.quantity,
+            price=price,
+            position_id=position["id"],
+            is_closed=True,
+            notes=f"Auto-closed by {reason.replace('_', ' ').lower()} at ${price}"
+        )
+        record_fill(close_trade, fill)
+        close_trades.append(close_trade)
+        logger.info(f"Auto-closed position {position['symbol']} for {position['user_id']} - {reason} at ${price}")
+    
+    if close_trades:
+        await db.positions.bulk_write(fills, ordered=False)
+        await db.paper_trades.bulk_write([InsertOne(trade.dict()) for trade in close_trades], ordered=False)
+        # One stats update per user: a missing aggregate is rebuilt from history that already has every trade
+        trades_by_user = {}
+        for trade in close_trades:
+            trades_by_user.setdefault(trade.user_id, []).append(trade)
+        for user_id, trades in trades_by_user.items():
+            await record_trades_performance(user_id, trades)
+        for trade in close_trades:
+            await manager.publish(positions_topic(trade.user_id), {
+                "type": "position_closed",
+                "data": {"id": trade.position_id, "symbol": trade.symbol, "price": trade.price, "notes": trade.notes}
+            })
+            await notify_positions_changed(trade.user_id)
+
+sweep_interval = float(os.environ.get("POSITION_SWEEP_INTERVAL_SECONDS", "5"))
+position_sweeper = PositionSweeper(
+    trigger_book=trigger_book,
+    get_prices=quote_cache.get_prices,
+    close_positions=close_triggered_positions,
+    interval=sweep_interval,
+    # Several workers share the bus, so only one of them may sweep at a time
+    lease=LeaderLease(db, "position_sweeper", ttl=3 * sweep_interval) if bus.multi_process else None
+)
+
+# Utility functions for the in-memory chat history buffer
+async def load_recent_messages():
+    newest = await db.messages.find().sort([("timestamp", -1), ("id", -1)]).limit(recent_messages.capacity).to_list(recent_messages.capacity)
+    newest.reverse()
+    recent_messages.load((Message(**message) for message in newest), complete=len(newest) < recent_messages.capacity)
+
+# Utility function to convert a stored naive-UTC datetime to epoch seconds
+def epoch_seconds(timestamp: datetime) -> float:
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+# Utility function to fetch messages by id, keeping the given order
+async def load_messages_by_id(ids: List[str]) -> List[Message]:
+    found = {message["id"]: message for message in await db.messages.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))}
+    return [Message(**found[message_id]) for message_id in ids if message_id in found]
+
+async def load_mention_index():
+    since = datetime.utcnow() - timedelta(seconds=max(WINDOWS.values()))
+    cursor = db.messages.find(
+        {"timestamp": {"$gte": since}, "highlighted_tickers": {"$ne": []}},
+        {"_id": 0, "id": 1, "highlighted_tickers": 1, "timestamp": 1}
+    ).sort([("timestamp", 1), ("id", 1)])
+    mention_index.load([
+        (message["id"], message["highlighted_tickers"], epoch_seconds(message["timestamp"]))
+        async for message in cursor
+    ])
+
+async def on_chat_message(event: dict):
+    message = Message(**event)
+    recent_messages.add(message)
+    mention_index.add(message.id, message.highlighted_tickers, epoch_seconds(message.timestamp))
+
+bus.subscribe("chat.message", on_chat_message)
+
+# Utility functions for pushing position updates over /ws/{user_id}
+async def load_open_positions(user_id: str) -> List[dict]:
+    return await db.positions.find(
+        {"user_id": user_id, "is_open": True},
+        {"_id": 0, "id": 1, "symbol": 1, "quantity": 1, "avg_price": 1}
+    ).to_list(1000)
+
+position_streamer = PositionStreamer(
+    manager=manager,
+    load_positions=load_open_positions,
+    get_prices=quote_cache.get_prices,
+    interval=float(os.environ.get("POSITION_STREAM_INTERVAL_SECONDS", "1"))
+)
+
+async def notify_positions_changed(user_id: str):
+    """Tell whichever worker streams this user's positions to reload them"""
+    await bus.publish("positions.changed", {"user_id": user_id})
+
+async def on_positions_changed(event: dict):
+    if position_streamer.is_watched(event["user_id"]):
+        await position_streamer.refresh(event["user_id"])
+
+bus.subscribe("positions.changed", on_positions_changed)
 
 # Utility function to calculate user trading performance
 async def calculate_user_performance(user_id: str) -> dict:
     """Calculate trading performance metrics for a user"""
-    trades = await db.paper_trades.find({"user_id": user_id}).to_list(1000)
-    
-    if not trades:
-        return {
-            "total_profit": 0.0,
-            "win_percentage": 0.0,
-            "trades_count": 0,
-            "average_gain": 0.0
-        }
-    
-    # Group trades by symbol to calculate profit/loss
-    positions = {}
-    completed_trades = []
-    
-    for trade in sorted(trades, key=lambda x: x["timestamp"]):
-        symbol = trade["symbol"]
-        if symbol not in positions:
-            positions[symbol] = {"shares": 0, "total_cost": 0}
-        
-        if trade["action"] == "BUY":
-            positions[symbol]["shares"] += trade["quantity"]
-            positions[symbol]["total_cost"] += trade["quantity"] * trade["price"]
-        elif trade["action"] == "SELL" and positions[symbol]["shares"] > 0:
-            # Calculate profit/loss for this sell
-            avg_cost = positions[symbol]["total_cost"] / positions[symbol]["shares"] if positions[symbol]["shares"] > 0 else 0
-            sell_quantity = min(trade["quantity"], positions[symbol]["shares"])
-            profit_loss = (trade["price"] - avg_cost) * sell_quantity
-            
-            completed_trades.append({
-                "profit_loss": profit_loss,
-                "is_profitable": profit_loss > 0
-            })
-            
-            # Update position
-            positions[symbol]["shares"] -= sell_quantity
-            if positions[symbol]["shares"] > 0:
-                positions[symbol]["total_cost"] = (positions[symbol]["total_cost"] / positions[symbol]["shares"]) * positions[symbol]["shares"]
-            else:
-                positions[symbol]["total_cost"] = 0
-    
-    if not completed_trades:
-        return {
-            "total_profit": 0.0,
-            "win_percentage": 0.0,
-            "trades_count": len(trades),
-            "average_gain": 0.0
-        }
-    
-    total_profit = sum(trade["profit_loss"] for trade in completed_trades)
-    winning_trades = sum(1 for trade in completed_trades if trade["is_profitable"])
-    win_percentage = (winning_trades / len(completed_trades)) * 100 if completed_trades else 0
-    average_gain = total_profit / len(completed_trades) if completed_trades else 0
-    
-    return {
-        "total_profit": round(total_profit, 2),
-        "win_percentage": round(win_percentage, 2),
-        "trades_count": len(trades),
-        "average_gain": round(average_gain, 2)
-    }
+    stats = await get_performance_stats(db, user_id)
+    return stats.to_metrics()
+
+async def record_trade_performance(trade: PaperTrade):
+    """Fold a new trade into the user's running stats and store the metrics on the user"""
+    return await record_trades_performance(trade.user_id, [trade])
+
+async def record_trades_performance(user_id: str, trades: List[PaperTrade]):
+    """Fold a user's new trades, already stored, into their running stats in one update"""
+    stats = await record_trades(db, user_id, [trade.dict() for trade in trades])
+    performance = stats.to_metrics()
+    await db.users.update_one(
+        {"id": user_id},
+        {"$set": performance}
+    )
+    # The all-time board takes the user's full totals, so it never depends on having seen every trade
+    all_time = stats_row(stats.to_document())
+    for trade in trades:
+        await bus.publish("leaderboard.trade", {
+            "user_id": user_id, "timestamp": trade.timestamp, "realized_pnl": trade.realized_pnl,
+            "all_time": all_time
+        })
+    return performance
+
+async def on_leaderboard_trade(event: dict):
+    leaderboard.record(event["user_id"], event["timestamp"], event["realized_pnl"], event.get("all_time"))
+
+bus.subscribe("leaderboard.trade", on_leaderboard_trade)
 
 # API Routes
 
@@ -497,22 +663,56 @@ async def login_user(login_data: UserLogin):
     
     return user_obj
 
-@api_router.get("/users", response_model=List[User])
-async def get_users():
-    users = await db.users.find().to_list(1000)
-    return [User(**user) for user in users]
+# Utility function to page through the user directory
+async def list_user_summaries(response: Response, status: Optional[UserStatus] = None, role: Optional[str] = None,
+                              after: Optional[str] = None, limit: int = 100) -> List[UserSummary]:
+    """Keyset-paginated user summaries ordered by (created_at, id); next page cursor in X-Next-Cursor"""
+    limit = max(1, min(limit, 500))
+    query = {}
+    if status:
+        query["status"] = status
+    if role == "admin":
+        query["is_admin"] = True
+    elif role == "moderator":
+        query["is_moderator"] = True
+    elif role == "member":
+        query["is_admin"] = {"$ne": True}
+        query["is_moderator"] = {"$ne": True}
+    elif role:
+        raise HTTPException(status_code=400, detail="Role must be admin, moderator or member")
+    
+    if after:
+        created_at, _, user_id = after.partition("|")
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "id": {"$gt": user_id}}
+        ]
+    
+    users = await db.users.find(query, USER_SUMMARY_PROJECTION).sort([("created_at", 1), ("id", 1)]).limit(limit).to_list(limit)
+    if len(users) == limit:
+        last = users[-1]
+        response.headers["X-Next-Cursor"] = f"{last['created_at'].isoformat()}|{last['id']}"
+    return [UserSummary(**user) for user in users]
+
+@api_router.get("/users", response_model=List[UserSummary])
+async def get_users(response: Response, status: Optional[UserStatus] = None, role: Optional[str] = None,
+                    after: Optional[str] = None, limit: int = 100):
+    return await list_user_summaries(response, status, role, after, limit)
 
-@api_router.get("/users/pending", response_model=List[User])
-async def get_pending_users():
+@api_router.get("/users/pending", response_model=List[UserSummary])
+async def get_pending_users(response: Response, after: Optional[str] = None, limit: int = 100):
     """Get all users pending approval - admin only"""
-    users = await db.users.find({"status": UserStatus.PENDING}).to_list(1000)
-    return [User(**user) for user in users]
+    return await list_user_summaries(response, UserStatus.PENDING, None, after, limit)
 
 @api_router.post("/users/approve")
 async def approve_user(approval: UserApproval):
     """Approve or reject a user - admin only"""
     # Verify admin status (in production, use proper JWT auth)
-    admin = await db.users.find_one({"id": approval.admin_id})
+    admin = await get_user(approval.admin_id)
     if not admin or not admin.get("is_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
     
@@ -531,6 +731,7 @@ async def approve_user(approval: UserApproval):
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await invalidate_user(approval.user_id)
     
     # Get updated user
     user = await db.users.find_one({"id": approval.user_id})
@@ -545,12 +746,45 @@ async def approve_user(approval: UserApproval):
     
     return {"message": f"User {status_text} successfully"}
 
+# Messages whose search indexing failed, retried with the next batch (past the cap the oldest are dropped)
+search_retry: deque = deque(maxlen=int(os.environ.get("SEARCH_RETRY_MAX_PENDING", "10000")))
+
+# Utility function to index stored messages; the index is best effort and never fails the write
+async def index_for_search(messages: List[dict]):
+    pending = list(search_retry) + messages
+    search_retry.clear()
+    try:
+        await chat_search.add_many(pending)
+    except Exception:
+        logger.exception(f"Chat search indexing failed, {len(pending)} messages queued for retry")
+        search_retry.extend(pending)
+
+# Utility function to store chat messages and index them for search
+async def persist_messages(messages: List[dict]):
+    try:
+        await db.messages.insert_many(messages, ordered=False)
+    except BulkWriteError as e:
+        # A retried batch may already be partly stored; only duplicate ids are expected
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+    await index_for_search(messages)
+
+# Optional write-behind (MESSAGE_WRITE_BEHIND=1): messages are broadcast right away and stored in batches
+message_writer = WriteBehindQueue(
+    persist_messages,
+    max_batch=int(os.environ.get("MESSAGE_WRITE_BATCH", "500")),
+    max_delay=float(os.environ.get("MESSAGE_WRITE_DELAY_SECONDS", "0.05")),
+    max_pending=int(os.environ.get("MESSAGE_WRITE_MAX_PENDING", "10000")),
+    max_retries=int(os.environ.get("MESSAGE_WRITE_MAX_RETRIES", "10"))
+) if os.environ.get("MESSAGE_WRITE_BEHIND", "").lower() in ("1", "true", "yes") else None
+
 @api_router.post("/messages", response_model=Message)
 async def create_message(message_data: MessageCreate):
-    # Get user info
-    user = await db.users.find_one({"id": message_data.user_id})
+    # Get user info (cached); buckets are only created for real users
+    user = await get_user(message_data.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    await enforce_rate_limit("messages", message_data.user_id)
     
     # Check if user is approved
     if user.get("status") != UserStatus.APPROVED:
@@ -564,11 +798,16 @@ async def create_message(message_data: MessageCreate):
         username=user["username"],
         content=message_data.content,
         is_admin=user.get("is_admin", False),
-        avatar_url=user.get("avatar_url"),
+        # Chat renders small avatars, so use the thumbnail when there is one
+        avatar_url=(user.get("avatar_variants") or {}).get("64.webp", user.get("avatar_url")),
         highlighted_tickers=tickers
     )
     
-    await db.messages.insert_one(message.dict())
+    if message_writer:
+        await message_writer.put(message.dict())
+    else:
+        await persist_messages([message.dict()])
+    await bus.publish("chat.message", message.dict())
     
     # Broadcast message to all connected users
     await manager.broadcast(json.dumps({
@@ -578,57 +817,139 @@ async def create_message(message_data: MessageCreate):
     
     return message
 
+@api_router.get("/messages/search", response_model=List[Message])
+async def search_messages(q: str, response: Response, symbol: Optional[str] = None, user_id: Optional[str] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          sort: str = "relevance", limit: int = 20, cursor: Optional[str] = None):
+    """Ranked full-text chat search with ticker/user/date filters; next page cursor in X-Next-Cursor"""
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORTS)}")
+    limit = max(1, min(limit, 100))
+    try:
+        ids, next_cursor = await chat_search.search(
+            q, symbol=symbol.upper() if symbol else None, user_id=user_id,
+            since=since, until=until, sort=sort, limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return await load_messages_by_id(ids)
+
 @api_router.get("/messages", response_model=List[Message])
-async def get_messages(limit: int = 50):
-    messages = await db.messages.find().sort("timestamp", -1).limit(limit).to_list(limit)
-    # Reverse to show oldest first
+async def get_messages(limit: int = 50, before: Optional[str] = None, after: Optional[str] = None):
+    """Get chat history oldest first; page with before/after set to a message id"""
+    limit = max(1, min(limit, 100))
+    # Served from the in-memory buffer whenever it covers the requested window
+    if after:
+        cached = recent_messages.after(after, limit)
+    elif before:
+        cached = recent_messages.before(before, limit)
+    else:
+        cached = recent_messages.latest(limit)
+    if cached is not None:
+        return cached
+    
+    # Keyset query on (timestamp, id) anchored at the cursor message
+    query = {}
+    anchor_id = after or before
+    if anchor_id:
+        anchor = await db.messages.find_one({"id": anchor_id}, {"timestamp": 1, "id": 1})
+        if not anchor:
+            raise HTTPException(status_code=404, detail="Message not found")
+        op = "$gt" if after else "$lt"
+        query = {"$or": [
+            {"timestamp": {op: anchor["timestamp"]}},
+            {"timestamp": anchor["timestamp"], "id": {op: anchor["id"]}}
+        ]}
+    
+    direction = 1 if after else -1
+    messages = await db.messages.find(query).sort([("timestamp", direction), ("id", direction)]).limit(limit).to_list(limit)
+    if direction == -1:
+        # Reverse to show oldest first
+        messages.reverse()
+    return [Message(**message) for message in messages]
+
+@api_router.get("/tickers/trending")
+async def get_trending_tickers(window: str = "1h", limit: int = 10):
+    """Most mentioned $TICKERs in chat over a sliding window (5m, 1h or 24h)"""
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+    return {"window": window, "tickers": mention_index.trending(window, min(limit, 100))}
+
+@api_router.get("/tickers/{symbol}/messages", response_model=List[Message])
+async def get_ticker_messages(symbol: str, limit: int = 50, before: Optional[str] = None):
+    """Messages mentioning $SYMBOL oldest first; page back with before set to a message id"""
+    limit = max(1, min(limit, 100))
+    symbol = symbol.upper()
+    ids = mention_index.message_ids(symbol, limit, before)
+    if ids is not None:
+        return await load_messages_by_id(ids)
+    
+    # Older than the index retains: keyset query on the multikey (ticker, timestamp, id) index
+    query = {"highlighted_tickers": symbol}
+    if before:
+        anchor = await db.messages.find_one({"id": before}, {"timestamp": 1, "id": 1})
+        if not anchor:
+            raise HTTPException(status_code=404, detail="Message not found")
+        query["$or"] = [
+            {"timestamp": {"$lt": anchor["timestamp"]}},
+            {"timestamp": anchor["timestamp"], "id": {"$lt": anchor["id"]}}
+        ]
+    messages = await db.messages.find(query).sort([("timestamp", -1), ("id", -1)]).limit(limit).to_list(limit)
     messages.reverse()
     return [Message(**message) for message in messages]
 
 @api_router.post("/trades", response_model=PaperTrade)
 async def create_paper_trade(trade_data: PaperTradeCreate, user_id: str):
     """Create a new paper trade"""
-    # Verify user exists and is approved
-    user = await db.users.find_one({"id": user_id})
+    # Verify user exists and is approved (cached); buckets are only created for real users
+    user = await get_user(user_id)
     if not user or user.get("status") != UserStatus.APPROVED:
         raise HTTPException(status_code=403, detail="User not found or not approved")
+    await enforce_rate_limit("trades", user_id)
     
     trade = PaperTrade(
         user_id=user_id,
         **trade_data.dict()
     )
     
-    await db.paper_trades.insert_one(trade.dict())
-    
-    # Update or create position
-    await update_or_create_position(
-        user_id=user_id,
-        symbol=trade_data.symbol,
-        action=trade_data.action,
-        quantity=trade_data.quantity,
-        price=trade_data.price,
-        trade_id=trade.id,
-        stop_loss=trade_data.stop_loss,
-        take_profit=trade_data.take_profit
-    )
-    
-    # Update user performance metrics
-    performance = await calculate_user_performance(user_id)
-    await db.users.update_one(
-        {"id": user_id},
-        {"$set": performance}
-    )
+    # One user's trades are applied in order so positions, the ledger and stats agree
+    async with trade_lock(user_id):
+        # Update or create position first, so the trade is stored already linked to it
+        trade.position_id, trade.is_closed, fill = await update_or_create_position(
+            user_id=user_id,
+            symbol=trade_data.symbol,
+            action=trade_data.action,
+            quantity=trade_data.quantity,
+            price=trade_data.price,
+            trade_id=trade.id,
+            stop_loss=trade_data.stop_loss,
+            take_profit=trade_data.take_profit
+        )
+        if fill is not None:
+            # A SELL larger than the position only fills what was held
+            trade.quantity = fill.quantity
+        record_fill(trade, fill)
+        await db.paper_trades.insert_one(trade.dict())
+        
+        # Update user performance metrics
+        await record_trade_performance(trade)
+    await notify_positions_changed(user_id)
     
     return trade
 
 @api_router.get("/positions/{user_id}")
 async def get_user_positions(user_id: str):
     """Get all open positions for a user with current P&L"""
-    # Update P&L first
-    await update_positions_pnl(user_id)
-    
-    # Get updated positions
     positions = await db.positions.find({"user_id": user_id, "is_open": True}).to_list(1000)
+    
+    # Stop-loss/take-profit is handled by the background sweeper; here we only mark to market
+    prices = await quote_cache.get_prices(position["symbol"] for position in positions)
+    for position in positions:
+        position["current_price"] = prices[position["symbol"]]
+        position["unrealized_pnl"] = round((position["current_price"] - position["avg_price"]) * position["quantity"], 2)
     return [Position(**position) for position in positions]
 
 @api_router.post("/positions/{position_id}/close")
@@ -642,40 +963,43 @@ async def close_position(position_id: str, user_id: str, close_price: Optional[f
     if close_price is None:
         close_price = await get_current_stock_price(position["symbol"])
     
-    # Create a SELL trade to close the position
-    close_trade = PaperTrade(
-        user_id=user_id,
-        symbol=position["symbol"],
-        action="SELL",
-        quantity=position["quantity"],
-        price=close_price,
-        position_id=position_id,
-        is_closed=True,
-        notes=f"Position closed at market price"
-    )
-    
-    await db.paper_trades.insert_one(close_trade.dict())
-    
-    # Close the position
-    realized_pnl = (close_price - position["avg_price"]) * position["quantity"]
-    await db.positions.update_one(
-        {"id": position_id},
-        {"$set": {
-            "is_open": False,
-            "closed_at": datetime.utcnow(),
-            "current_price": close_price,
-            "unrealized_pnl": round(realized_pnl, 2)
-        }}
-    )
-    
-    # Update user performance metrics
-    performance = await calculate_user_performance(user_id)
-    await db.users.update_one(
-        {"id": user_id},
-        {"$set": performance}
-    )
+    async with trade_lock(user_id):
+        # Create a SELL trade for every share, matched against the position's lots
+        close_trade = PaperTrade(
+            user_id=user_id,
+            symbol=position["symbol"],
+            action="SELL",
+            quantity=position["quantity"],
+            price=close_price,
+            position_id=position_id,
+            is_closed=True,
+            notes=f"Position closed at market price"
+        )
+        _, _, fill = await update_or_create_position(
+            user_id=user_id,
+            symbol=position["symbol"],
+            action="SELL",
+            quantity=None,
+            price=close_price,
+            trade_id=close_trade.id,
+            close_fields={"current_price": close_price}
+        )
+        if fill is None:
+            raise HTTPException(status_code=404, detail="Position not found")
+        close_trade.quantity = fill.quantity
+        record_fill(close_trade, fill)
+        await db.paper_trades.insert_one(close_trade.dict())
+        
+        # Update user performance metrics
+        await record_trade_performance(close_trade)
+    await notify_positions_changed(user_id)
     
-    return {"message": "Position closed successfully", "realized_pnl": round(realized_pnl, 2)}
+    return {"message": "Position closed successfully", "realized_pnl": close_trade.realized_pnl}
+
+@api_router.get("/stock-price/cache/stats")
+async def get_stock_price_cache_stats():
+    """Hit/miss counters for the shared quote cache"""
+    return quote_cache.stats()
 
 @api_router.get("/stock-price/{symbol}")
 async def get_stock_price(symbol: str):
@@ -689,36 +1013,100 @@ async def get_user_trades(user_id: str):
     trades = await db.paper_trades.find({"user_id": user_id}).sort("timestamp", -1).to_list(1000)
     return [PaperTrade(**trade) for trade in trades]
 
+@api_router.get("/trades/{user_id}/export")
+async def export_user_trades(user_id: str, format: str = "ndjson"):
+    """Stream a user's full trade history, oldest first, as NDJSON, CSV or Parquet"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed on the server")
+    
+    # Rows go from the cursor to the client batch by batch, so memory stays flat for any history length
+    cursor = db.paper_trades.find({"user_id": user_id}, EXPORT_PROJECTION).sort("timestamp", 1).batch_size(
+        int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+    )
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        export_chunks(cursor, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="trades-{user_id}.{extension}"'}
+    )
+
 @api_router.post("/users/{user_id}/avatar-upload")
 async def upload_avatar_file(user_id: str, file: UploadFile = File(...)):
     """Upload profile picture file"""
-    user = await db.users.find_one({"id": user_id})
+    user = await get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Validate file type
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    # Read and process file
-    file_content = await file.read()
-    avatar_url = process_uploaded_image(file_content)
+    # Validate and store file
+    image = await store_uploaded_image(file)
+    avatar_url = image["variants"]["256.webp"]
     
     # Update user avatar
     result = await db.users.update_one(
         {"id": user_id},
-        {"$set": {"avatar_url": avatar_url}}
+        {"$set": {"avatar_url": avatar_url, "avatar_variants": image["variants"]}}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Failed to update avatar")
+    await invalidate_user(user_id)
     
     return {"message": "Avatar updated successfully", "avatar_url": avatar_url}
 
+@api_router.get("/blobs/{digest}")
+async def get_blob(digest: str, request: Request):
+    """Stream a stored upload, with ETag revalidation and byte-range support"""
+    blob = await blob_store.stat(digest)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    
+    etag = f'"{blob.digest}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content-addressed, so the bytes behind a URL never change
+        "Cache-Control": "public, max-age=31536000, immutable",
+        # Blobs are served from the API origin: never let a browser sniff or run them
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "default-src 'none'"
+    }
+    if blob.content_type not in ALLOWED_IMAGE_TYPES:
+        headers["Content-Disposition"] = "attachment"
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    start, end = 0, blob.size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header and range_header.startswith("bytes=") and "," not in range_header:
+        first, _, last = range_header[len("bytes="):].partition("-")
+        try:
+            if first:
+                start = int(first)
+                end = min(int(last), blob.size - 1) if last else blob.size - 1
+            else:
+                start = max(blob.size - int(last), 0)
+        except ValueError:
+            raise HTTPException(status_code=416, detail="Invalid range")
+        if start > end or start >= blob.size:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{blob.size}"})
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+    
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob_store.open_range(blob.digest, start, end),
+        status_code=status_code,
+        media_type=blob.content_type,
+        headers=headers
+    )
+
 @api_router.post("/users/{user_id}/change-password")
 async def change_password(user_id: str, password_data: PasswordChange):
     """Change user password"""
-    user = await db.users.find_one({"id": user_id})
+    user = await get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -737,13 +1125,14 @@ async def change_password(user_id: str, password_data: PasswordChange):
     
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Failed to update password")
+    await invalidate_user(user_id)
     
     return {"message": "Password updated successfully"}
 
 @api_router.post("/users/{user_id}/avatar")
 async def upload_avatar(user_id: str, avatar_url: str):
     """Update user avatar URL (legacy endpoint)"""
-    user = await db.users.find_one({"id": user_id})
+    user = await get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -754,13 +1143,14 @@ async def upload_avatar(user_id: str, avatar_url: str):
     
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Failed to update avatar")
+    await invalidate_user(user_id)
     
     return {"message": "Avatar updated successfully"}
 
 @api_router.put("/users/{user_id}/profile")
 async def update_profile(user_id: str, profile_data: dict):
     """Update user profile information"""
-    user = await db.users.find_one({"id": user_id})
+    user = await get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -776,16 +1166,120 @@ async def update_profile(user_id: str, profile_data: dict):
         
         if result.modified_count == 0:
             raise HTTPException(status_code=400, detail="Failed to update profile")
+        await invalidate_user(user_id)
     
     # Return updated user
     updated_user = await db.users.find_one({"id": user_id})
     return User(**updated_user)
 
+@api_router.get("/admin/query-plans")
+async def get_query_plans(admin_id: str):
+    """Explain each hot query and flag collection scans - admin only"""
+    admin = await get_user(admin_id)
+    if not admin or not admin.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    plans = await explain_hot_queries(db)
+    return {"collscans": sum(1 for plan in plans if plan["collscan"]), "queries": plans}
+
+@api_router.get("/users/cache/stats")
+async def get_user_cache_stats():
+    """Hit rate and size of the user record cache"""
+    return user_cache.stats()
+
+@api_router.get("/messages/writer/stats")
+async def get_message_writer_stats():
+    """Queue depth and batch counters for write-behind message persistence"""
+    if not message_writer:
+        return {"enabled": False}
+    return {"enabled": True, **message_writer.stats()}
+
+@api_router.get("/rate-limit/stats")
+async def get_rate_limit_stats():
+    """Allowed/limited counters for per-user rate limiting"""
+    return rate_limiter.stats()
+
+@api_router.get("/ws/metrics")
+async def get_websocket_metrics():
+    """Queue depth and dropped-frame counters for WebSocket fan-out"""
+    return manager.metrics()
+
 @api_router.get("/users/{user_id}/performance")
 async def get_user_performance(user_id: str):
     """Get performance metrics for a user"""
     return await calculate_user_performance(user_id)
 
+@api_router.get("/users/{user_id}/performance/analytics")
+async def get_user_performance_analytics(user_id: str):
+    """Equity curve, drawdown, Sharpe/Sortino, profit factor, per-symbol breakdown and holding times"""
+    return await get_user_analytics(db, analytics_cache, user_id, ANALYTICS_STARTING_EQUITY)
+
+# Utility function to check leaderboard query parameters
+def check_leaderboard_params(window: str, metric: str = METRICS[0]):
+    if window not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(LEADERBOARD_WINDOWS)}")
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(METRICS)}")
+
+@api_router.get("/leaderboard")
+async def get_leaderboard(response: Response, metric: str = "total_profit", window: str = "all",
+                          limit: int = 25, cursor: Optional[str] = None):
+    """Top traders by metric and window; next page cursor in X-Next-Cursor"""
+    check_leaderboard_params(window, metric)
+    limit = max(1, min(limit, 100))
+    offset = int(cursor) if cursor and cursor.isdigit() else 0
+    rows = leaderboard.top(window, metric, offset, limit + 1)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(offset + limit)
+    
+    users = await asyncio.gather(*(get_user(user_id) for _, user_id, _ in rows))
+    return [
+        {
+            "rank": rank,
+            "user_id": user_id,
+            "username": user["username"] if user else None,
+            "avatar_url": user.get("avatar_url") if user else None,
+            metric: value
+        }
+        for (rank, user_id, value), user in zip(rows, users)
+    ]
+
+@api_router.get("/leaderboard/{user_id}")
+async def get_leaderboard_rank(user_id: str, window: str = "all"):
+    """A user's rank and value for every metric in a window"""
+    check_leaderboard_params(window)
+    ranks = leaderboard.rank(window, user_id)
+    return {
+        "user_id": user_id,
+        "window": window,
+        "traders": len(leaderboard.board(window)),
+        "ranks": {
+            metric: {"rank": found[0], "value": found[1]} if found else None
+            for metric, found in ranks.items()
+        }
+    }
+
+@api_router.get("/analytics/cache/stats")
+async def get_analytics_cache_stats():
+    """Hit/miss counters for the per-user analytics cache"""
+    return analytics_cache.stats()
+
+# Create indexes for the hot queries on startup
+# Start the bus before the other startup hooks, since the migrations publish cache invalidations
+@app.on_event("startup")
+async def start_bus():
+    await bus.start()
+
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes(db)
+
+# Move legacy inline images out of user and message documents on startup
+@app.on_event("startup")
+async def migrate_avatars():
+    await migrate_inline_avatars()
+
 # Create default admin user on startup
 @app.on_event("startup")
 async def create_default_admin():
@@ -802,10 +1296,38 @@ async def create_default_admin():
         await db.users.insert_one(admin_user.dict())
         print("Created default admin user: admin")
 
+# Fire-and-forget startup work; the event loop only keeps weak references to tasks
+background_tasks = set()
+
+# Index messages stored while this host's search index wasn't being updated
+async def sync_chat_search():
+    try:
+        added = await sync_from_db(chat_search, db)
+        if added:
+            logger.info(f"Indexed {added} messages for chat search")
+    except Exception:
+        logger.exception("Chat search index sync failed")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    trigger_book.load(await load_trigger_positions())
+    await load_recent_messages()
+    await load_mention_index()
+    await rebuild_leaderboard(db, leaderboard)
+    task = asyncio.create_task(sync_chat_search())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    position_sweeper.start()
+    position_streamer.start()
+    if message_writer:
+        message_writer.start()
+
 # WebSocket endpoint
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await manager.connect(websocket, user_id)
+    user = await get_user(user_id)
+    await manager.connect(websocket, user_id, roles=user_roles(user or {}))
+    await position_streamer.watch(user_id)
     logger.info(f"WebSocket connected for user: {user_id}")
     
     try:
@@ -829,6 +1351,8 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for user: {user_id}")
         manager.disconnect(websocket, user_id)
+        if user_id not in manager.user_connections:
+            position_streamer.unwatch(user_id)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -839,6 +1363,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 # Configure logging
@@ -850,4 +1375,14 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await position_sweeper.stop()
+    await position_streamer.stop()
+    await bus.stop()
+    image_pipeline.shutdown()
+    for task in list(background_tasks):
+        task.cancel()
+    if message_writer:
+        # Every acknowledged message is stored before the client goes away
+        await message_writer.stop()
+    await chat_search.close()
     client.close()
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import re
+import sys
+from pathlib import Path
+from typing import FrozenSet, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+# "$TSLA": a dollar sign and 1-5 capital letters, not running on into a longer word
+TICKER_PATTERN = re.compile(r"\$([A-Z]{1,5})(?![A-Za-z])")
+
+
+def load_symbol_universe(path: Optional[str]) -> Optional[FrozenSet[str]]:
+    """Read listed symbols from a file with one symbol per line ('#' starts a comment)"""
+    if not path:
+        return None
+    symbols = set()
+    with open(path) as f:
+        for line in f:
+            symbol = line.split("#", 1)[0].strip().upper()
+            if symbol:
+                symbols.add(symbol)
+    return frozenset(symbols)
+
+
+class TickerExtractor:
+    """Finds $TICKER mentions in chat text, deduped in first-seen order.
+
+    With a symbol universe, mentions of symbols that aren't listed are dropped.
+    """
+
+    def __init__(self, universe: Optional[FrozenSet[str]] = None):
+        self.universe = universe
+
+    def extract(self, content: str) -> List[str]:
+        # Most messages mention no ticker at all
+        if "$" not in content:
+            return []
+        seen = {}
+        universe = self.universe
+        for symbol in TICKER_PATTERN.findall(content):
+            if universe is None or symbol in universe:
+                seen[symbol] = None
+        return list(seen)
+
+    def extract_many(self, contents: Iterable[str]) -> List[List[str]]:
+        extract = self.extract
+        return [extract(content) for content in contents]
+
+
+async def backfill_message_tickers(db, extractor: TickerExtractor, batch_size: int = 1000) -> int:
+    """Recompute highlighted_tickers on stored messages; returns how many changed"""
+    changed = 0
+    batch = []
+
+    async def flush():
+        nonlocal changed
+        tickers = extractor.extract_many(message.get("content", "") for message in batch)
+        updates = [
+            UpdateOne({"_id": message["_id"]}, {"$set": {"highlighted_tickers": found}})
+            for message, found in zip(batch, tickers)
+            if message.get("highlighted_tickers") != found
+        ]
+        if updates:
+            await db.messages.bulk_write(updates, ordered=False)
+            changed += len(updates)
+        batch.clear()
+
+    async for message in db.messages.find({}, {"content": 1, "highlighted_tickers": 1}).batch_size(batch_size):
+        batch.append(message)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return changed
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    extractor = TickerExtractor(load_symbol_universe(os.environ.get("SYMBOL_UNIVERSE_FILE")))
+    print(f"Updated tickers on {await backfill_message_tickers(db, extractor)} messages")
+    client.close()
+
+
+if __name__ == "__main__":
+    # python tickers.py --backfill
+    if "--backfill" in sys.argv[1:]:
+        asyncio.run(_main())
@@ -0,0 +1,124 @@
+import csv
+import importlib.util
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, List
+
+EXPORT_FIELDS = [
+    "id", "timestamp", "symbol", "action", "quantity", "price", "realized_pnl", "matched_lots",
+    "position_id", "is_closed", "stop_loss", "take_profit", "notes",
+]
+
+EXPORT_PROJECTION = {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}}
+
+# format -> (media type, file extension)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def parquet_available() -> bool:
+    """Parquet export needs the optional pyarrow package"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def _batches(trades: AsyncIterable[dict], size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for trade in trades:
+        batch.append({field: trade.get(field) for field in EXPORT_FIELDS})
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_chunks(trades: AsyncIterable[dict], rows_per_chunk: int = 1000) -> AsyncIterator[bytes]:
+    """One JSON object per line"""
+    async for batch in _batches(trades, rows_per_chunk):
+        yield "".join(json.dumps(row, default=_json_default) + "\n" for row in batch).encode()
+
+
+async def csv_chunks(trades: AsyncIterable[dict], rows_per_chunk: int = 1000) -> AsyncIterator[bytes]:
+    """CSV with a header row; matched_lots is written as a JSON string"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    async for batch in _batches(trades, rows_per_chunk):
+        for row in batch:
+            if isinstance(row["timestamp"], datetime):
+                row["timestamp"] = row["timestamp"].isoformat()
+            if row["matched_lots"] is not None:
+                row["matched_lots"] = json.dumps(row["matched_lots"])
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def parquet_chunks(trades: AsyncIterable[dict], rows_per_group: int = 50000) -> AsyncIterator[bytes]:
+    """Parquet with one row group per batch, so only one batch is ever held in memory"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.string()), ("timestamp", pa.timestamp("us")), ("symbol", pa.string()),
+        ("action", pa.string()), ("quantity", pa.int64()), ("price", pa.float64()),
+        ("realized_pnl", pa.float64()), ("matched_lots", pa.string()), ("position_id", pa.string()),
+        ("is_closed", pa.bool_()), ("stop_loss", pa.float64()), ("take_profit", pa.float64()), ("notes", pa.string()),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    async for batch in _batches(trades, rows_per_group):
+        columns = {field: [row[field] for row in batch] for field in EXPORT_FIELDS}
+        columns["matched_lots"] = [json.dumps(value) if value is not None else None for value in columns["matched_lots"]]
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(trades: AsyncIterable[dict], export_format: str) -> AsyncIterator[bytes]:
+    if export_format == "ndjson":
+        return ndjson_chunks(trades)
+    if export_format == "csv":
+        return csv_chunks(trades)
+    if export_format == "parquet":
+        return parquet_chunks(trades)
+    raise ValueError(f"Unknown export format: {export_format}")
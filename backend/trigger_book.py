@@ -0,0 +1,112 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Fields of an open position the book keeps so a triggered close needs no extra lookup
+ENTRY_FIELDS = ("id", "user_id", "symbol", "quantity", "avg_price", "stop_loss", "take_profit")
+
+
+class _LevelIndex:
+    """Sorted price levels with the position id stored at the same offset"""
+
+    def __init__(self):
+        self.levels: List[float] = []
+        self.ids: List[str] = []
+
+    def add(self, level: float, position_id: str):
+        i = bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.ids.insert(i, position_id)
+
+    def remove(self, level: float, position_id: str):
+        i = bisect_left(self.levels, level)
+        while i < len(self.levels) and self.levels[i] == level:
+            if self.ids[i] == position_id:
+                del self.levels[i]
+                del self.ids[i]
+                return
+            i += 1
+
+    def at_or_above(self, price: float) -> List[str]:
+        return self.ids[bisect_left(self.levels, price):]
+
+    def at_or_below(self, price: float) -> List[str]:
+        return self.ids[:bisect_right(self.levels, price)]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class _SymbolBook:
+    def __init__(self):
+        self.stops = _LevelIndex()
+        self.takes = _LevelIndex()
+
+
+class TriggerBook:
+    """In-memory per-symbol index of open positions' stop-loss and take-profit levels"""
+
+    def __init__(self):
+        self._books: Dict[str, _SymbolBook] = {}
+        self._entries: Dict[str, dict] = {}
+
+    def load(self, positions: Iterable[dict]):
+        """Replace the book's contents, e.g. from db.positions at startup"""
+        self._books.clear()
+        self._entries.clear()
+        for position in positions:
+            self.upsert(position)
+
+    def upsert(self, position: dict):
+        """Add an open position or apply a change to its quantity, cost or levels"""
+        self.remove(position["id"])
+        # Unset (or zero) levels never trigger
+        if not (position.get("stop_loss") or position.get("take_profit")):
+            return
+
+        entry = {field: position.get(field) for field in ENTRY_FIELDS}
+        self._entries[entry["id"]] = entry
+        book = self._books.setdefault(entry["symbol"], _SymbolBook())
+        if entry["stop_loss"]:
+            book.stops.add(entry["stop_loss"], entry["id"])
+        if entry["take_profit"]:
+            book.takes.add(entry["take_profit"], entry["id"])
+
+    def remove(self, position_id: str) -> Optional[dict]:
+        entry = self._entries.pop(position_id, None)
+        if entry is None:
+            return None
+
+        book = self._books[entry["symbol"]]
+        if entry["stop_loss"]:
+            book.stops.remove(entry["stop_loss"], position_id)
+        if entry["take_profit"]:
+            book.takes.remove(entry["take_profit"], position_id)
+        if not book.stops and not book.takes:
+            del self._books[entry["symbol"]]
+        return entry
+
+    def get(self, position_id: str) -> Optional[dict]:
+        return self._entries.get(position_id)
+
+    def symbols(self) -> List[str]:
+        return list(self._books)
+
+    def crossed(self, symbol: str, price: float) -> List[Tuple[dict, str]]:
+        """Positions whose levels the price has crossed, in O(log n + k); stop-loss wins ties"""
+        book = self._books.get(symbol)
+        if book is None:
+            return []
+
+        stop_ids = book.stops.at_or_above(price)
+        triggered = [(self._entries[position_id], "STOP_LOSS") for position_id in stop_ids]
+        stopped = set(stop_ids)
+        triggered.extend(
+            (self._entries[position_id], "TAKE_PROFIT")
+            for position_id in book.takes.at_or_below(price)
+            if position_id not in stopped
+        )
+        return triggered
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class UserCache:
+    """In-process cache of user records for existence/approval/role checks.
+
+    Entries expire after `ttl` seconds and the least recently used are evicted past
+    `max_entries`. Every write path that mutates a user must call invalidate(); a load
+    that was in flight when the user was invalidated is discarded rather than cached.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Awaitable[Optional[dict]]],
+        ttl: float = 30.0,
+        max_entries: int = 10000,
+        clock=time.monotonic,
+    ):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        # user_id -> (user document, loaded_at), most recently used last
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # user_id -> loads in flight; only these users need invalidations counted
+        self._loading: Dict[str, int] = {}
+        # user_id -> invalidations seen while a load was in flight, used to discard that load
+        self._versions: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            user, loaded_at = entry
+            if self._clock() - loaded_at <= self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return dict(user)
+            del self._entries[user_id]
+
+        self.misses += 1
+        version = self._versions.get(user_id, 0)
+        self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        try:
+            user = await self.loader(user_id)
+        finally:
+            raced = self._versions.get(user_id, 0) != version
+            self._loading[user_id] -= 1
+            if not self._loading[user_id]:
+                # Last load for this user: its counters go too, so they stay bounded by loads in flight
+                del self._loading[user_id]
+                self._versions.pop(user_id, None)
+        # Unknown users aren't cached, so a fresh registration is visible immediately
+        if user is not None and not raced:
+            self._entries[user_id] = (user, self._clock())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return dict(user) if user is not None else None
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+        if user_id in self._loading:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        self.invalidations += 1
+
+    def clear(self):
+        for user_id in list(self._entries):
+            self.invalidate(user_id)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
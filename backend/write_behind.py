@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Queued by stop(): the writer flushes what it has and exits
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Bounded queue of documents written in batches by a background task.
+
+    A batch is flushed once it reaches `max_batch` documents or its first document has waited
+    `max_delay` seconds. put() blocks while `max_pending` documents are waiting, so a stalled
+    database slows producers down instead of growing memory. Failed batches are retried whole,
+    so `flush` must tolerate a batch that was partly stored before it failed; after `max_retries`
+    retries the batch is logged and dropped, so one bad batch can't wedge the writer.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[dict]], Awaitable[None]],
+        max_batch: int = 500,
+        max_delay: float = 0.05,
+        max_pending: int = 10000,
+        max_retries: int = 10,
+        retry_delay: float = 0.1,
+    ):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, document: dict):
+        await self._queue.put(document)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not batch:
+                    document = await self._queue.get()
+                elif not self._queue.empty():
+                    document = self._queue.get_nowait()
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        document = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if document is _STOP:
+                    stopping = True
+                    break
+                batch.append(document)
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch: List[dict]):
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.flush(batch)
+                break
+            except Exception:
+                self.failures += 1
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    ids = [document.get("id") for document in batch]
+                    logger.exception(f"Write-behind flush of {len(batch)} documents failed {attempt + 1} times; dropping ids {ids}")
+                    return
+                logger.exception(f"Write-behind flush of {len(batch)} documents failed; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+        self.written += len(batch)
+        self.batches += 1
+
+    async def stop(self, timeout: float = 30.0):
+        """Flush everything still queued, then stop the writer"""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        try:
+            # Behind every document already queued, so those are written first
+            await asyncio.wait_for(self._queue.put(_STOP), timeout)
+            await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Write-behind stopped with {self._queue.qsize()} documents unflushed")
+            task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "max_pending": self.max_pending,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped
+        }
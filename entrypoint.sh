@@ -6,7 +6,22 @@ cd /backend || { echo "Backend directory not found"; exit 1; }
 
 echo "Starting FastAPI backend"
 # Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+# More than one worker needs a shared broadcast bus so WebSocket frames reach every process,
+# and shared rate-limit buckets so a user's limit isn't multiplied by the worker count
+UVICORN_WORKERS=${UVICORN_WORKERS:-1}
+case "$UVICORN_WORKERS" in
+    ''|*[!0-9]*|0)
+        echo "UVICORN_WORKERS must be a positive integer, got '$UVICORN_WORKERS'"
+        exit 1
+        ;;
+esac
+if [ "$UVICORN_WORKERS" -gt 1 ] && [ -z "$BROADCAST_BUS" ]; then
+    export BROADCAST_BUS=mongo
+fi
+if [ "$UVICORN_WORKERS" -gt 1 ] && [ -z "$RATE_LIMIT_BACKEND" ]; then
+    export RATE_LIMIT_BACKEND=mongo
+fi
+uvicorn server:app --host 0.0.0.0 --port 8001 --workers "$UVICORN_WORKERS" &
 BACKEND_PID=$!
 
 echo "Waiting for backend to start..."
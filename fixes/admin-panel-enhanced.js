@@ -29,8 +29,16 @@ const AdminPanel = ({
 
   const loadAllUsers = async () => {
     try {
-      const response = await axios.get(`${API}/users/all?admin_id=${currentUser.id}`);
-      setAllUsers(response.data);
+      // The list is paged: follow X-Next-Cursor until every user is loaded
+      const users = [];
+      let after = null;
+      do {
+        const query = after ? `&after=${encodeURIComponent(after)}` : '';
+        const response = await axios.get(`${API}/users/all?admin_id=${currentUser.id}${query}`);
+        users.push(...response.data);
+        after = response.headers['x-next-cursor'];
+      } while (after);
+      setAllUsers(users);
     } catch (error) {
       console.error('Error loading users:', error);
     }
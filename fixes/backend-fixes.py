@@ -11,7 +11,8 @@ class User(BaseModel):
     is_moderator: bool = False  # New moderator role
     status: UserStatus = UserStatus.PENDING
     avatar_url: Optional[str] = None
-    avatar_file: Optional[str] = None  # Store base64 image data
+    avatar_variants: Optional[Dict[str, str]] = None  # "64.webp" -> URL, etc.
+    avatar_file: Optional[str] = None  # Legacy base64 image data, migrated to the blob store
     total_profit: float = 0.0
     win_percentage: float = 0.0
     trades_count: int = 0
@@ -69,71 +70,59 @@ class Position(BaseModel):
     closed_at: Optional[datetime] = None
     notes: Optional[str] = None
     auto_close_reason: Optional[str] = None
+    realized_pnl: float = 0.0  # Summed over this position's SELLs
+    lots: Optional[List[dict]] = None  # Open lots [{"trade_id", "quantity", "price"}]
+    cost_method: str = "fifo"  # "fifo", "lifo" or "average"; fixed when the position opens
+    version: int = 0
 
 # 6. New API Endpoints
 
 @api_router.post("/users/upload-avatar")
 async def upload_user_avatar(user_id: str, file: UploadFile = File(...)):
     """Upload profile picture file - ONLY file upload, no URL"""
-    user = await db.users.find_one({"id": user_id})
+    user = await get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Validate file type and size
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    file_content = await file.read()
-    if len(file_content) > 2 * 1024 * 1024:  # 2MB limit
-        raise HTTPException(status_code=400, detail="Image too large (max 2MB)")
-    
-    # Convert to base64 data URL
-    base64_content = base64.b64encode(file_content).decode('utf-8')
-    file_type = file.content_type.split('/')[-1]
-    avatar_data = f"data:image/{file_type};base64,{base64_content}"
+    # Validate and stream into the blob store (2MB limit); the user keeps only the URL
+    image = await store_uploaded_image(file, max_size=2 * 1024 * 1024)
+    avatar_url = image["variants"]["256.webp"]
     
     # Update user avatar
     result = await db.users.update_one(
         {"id": user_id},
-        {"$set": {"avatar_file": avatar_data, "avatar_url": avatar_data}}
+        {"$set": {"avatar_url": avatar_url, "avatar_variants": image["variants"]}, "$unset": {"avatar_file": ""}}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=400, detail="Failed to update avatar")
+    await invalidate_user(user_id)
     
-    return {"message": "Avatar updated successfully", "avatar_url": avatar_data}
+    return {"message": "Avatar updated successfully", "avatar_url": avatar_url}
 
 @api_router.post("/users/upload-message-image")
 async def upload_message_image(user_id: str, file: UploadFile = File(...)):
     """Upload image for chat message"""
-    # Similar validation as avatar upload
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    file_content = await file.read()
-    if len(file_content) > 5 * 1024 * 1024:  # 5MB limit for chat images
-        raise HTTPException(status_code=400, detail="Image too large (max 5MB)")
+    # 5MB limit for chat images; messages reference the blob URL instead of inline base64
+    image = await store_uploaded_image(file, max_size=5 * 1024 * 1024)
     
-    base64_content = base64.b64encode(file_content).decode('utf-8')
-    file_type = file.content_type.split('/')[-1]
-    image_data = f"data:image/{file_type};base64,{base64_content}"
-    
-    return {"image_url": image_data}
+    # Chat shows the 1024px rendition; the original stays available at image["url"]
+    return {"image_url": image["variants"]["1024.webp"], "variants": image["variants"]}
 
-@api_router.get("/users/all")
-async def get_all_users_admin(admin_id: str):
-    """Get all users with online status - Admin only"""
-    admin = await db.users.find_one({"id": admin_id})
+@api_router.get("/users/all", response_model=List[UserSummary])
+async def get_all_users_admin(admin_id: str, response: Response, status: Optional[UserStatus] = None,
+                              role: Optional[str] = None, after: Optional[str] = None, limit: int = 100):
+    """Get all users with online status - Admin only (paged, next cursor in X-Next-Cursor)"""
+    admin = await get_user(admin_id)
     if not admin or not (admin.get("is_admin") or admin.get("is_moderator")):
         raise HTTPException(status_code=403, detail="Admin/Moderator access required")
     
-    users = await db.users.find().to_list(1000)
-    return [User(**user) for user in users]
+    return await list_user_summaries(response, status, role, after, limit)
 
 @api_router.post("/users/{user_id}/set-role")
 async def set_user_role(user_id: str, role_data: dict, admin_id: str):
     """Set user role (member/moderator/admin) - Admin only"""
-    admin = await db.users.find_one({"id": admin_id})
+    admin = await get_user(admin_id)
     if not admin or not admin.get("is_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
     
@@ -151,12 +140,16 @@ async def set_user_role(user_id: str, role_data: dict, admin_id: str):
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    # Keep the in-memory admin/moderator routing index and user cache in step with the new role
+    await manager.update_user_roles(user_id, user_roles(update_data))
+    await invalidate_user(user_id)
+    
     return {"message": f"User role updated to {role}"}
 
 @api_router.delete("/users/{user_id}")
 async def remove_user(user_id: str, admin_id: str):
     """Remove user from app - Admin only"""
-    admin = await db.users.find_one({"id": admin_id})
+    admin = await get_user(admin_id)
     if not admin or not admin.get("is_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
     
@@ -164,97 +157,90 @@ async def remove_user(user_id: str, admin_id: str):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    await manager.update_user_roles(user_id, [])
+    await invalidate_user(user_id)
+    
     return {"message": "User removed successfully"}
 
 @api_router.post("/positions/{position_id}/add-shares")
 async def add_shares_to_position(position_id: str, trade_data: dict, user_id: str):
     """Add more shares to existing position"""
-    position = await db.positions.find_one({"id": position_id, "user_id": user_id})
+    position = await db.positions.find_one({"id": position_id, "user_id": user_id, "is_open": True})
     if not position:
         raise HTTPException(status_code=404, detail="Position not found")
     
-    additional_quantity = trade_data.get("quantity", 0)
-    additional_price = trade_data.get("price", 0)
-    
-    # Calculate new average price
-    current_value = position["quantity"] * position["avg_price"]
-    additional_value = additional_quantity * additional_price
-    new_quantity = position["quantity"] + additional_quantity
-    new_avg_price = (current_value + additional_value) / new_quantity
-    
-    # Update position
-    await db.positions.update_one(
-        {"id": position_id},
-        {"$set": {
-            "quantity": new_quantity,
-            "avg_price": round(new_avg_price, 2)
-        }}
-    )
-    
     # Create trade record
     trade = PaperTrade(
         user_id=user_id,
         symbol=position["symbol"],
         action="BUY",
-        quantity=additional_quantity,
-        price=additional_price,
+        quantity=trade_data.get("quantity", 0),
+        price=trade_data.get("price", 0),
         position_id=position_id,
         notes=f"Added to existing position"
     )
-    await db.paper_trades.insert_one(trade.dict())
     
-    return {"message": "Shares added successfully", "new_avg_price": new_avg_price}
+    # The new shares become their own lot; the position's average price is kept up to date
+    async with trade_lock(user_id):
+        await update_or_create_position(
+            user_id=user_id,
+            symbol=position["symbol"],
+            action="BUY",
+            quantity=trade.quantity,
+            price=trade.price,
+            trade_id=trade.id
+        )
+        await db.paper_trades.insert_one(trade.dict())
+        await record_trade_performance(trade)
+    await notify_positions_changed(user_id)
+    
+    position = await db.positions.find_one({"id": position_id}, {"_id": 0, "avg_price": 1})
+    return {"message": "Shares added successfully", "new_avg_price": position["avg_price"]}
 
 @api_router.post("/positions/{position_id}/sell-shares")
 async def sell_shares_from_position(position_id: str, trade_data: dict, user_id: str):
     """Sell shares from existing position"""
-    position = await db.positions.find_one({"id": position_id, "user_id": user_id})
+    position = await db.positions.find_one({"id": position_id, "user_id": user_id, "is_open": True})
     if not position:
         raise HTTPException(status_code=404, detail="Position not found")
     
     sell_quantity = trade_data.get("quantity", 0)
     sell_price = trade_data.get("price", 0)
     
-    if sell_quantity > position["quantity"]:
-        raise HTTPException(status_code=400, detail="Cannot sell more shares than owned")
-    
-    # Calculate realized P&L
-    realized_pnl = (sell_price - position["avg_price"]) * sell_quantity
-    
-    # Update position
-    new_quantity = position["quantity"] - sell_quantity
-    if new_quantity == 0:
-        # Close position completely
-        await db.positions.update_one(
-            {"id": position_id},
-            {"$set": {
-                "quantity": 0,
-                "is_open": False,
-                "closed_at": datetime.utcnow(),
-                "auto_close_reason": "MANUAL_SELL"
-            }}
+    async with trade_lock(user_id):
+        position = await db.positions.find_one({"id": position_id, "is_open": True}, {"_id": 0, "symbol": 1, "quantity": 1})
+        if not position or sell_quantity > position["quantity"]:
+            raise HTTPException(status_code=400, detail="Cannot sell more shares than owned")
+        
+        # Realized P&L comes from the lots the sale is matched against
+        trade = PaperTrade(
+            user_id=user_id,
+            symbol=position["symbol"],
+            action="SELL",
+            quantity=sell_quantity,
+            price=sell_price,
+            position_id=position_id
         )
-    else:
-        # Partial sell
-        await db.positions.update_one(
-            {"id": position_id},
-            {"$set": {"quantity": new_quantity}}
+        _, trade.is_closed, fill = await update_or_create_position(
+            user_id=user_id,
+            symbol=trade.symbol,
+            action="SELL",
+            quantity=sell_quantity,
+            price=sell_price,
+            trade_id=trade.id,
+            close_fields={"auto_close_reason": "MANUAL_SELL"}
         )
+        if fill is None:
+            # The sweeper closed the position first; nothing was sold
+            raise HTTPException(status_code=404, detail="Position not found")
+        trade.quantity = fill.quantity
+        record_fill(trade, fill)
+        trade.notes = f"Sold from position - P&L: ${trade.realized_pnl:.2f}"
+        await db.paper_trades.insert_one(trade.dict())
+        await record_trade_performance(trade)
+    await notify_positions_changed(user_id)
     
-    # Create trade record
-    trade = PaperTrade(
-        user_id=user_id,
-        symbol=position["symbol"],
-        action="SELL",
-        quantity=sell_quantity,
-        price=sell_price,
-        position_id=position_id,
-        notes=f"Sold from position - P&L: ${realized_pnl:.2f}",
-        is_closed=new_quantity == 0
-    )
-    await db.paper_trades.insert_one(trade.dict())
-    
-    return {"message": "Shares sold successfully", "realized_pnl": realized_pnl}
+    return {"message": "Shares sold successfully", "realized_pnl": trade.realized_pnl, "matched_lots": trade.matched_lots}
 
 # 7. Update position P&L calculation
 async def update_positions_pnl_enhanced(user_id: str):
@@ -168,6 +168,31 @@ function App() {
             // Connection confirmed
             setIsConnected(true);
             console.log('WebSocket connection confirmed');
+            
+            // Send periodic heartbeat to keep connection alive
+            setTimeout(() => {
+              if (ws.readyState === WebSocket.OPEN) {
+                ws.send(JSON.stringify({ type: 'heartbeat', message: 'ping' }));
+              }
+            }, 30000); // Every 30 seconds
+          } else if (data.type === 'positions') {
+            // Pushed price/P&L deltas for open positions, plus ids closed by any path (manual close, sell, sweeper)
+            const removed = new Set(data.removed || []);
+            setOpenPositions(prev => {
+              const updates = new Map(data.data.map(update => [update.id, update]));
+              if (data.data.some(update => !prev.some(position => position.id === update.id))) {
+                // A position opened elsewhere (e.g. another tab) - fetch the full list
+                setTimeout(loadOpenPositions, 0);
+              }
+              return prev
+                .filter(position => !removed.has(position.id))
+                .map(position => updates.has(position.id) ? { ...position, ...updates.get(position.id) } : position);
+            });
+          } else if (data.type === 'position_closed') {
+            // Stop-loss/take-profit auto-close
+            setOpenPositions(prev => prev.filter(position => position.id !== data.data.id));
+            loadUserTrades();
+            loadUserPerformance();
           } else if (data.type === 'message') {
             setMessages(prev => [...prev, data.data]);
             // Play sound notification for admin messages
@@ -205,13 +230,6 @@ function App() {
           // Even if message parsing fails, connection is working
           setIsConnected(true);
         }
-        
-        // Send periodic heartbeat to keep connection alive
-        setTimeout(() => {
-          if (ws.readyState === WebSocket.OPEN) {
-            ws.send(JSON.stringify({ type: 'heartbeat', message: 'ping' }));
-          }
-        }, 30000); // Every 30 seconds
       };
 
       ws.onerror = (error) => {
@@ -265,13 +283,7 @@ function App() {
       if (currentUser.is_admin) {
         loadPendingUsers();
       }
-      
-      // Set up interval to refresh positions every 30 seconds
-      const interval = setInterval(() => {
-        loadOpenPositions();
-      }, 30000);
-      
-      return () => clearInterval(interval);
+      // Position prices and P&L are pushed over the WebSocket after this initial load
     }
   }, [currentUser]);
 
@@ -286,8 +298,16 @@ function App() {
 
   const loadPendingUsers = async () => {
     try {
-      const response = await axios.get(`${API}/users/pending`);
-      setPendingUsers(response.data);
+      // The list is paged: follow X-Next-Cursor until every pending user is loaded
+      const pending = [];
+      let after = null;
+      do {
+        const query = after ? `?after=${encodeURIComponent(after)}` : '';
+        const response = await axios.get(`${API}/users/pending${query}`);
+        pending.push(...response.data);
+        after = response.headers['x-next-cursor'];
+      } while (after);
+      setPendingUsers(pending);
     } catch (error) {
       console.error('Error loading pending users:', error);
     }
@@ -389,6 +409,8 @@ function App() {
       console.error('Error sending message:', error);
       if (error.response?.status === 403) {
         alert('Only approved users can send messages');
+      } else if (error.response?.status === 429) {
+        alert(`You're sending messages too fast. Try again in ${error.response.headers['retry-after'] || 1}s.`);
       }
     }
   };
@@ -0,0 +1,123 @@
+"""Benchmark portfolio analytics over a synthetic trade ledger.
+
+Times building the columns from trade documents (as streamed from MongoDB), the vectorized
+computation, the same computation over a legacy ledger whose SELLs carry no realized P&L, and
+a cache miss through get_user_analytics end to end (against an in-memory cursor, so the
+Mongo round trips themselves are not included). Run from the repository root:
+    python scripts/bench_analytics.py [trades]
+"""
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from analytics import AnalyticsCache, Ledger, compute_analytics, get_user_analytics  # noqa: E402
+from lots import LotBook  # noqa: E402
+
+SYMBOLS = ["TSLA", "AAPL", "NVDA", "AMD", "MSFT", "META", "AMZN", "GOOG", "SPY", "QQQ"]
+
+
+def build_ledger(count, rng):
+    """Trades over about two years, with SELLs matched FIFO like the server records them"""
+    books = {symbol: LotBook("fifo") for symbol in SYMBOLS}
+    prices = {symbol: rng.uniform(20, 500) for symbol in SYMBOLS}
+    now = datetime(2024, 1, 1)
+    trades = []
+    for _ in range(count):
+        now += timedelta(seconds=rng.expovariate(1 / 600))
+        symbol = rng.choice(SYMBOLS)
+        prices[symbol] *= 1 + rng.gauss(0, 0.01)
+        book = books[symbol]
+        trade = {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))), "symbol": symbol,
+            "quantity": rng.randint(1, 100), "price": round(prices[symbol], 2), "timestamp": now,
+        }
+        if book.quantity and rng.random() < 0.45:
+            fill = book.sell(trade["quantity"], trade["price"])
+            trade.update(action="SELL", realized_pnl=round(fill.realized_pnl, 2), matched_lots=fill.matched)
+        else:
+            trade["action"] = "BUY"
+            book.buy(trade["quantity"], trade["price"], trade["id"])
+        trades.append(trade)
+    return trades
+
+
+class _Cursor:
+    """Just enough of a Motor cursor for load_ledger and get_user_analytics"""
+
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction):
+        if direction < 0:
+            self._docs = self._docs[::-1]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def limit(self, count):
+        self._docs = self._docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self._docs[:length]
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for doc in self._docs:
+            yield doc
+
+
+class _Trades:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return _Cursor(self.docs)
+
+
+class _DB:
+    def __init__(self, docs):
+        self.paper_trades = _Trades(docs)
+
+
+def best_of(runs, fn):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main(count: int = 100000):
+    trades = build_ledger(count, random.Random(42))
+    build_ms, ledger = best_of(5, lambda: Ledger.from_trades(trades))
+    compute_ms, analytics = best_of(5, lambda: compute_analytics(ledger))
+
+    legacy = Ledger.from_trades({k: v for k, v in trade.items() if k not in ("realized_pnl", "matched_lots")} for trade in trades)
+    legacy_ms, _ = best_of(5, lambda: compute_analytics(legacy))
+
+    db = _DB(trades)
+    # A fresh cache every run, so each one is a miss
+    miss_ms, _ = best_of(5, lambda: asyncio.run(get_user_analytics(db, AnalyticsCache(), "bench")))
+
+    print(f"{count} trades, {analytics['completed_trades']} sells, {len(analytics['equity_curve'])} days")
+    print(f"build columns   {build_ms:8.2f} ms")
+    print(f"compute         {compute_ms:8.2f} ms")
+    print(f"compute, legacy {legacy_ms:8.2f} ms")
+    print(f"cache miss      {miss_ms:8.2f} ms")
+    print(f"sharpe {analytics['sharpe_ratio']}  sortino {analytics['sortino_ratio']}  "
+          f"max drawdown {analytics['max_drawdown']}  profit factor {analytics['profit_factor']}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,99 @@
+"""Benchmark chat search query latency on a generated corpus.
+
+Run from the repository root:
+    python scripts/bench_chat_search.py [messages] [index path]
+
+The index is built once and reused on later runs with the same path.
+"""
+import asyncio
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from chat_search import ChatSearchIndex  # noqa: E402
+
+WORDS = ("the stock is going to moon today buy sell hold calls puts earnings guidance dip rip lol "
+         "bullish bearish breakout support resistance volume squeeze short long yolo gap fill "
+         "chart pattern trend reversal options expiry strike premium theta delta gamma").split()
+SYMBOLS = ["TSLA", "NVDA", "AAPL", "AMD", "GME", "SPY", "QQQ", "MSFT", "AMZN", "META"] + [f"S{i:03d}" for i in range(490)]
+
+
+def generate(count, rng):
+    start = datetime(2024, 1, 1)
+    users = [f"u{i}" for i in range(2000)]
+    # Chat-ish words are very common; a long Zipf tail of other words makes up the rest
+    tail = [f"w{i}" for i in range(20000)]
+    vocabulary = WORDS + tail
+    cum_weights = list(itertools.accumulate([200.0] * len(WORDS) + [100.0 / (rank + 1) for rank in range(len(tail))]))
+    for i in range(count):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(4, 25))
+        tickers = []
+        if rng.random() < 0.35:
+            tickers = list(dict.fromkeys(rng.choices(SYMBOLS, weights=[50] * 10 + [1] * 490, k=rng.randint(1, 2))))
+            words += ["$" + symbol for symbol in tickers]
+            rng.shuffle(words)
+        yield {
+            "id": f"m{i}",
+            "user_id": rng.choice(users),
+            "timestamp": start + timedelta(seconds=i * 3),
+            "content": " ".join(words),
+            "highlighted_tickers": tickers,
+        }
+
+
+async def build(index, count, batch_size=5000):
+    rng = random.Random(42)
+    batch = []
+    for message in generate(count, rng):
+        batch.append(message)
+        if len(batch) >= batch_size:
+            await index.add_many(batch)
+            batch = []
+    if batch:
+        await index.add_many(batch)
+
+
+async def measure(index, label, repeat=50, **kwargs):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        ids, cursor = await index.search(**kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:40} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  ({len(ids)} results)")
+    return cursor
+
+
+async def main(count: int = 1_000_000, path: str = None):
+    path = Path(path or Path(tempfile.gettempdir()) / f"bench_chat_search_{count}.db")
+    index = ChatSearchIndex(path)
+    if await index.last_timestamp() is None:
+        started = time.perf_counter()
+        await build(index, count)
+        print(f"Indexed {count:,} messages in {time.perf_counter() - started:.1f}s ({path.stat().st_size / 1e6:.0f} MB)")
+
+    await measure(index, "rare term", query="w5000")
+    await measure(index, "two common terms", query="squeeze breakout")
+    await measure(index, "common term, relevance", query="moon")
+    await measure(index, "common term, recent", query="moon", sort="recent")
+    await measure(index, "prefix", query="bull*")
+    await measure(index, "short prefix", query="mo*")
+    await measure(index, "ticker filter", query="calls", symbol="TSLA", sort="recent")
+    await measure(index, "user filter", query="earnings", user_id="u7")
+    await measure(index, "date filter", query="dip", since=datetime(2024, 1, 10), until=datetime(2024, 1, 11), sort="recent")
+    cursor = await measure(index, "page 1, recent", query="gamma", sort="recent", limit=20)
+    await measure(index, "page 2 via cursor, recent", query="gamma", sort="recent", limit=20, cursor=cursor)
+    await index.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) if i == 0 else arg for i, arg in enumerate(sys.argv[1:3]))))
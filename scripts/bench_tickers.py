@@ -0,0 +1,55 @@
+"""Benchmark $TICKER extraction over a synthetic chat corpus.
+
+Run from the repository root:
+    python scripts/bench_tickers.py [messages]
+"""
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from tickers import TickerExtractor  # noqa: E402
+
+WORDS = "the stock is going to moon today buy sell hold calls puts earnings guidance dip rip lol".split()
+
+
+def legacy_extract(content):
+    return re.findall(r'\$([A-Z]{1,5})', content.upper())
+
+
+def build_corpus(count, symbols, rng):
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(4, 30))
+        # Roughly a third of chat messages mention one or more tickers
+        if rng.random() < 0.35:
+            for _ in range(rng.randint(1, 3)):
+                symbol = rng.choice(symbols)
+                words.insert(rng.randrange(len(words) + 1), "$" + (symbol.lower() if rng.random() < 0.1 else symbol))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def timed(label, fn, corpus):
+    started = time.perf_counter()
+    found = sum(len(tickers) for tickers in fn(corpus))
+    elapsed = time.perf_counter() - started
+    print(f"{label:28} {elapsed * 1000:8.1f} ms  {len(corpus) / elapsed:12,.0f} msg/s  {found:8} tickers")
+
+
+def main(message_count: int = 500_000):
+    rng = random.Random(42)
+    symbols = ["".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ", k=rng.randint(1, 5))) for _ in range(8000)]
+    corpus = build_corpus(message_count, symbols, rng)
+    universe = frozenset(symbols[:5000])
+
+    timed("legacy re.findall + upper", lambda c: [legacy_extract(m) for m in c], corpus)
+    timed("TickerExtractor", TickerExtractor().extract_many, corpus)
+    timed("TickerExtractor + universe", TickerExtractor(universe).extract_many, corpus)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,56 @@
+"""Benchmark stop-loss/take-profit evaluation on the in-memory trigger book.
+
+Run from the repository root:
+    python scripts/bench_trigger_book.py [positions] [symbols] [ticks]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from trigger_book import TriggerBook  # noqa: E402
+
+
+def main(position_count: int = 100_000, symbol_count: int = 500, tick_count: int = 200_000):
+    rng = random.Random(42)
+    symbols = [f"S{i:03d}" for i in range(symbol_count)]
+    prices = {symbol: rng.uniform(10, 500) for symbol in symbols}
+
+    book = TriggerBook()
+    started = time.perf_counter()
+    for i in range(position_count):
+        symbol = rng.choice(symbols)
+        price = prices[symbol]
+        book.upsert({
+            "id": f"p{i}",
+            "user_id": f"u{i % 5000}",
+            "symbol": symbol,
+            "quantity": rng.randint(1, 500),
+            "avg_price": price,
+            "stop_loss": round(price * rng.uniform(0.5, 0.98), 2),
+            "take_profit": round(price * rng.uniform(1.02, 1.5), 2),
+        })
+    build_seconds = time.perf_counter() - started
+
+    triggered = 0
+    started = time.perf_counter()
+    for _ in range(tick_count):
+        # One price update for one symbol, random walk of up to ±0.5%
+        symbol = symbols[rng.randrange(symbol_count)]
+        prices[symbol] *= 1 + rng.uniform(-0.005, 0.005)
+        crossed = book.crossed(symbol, prices[symbol])
+        triggered += len(crossed)
+        for entry, _ in crossed:
+            book.remove(entry["id"])
+    tick_seconds = time.perf_counter() - started
+
+    print(f"positions: {position_count}  symbols: {symbol_count}")
+    print(f"build: {build_seconds:.2f}s")
+    print(f"ticks: {tick_count} in {tick_seconds:.2f}s -> {tick_count / tick_seconds:,.0f} ticks/s")
+    print(f"triggered: {triggered}  remaining: {len(book)}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
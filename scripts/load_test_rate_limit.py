@@ -0,0 +1,110 @@
+"""Load test: latency for well-behaved chat users while one account floods POST /messages.
+
+Runs a FastAPI app in-process over raw ASGI. Each accepted message waits for a connection
+from a small pool, standing in for the Mongo insert, so unlimited spam queues everyone else
+behind it. Run from the repository root:
+    python scripts/load_test_rate_limit.py [seconds] [flood concurrency]
+"""
+import asyncio
+import json
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi import FastAPI, HTTPException  # noqa: E402
+
+from rate_limit import InMemoryRateLimiter  # noqa: E402
+
+GOOD_USERS = 50
+GOOD_INTERVAL = 0.5
+DB_POOL = 10
+DB_LATENCY = 0.003
+
+
+def build_app(limited: bool) -> FastAPI:
+    app = FastAPI()
+    limiter = InMemoryRateLimiter({"messages": (10, 1)})
+    pool = asyncio.Semaphore(DB_POOL)
+
+    @app.post("/messages")
+    async def create_message(user_id: str):
+        if limited:
+            retry_after = await limiter.hit("messages", user_id)
+            if retry_after:
+                raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": str(math.ceil(retry_after))})
+        async with pool:
+            await asyncio.sleep(DB_LATENCY)
+        return {"ok": True}
+
+    return app
+
+
+async def post(app, user_id: str) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/messages", "raw_path": b"/messages",
+        "query_string": f"user_id={user_id}".encode(), "root_path": "",
+        "headers": [(b"content-type", b"application/json")], "client": ("127.0.0.1", 1), "server": ("test", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps({}).encode(), "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def scenario(limited: bool, seconds: float, flood: int) -> dict:
+    app = build_app(limited)
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    counts = {"flood_sent": 0, "flood_limited": 0}
+
+    async def good_user(i):
+        await asyncio.sleep(GOOD_INTERVAL * i / GOOD_USERS)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await post(app, f"good{i}")
+            latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(GOOD_INTERVAL)
+
+    async def flooder():
+        while time.perf_counter() < deadline:
+            status = await post(app, "spammer")
+            counts["flood_sent"] += 1
+            counts["flood_limited"] += status == 429
+            # A buggy client retrying in a tight loop still yields to the event loop between requests
+            await asyncio.sleep(0.001)
+
+    await asyncio.gather(*(good_user(i) for i in range(GOOD_USERS)), *(flooder() for _ in range(flood)))
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        **counts,
+    }
+
+
+def main(seconds: float = 5.0, flood: int = 100):
+    for label, limited, flood_size in [
+        ("baseline, no flood", True, 0),
+        ("flood, no rate limit", False, flood),
+        ("flood, rate limited", True, flood),
+    ]:
+        result = asyncio.run(scenario(limited, seconds, flood_size))
+        print(f"{label:22} good users p50 {result['p50']:7.2f} ms  p99 {result['p99']:7.2f} ms  "
+              f"flood requests {result['flood_sent']:7}  rejected {result['flood_limited']:7}")
+
+
+if __name__ == "__main__":
+    main(*(float(arg) if i == 0 else int(arg) for i, arg in enumerate(sys.argv[1:3])))
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import AnalyticsCache, Ledger, compute_analytics, get_user_analytics
+
+START = datetime(2024, 3, 1, 9, 30)
+
+
+def trade(trade_id, symbol, action, quantity, price, hours, realized_pnl=None, matched_lots=None):
+    return {
+        "id": trade_id, "user_id": "u1", "symbol": symbol, "action": action, "quantity": quantity,
+        "price": price, "timestamp": START + timedelta(hours=hours),
+        "realized_pnl": realized_pnl, "matched_lots": matched_lots,
+    }
+
+
+LEDGER = [
+    trade("b1", "TSLA", "BUY", 10, 100.0, 0),
+    trade("b2", "AAPL", "BUY", 5, 50.0, 1),
+    trade("s1", "TSLA", "SELL", 10, 120.0, 3, 200.0, [{"trade_id": "b1", "quantity": 10, "price": 100.0}]),
+    trade("s2", "AAPL", "SELL", 5, 10.0, 25, -200.0, [{"trade_id": "b2", "quantity": 5, "price": 50.0}]),
+    trade("b3", "TSLA", "BUY", 10, 100.0, 48),
+    trade("s3", "TSLA", "SELL", 10, 150.0, 48 + 24 * 10, 500.0, [{"trade_id": "b3", "quantity": 10, "price": 100.0}]),
+]
+
+
+def test_equity_drawdown_and_profit_factor():
+    analytics = compute_analytics(Ledger.from_trades(LEDGER), starting_equity=1000.0)
+
+    assert analytics["total_profit"] == 500.0
+    assert analytics["profit_factor"] == pytest.approx(700 / 200)
+    assert analytics["win_percentage"] == pytest.approx(66.67)
+    # Peak 1200 after s1, trough 1000 after s2
+    assert analytics["max_drawdown"] == 200.0
+    assert analytics["max_drawdown_percentage"] == pytest.approx(16.67)
+    curve = analytics["equity_curve"]
+    assert curve[0] == {"date": "2024-03-01", "equity": 1200.0, "drawdown": 0.0}
+    assert curve[1] == {"date": "2024-03-02", "equity": 1000.0, "drawdown": 200.0}
+    assert curve[-1] == {"date": "2024-03-13", "equity": 1500.0, "drawdown": 0.0} and len(curve) == 13
+    assert analytics["sharpe_ratio"] is not None and analytics["sortino_ratio"] > analytics["sharpe_ratio"]
+
+
+def test_per_symbol_breakdown_and_holding_times():
+    analytics = compute_analytics(Ledger.from_trades(LEDGER))
+
+    assert analytics["symbols"] == [
+        {"symbol": "AAPL", "trades": 2, "completed_trades": 1, "win_percentage": 0.0, "volume": 300.0, "realized_pnl": -200.0},
+        {"symbol": "TSLA", "trades": 4, "completed_trades": 2, "win_percentage": 100.0, "volume": 4700.0, "realized_pnl": 700.0},
+    ]
+    holding = analytics["holding_hours"]
+    assert holding["lots"] == 3
+    assert holding["median"] == 24.0
+    assert holding["max"] == 240.0
+    assert holding["buckets"] == {"<1h": 0, "<1d": 1, "<1w": 1, "<30d": 1, ">=30d": 0}
+
+
+def test_sells_without_recorded_pnl_fall_back_to_average_cost():
+    analytics = compute_analytics(Ledger.from_trades([
+        trade("b1", "TSLA", "BUY", 10, 100.0, 0),
+        trade("b2", "TSLA", "BUY", 10, 200.0, 1),
+        trade("s1", "TSLA", "SELL", 5, 170.0, 2),
+    ]))
+
+    assert analytics["total_profit"] == 100.0
+    assert analytics["holding_hours"]["lots"] == 0
+
+    # Interleaved symbols are replayed separately, and recorded P&L is kept as is
+    analytics = compute_analytics(Ledger.from_trades([
+        trade("b1", "TSLA", "BUY", 10, 100.0, 0),
+        trade("b2", "AAPL", "BUY", 4, 50.0, 1),
+        trade("s1", "AAPL", "SELL", 2, 40.0, 2, -20.0, [{"trade_id": "b2", "quantity": 2, "price": 50.0}]),
+        trade("s2", "TSLA", "SELL", 4, 110.0, 3),
+        trade("s3", "AAPL", "SELL", 5, 60.0, 4),
+    ]))
+
+    assert [(row["symbol"], row["realized_pnl"]) for row in analytics["symbols"]] == [("AAPL", 0.0), ("TSLA", 40.0)]
+
+
+def test_empty_ledger():
+    analytics = compute_analytics(Ledger.from_trades([]))
+
+    assert analytics["trades_count"] == 0
+    assert analytics["equity_curve"] == [] and analytics["symbols"] == []
+    assert analytics["profit_factor"] is None and analytics["sharpe_ratio"] is None
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction):
+        self._docs = sorted(self._docs, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def limit(self, count):
+        self._docs = self._docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self._docs
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for doc in self._docs:
+            yield doc
+
+
+class _Trades:
+    def __init__(self, docs):
+        self.docs = docs
+        self.ledger_loads = 0
+
+    def find(self, query, projection):
+        if "timestamp" in projection:
+            self.ledger_loads += 1
+        return _Cursor([doc for doc in self.docs if doc["user_id"] == query["user_id"]])
+
+
+class _DB:
+    def __init__(self, docs):
+        self.paper_trades = _Trades(docs)
+
+
+def test_cache_is_reused_until_a_new_trade_arrives():
+    db = _DB(list(LEDGER[:3]))
+    cache = AnalyticsCache()
+
+    async def run():
+        first = await get_user_analytics(db, cache, "u1")
+        again = await get_user_analytics(db, cache, "u1")
+        db.paper_trades.docs.append(LEDGER[3])
+        updated = await get_user_analytics(db, cache, "u1")
+        return first, again, updated
+
+    first, again, updated = asyncio.run(run())
+    assert again is first
+    assert updated["total_profit"] == 0.0
+    assert db.paper_trades.ledger_loads == 2
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,47 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from blob_store import BlobTooLarge, LocalBlobStore
+
+
+async def chunks(data: bytes, size: int = 1000):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def collect(iterator):
+    return b"".join([chunk async for chunk in iterator])
+
+
+def test_local_store_dedupes_and_serves_ranges(tmp_path):
+    data = bytes(range(256)) * 100
+    store = LocalBlobStore(tmp_path)
+
+    async def run():
+        first = await store.put_stream(chunks(data), "image/png", max_size=1024 * 1024)
+        second = await store.put_stream(chunks(data, 333), "image/png", max_size=1024 * 1024)
+        info = await store.stat(first.digest)
+        whole = await collect(store.open_range(first.digest, 0, info.size - 1))
+        part = await collect(store.open_range(first.digest, 100, 5099))
+        return first, second, info, whole, part
+
+    first, second, info, whole, part = asyncio.run(run())
+
+    assert first.digest == second.digest == hashlib.sha256(data).hexdigest()
+    assert (info.size, info.content_type) == (len(data), "image/png")
+    assert whole == data
+    assert part == data[100:5100]
+    # One blob plus its metadata sidecar, no leftover temp files
+    assert sorted(p.name for p in tmp_path.rglob("*") if p.is_file()) == sorted([first.digest, first.digest + ".json"])
+
+
+def test_local_store_rejects_oversized_uploads(tmp_path):
+    store = LocalBlobStore(tmp_path)
+
+    with pytest.raises(BlobTooLarge):
+        asyncio.run(store.put_stream(chunks(b"x" * 5000), "image/png", max_size=4096))
+
+    assert not [p for p in tmp_path.rglob("*") if p.is_file()]
+    assert asyncio.run(store.stat("../../etc/passwd")) is None
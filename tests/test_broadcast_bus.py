@@ -0,0 +1,200 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import CollectionInvalid
+
+from broadcast_bus import InProcessBus, MongoBus
+from connection_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        self.frames.append(frame)
+
+
+def test_in_process_bus_dispatches_to_every_handler():
+    received = []
+
+    async def run():
+        bus = InProcessBus()
+        bus.subscribe("ping", lambda event: _append(received, ("a", event)))
+        bus.subscribe("ping", lambda event: _append(received, ("b", event)))
+        await bus.publish("ping", {"n": 1})
+        await bus.publish("other", {"n": 2})
+
+    asyncio.run(run())
+    assert received == [("a", {"n": 1}), ("b", {"n": 1})]
+
+
+async def _append(target, item):
+    target.append(item)
+
+
+class _TailCursor:
+    """Tailable cursor over a fake capped collection: each pass yields what was appended since"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.position = 0
+        self.alive = True
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        while self.position < len(self.collection.docs):
+            if self.collection.broken:
+                raise ConnectionError("connection reset")
+            self.position += 1
+            yield self.collection.docs[self.position - 1]
+        if self.collection.broken:
+            raise ConnectionError("connection reset")
+
+
+class _CappedCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.broken = False
+
+    async def find_one(self, query, projection=None, sort=None):
+        return self.docs[-1] if self.docs else None
+
+    def find(self, query, cursor_type=None):
+        return _TailCursor(self)
+
+
+class _BusDB:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def create_collection(self, name, **options):
+        pass
+
+    def __getitem__(self, name):
+        return self.collection
+
+
+def _event(prefix: str, fill: str, n: int) -> dict:
+    # Same second, different processes: the ObjectId tails aren't in insertion order
+    return {"_id": ObjectId(prefix + fill * 8), "kind": "ping", "payload": {"n": n}, "origin": "other"}
+
+
+def test_mongo_bus_resumes_in_insertion_order_after_reconnect():
+    collection = _CappedCollection([_event("65000000", "00", 0)])
+    bus = MongoBus(_BusDB(collection))
+    bus.reconnect_delay = 0.01
+    received = []
+    bus.subscribe("ping", lambda event: _append(received, event["n"]))
+
+    async def run():
+        await bus.start()
+        await asyncio.sleep(0.1)
+        collection.docs.append(_event("65000000", "bb", 1))
+        await asyncio.sleep(0.1)
+
+        # Lose the connection; meanwhile another process inserts an event with a smaller ObjectId
+        collection.broken = True
+        await asyncio.sleep(0.1)
+        collection.docs.append(_event("65000000", "aa", 2))
+        collection.broken = False
+        await asyncio.sleep(0.2)
+
+        # Lose it again while the capped collection rolls over past the last event seen
+        collection.broken = True
+        await asyncio.sleep(0.1)
+        collection.docs[:] = [_event("65000001", "cc", 3), _event("65000001", "01", 4)]
+        collection.broken = False
+        await asyncio.sleep(0.2)
+        await bus.stop()
+
+    asyncio.run(run())
+    assert received == [1, 2, 3, 4]
+
+
+class _ExistingCollection:
+    def __init__(self, capped):
+        self.capped = capped
+
+    async def options(self):
+        return {"capped": True, "size": 4096} if self.capped else {}
+
+    async def find_one(self, query, projection=None, sort=None):
+        return None
+
+    def find(self, query, cursor_type=None):
+        return _TailCursor(_CappedCollection([]))
+
+
+class _ExistingDB(_BusDB):
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.commands = []
+
+    async def create_collection(self, name, **options):
+        raise CollectionInvalid(f"collection {name} already exists")
+
+    async def command(self, name, value, **options):
+        self.commands.append((name, value, options))
+
+
+def test_mongo_bus_converts_an_uncapped_collection_on_start():
+    plain, capped = _ExistingDB(_ExistingCollection(capped=False)), _ExistingDB(_ExistingCollection(capped=True))
+
+    async def run():
+        for db in (plain, capped):
+            bus = MongoBus(db, size_bytes=4096)
+            await bus.start()
+            await bus.stop()
+
+    asyncio.run(run())
+    assert plain.commands == [("convertToCapped", "bus_events", {"size": 4096})]
+    assert capped.commands == []
+
+
+def test_mongo_bus_relays_frames_between_workers():
+    """Two managers with their own MongoBus stand in for two uvicorn workers"""
+    mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+    async def run():
+        client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=500)
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            pytest.skip("MongoDB is not reachable")
+        db = client[f"bus_test_{uuid.uuid4().hex[:8]}"]
+        try:
+            workers = [ConnectionManager(bus=MongoBus(db)) for _ in range(3)]
+            sockets = []
+            for i, worker in enumerate(workers):
+                await worker.bus.start()
+                socket = FakeWebSocket()
+                await worker.connect(socket, f"user{i}", roles=["admin"] if i == 2 else [])
+                sockets.append(socket)
+            await asyncio.sleep(0.2)
+
+            await workers[0].broadcast("chat frame")
+            await workers[1].send_to_users(["user0"], "personal frame")
+            await workers[0].send_admin_notification("admin frame")
+            await asyncio.sleep(1)
+
+            for worker in workers:
+                await worker.bus.stop()
+            return sockets
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    sockets = asyncio.run(run())
+    assert sockets[0].frames == ["chat frame", "personal frame"]
+    assert sockets[1].frames == ["chat frame"]
+    assert sockets[2].frames == ["chat frame", "admin frame"]
@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from chat_search import ChatSearchIndex, match_expression, sync_from_db
+
+START = datetime(2024, 1, 1)
+
+
+def message(i, content, user_id="u1", tickers=()):
+    return {
+        "id": f"m{i}",
+        "user_id": user_id,
+        "timestamp": START + timedelta(minutes=i),
+        "content": content,
+        "highlighted_tickers": list(tickers),
+    }
+
+
+MESSAGES = [
+    message(0, "buying $TSLA calls before earnings", tickers=["TSLA"]),
+    message(1, "earnings earnings earnings for $NVDA", user_id="u2", tickers=["NVDA"]),
+    message(2, "selling my $TSLA position after earnings", user_id="u2", tickers=["TSLA"]),
+    message(3, "lunch anyone?"),
+    message(4, "earnings season is wild"),
+]
+
+
+def run(coro_fn, tmp_path):
+    async def main():
+        index = ChatSearchIndex(tmp_path / "chat.db")
+        try:
+            await index.add_many(MESSAGES)
+            return await coro_fn(index)
+        finally:
+            await index.close()
+
+    return asyncio.run(main())
+
+
+def test_match_expression_quotes_words():
+    # Operators and syntax in user input are neutralized into quoted terms
+    assert match_expression('earn" OR *') == '"earn" "OR"*'
+    assert match_expression("tsla calls") == '"tsla" "calls"'
+    assert match_expression("  !! ") is None
+
+
+def test_ranked_search_and_filters(tmp_path):
+    async def queries(index):
+        return (
+            await index.search("earnings"),
+            await index.search("earn*", symbol="TSLA"),
+            await index.search("earnings", user_id="u2", sort="recent"),
+            await index.search("earnings", since=START + timedelta(minutes=2), until=START + timedelta(minutes=4)),
+            await index.search("nothing matches"),
+        )
+
+    ranked, by_symbol, by_user, by_date, empty = run(queries, tmp_path)
+    ids, cursor = ranked
+    # Highest term frequency first
+    assert ids[0] == "m1" and set(ids) == {"m0", "m1", "m2", "m4"} and cursor is None
+    assert set(by_symbol[0]) == {"m0", "m2"}
+    assert by_user[0] == ["m2", "m1"]
+    assert by_date[0] == ["m2"]
+    assert empty == ([], None)
+
+
+@pytest.mark.parametrize("sort", ["relevance", "recent"])
+def test_cursor_pagination_covers_every_match_once(tmp_path, sort):
+    async def pages(index):
+        seen, cursor = [], None
+        while True:
+            ids, cursor = await index.search("earnings", sort=sort, limit=1, cursor=cursor)
+            seen += ids
+            if cursor is None:
+                return seen
+
+    seen = run(pages, tmp_path)
+    assert sorted(seen) == ["m0", "m1", "m2", "m4"]
+    if sort == "recent":
+        assert seen == ["m4", "m2", "m1", "m0"]
+
+
+def test_bad_cursor_raises_value_error(tmp_path):
+    async def bad(index):
+        with pytest.raises(ValueError):
+            await index.search("earnings", cursor="nope")
+
+    run(bad, tmp_path)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+        self.messages = self
+
+    def find(self, query, projection):
+        self.queries.append(query)
+        since = query.get("timestamp", {}).get("$gte")
+        return FakeCursor([doc for doc in self.docs if since is None or doc["timestamp"] >= since])
+
+
+def test_sync_from_db_indexes_only_new_messages(tmp_path):
+    async def main():
+        index = ChatSearchIndex(tmp_path / "chat.db")
+        db = FakeDb(MESSAGES[:3])
+        assert await sync_from_db(index, db, batch_size=2) == 3
+        db.docs = MESSAGES
+        assert await sync_from_db(index, db) == 2
+        assert "$gte" in db.queries[-1]["timestamp"]
+        ids, _ = await index.search("lunch")
+        await index.close()
+        return ids
+
+    assert asyncio.run(main()) == ["m3"]
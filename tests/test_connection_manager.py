@@ -0,0 +1,90 @@
+import asyncio
+
+from connection_manager import ConnectionManager, positions_topic
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.frames = []
+        self.closed_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        await asyncio.sleep(self.delay)
+        self.frames.append(frame)
+
+    async def close(self, code=1000):
+        self.closed_code = code
+
+
+def test_slow_consumer_is_evicted_without_stalling_others():
+    async def run():
+        manager = ConnectionManager(max_queue=4)
+        fast = FakeWebSocket()
+        slow = FakeWebSocket(delay=10)
+        await manager.connect(fast, "fast")
+        await manager.connect(slow, "slow")
+
+        for i in range(10):
+            await manager.broadcast({"type": "message", "n": i})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        return manager, fast, slow
+
+    manager, fast, slow = asyncio.run(run())
+
+    assert len(fast.frames) == 10
+    assert fast.frames[0] == '{"type": "message", "n": 0}'
+    assert slow.closed_code == 1013
+    assert "slow" not in manager.user_connections
+    metrics = manager.metrics()
+    assert metrics["evicted_connections"] == 1
+    assert metrics["dropped_frames"] == 1
+    assert metrics["connections"] == 1
+
+
+def test_topic_publish_only_reaches_subscribers():
+    async def run():
+        manager = ConnectionManager()
+        alice, bob = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(alice, "alice")
+        await manager.connect(bob, "bob")
+        recipients = manager.publish_local(positions_topic("alice"), "update")
+        await asyncio.sleep(0)
+        manager.disconnect(bob, "bob")
+        return manager, recipients, alice, bob
+
+    manager, recipients, alice, bob = asyncio.run(run())
+    assert recipients == 1
+    assert alice.frames == ["update"]
+    assert bob.frames == []
+    assert positions_topic("bob") not in manager.topics
+
+
+def test_multiple_sockets_per_user_and_admin_routing():
+    async def run():
+        manager = ConnectionManager()
+        tab1, tab2, member = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(tab1, "boss", roles=["admin"])
+        await manager.connect(tab2, "boss", roles=["admin"])
+        await manager.connect(member, "member")
+
+        await manager.send_admin_notification("registration")
+        await manager.send_to_users(["boss"], "direct")
+        await asyncio.sleep(0.01)
+
+        manager.disconnect(tab1, "boss")
+        await manager.update_user_roles("boss", [])
+        await manager.send_admin_notification("after demotion")
+        await asyncio.sleep(0.01)
+        return manager, tab1, tab2, member
+
+    manager, tab1, tab2, member = asyncio.run(run())
+    assert tab1.frames == ["registration", "direct"]
+    assert tab2.frames == ["registration", "direct"]
+    assert member.frames == []
+    assert manager.metrics()["admins"] == 0
+    assert len(manager.user_connections["boss"]) == 1
@@ -0,0 +1,109 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from blob_store import LocalBlobStore
+from image_pipeline import ImagePipeline, InvalidImage, render_variants, sniff_image_type
+
+
+def png_bytes(width, height, mode="RGBA"):
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_render_variants_sniffs_type_and_never_upscales():
+    source_type, variants = render_variants(png_bytes(2000, 500))
+
+    assert source_type == "image/png"
+    assert sorted(variants) == ["1024.jpeg", "1024.webp", "256.jpeg", "256.webp", "64.jpeg", "64.webp"]
+    assert Image.open(io.BytesIO(variants["64.webp"])).size == (64, 16)
+    assert Image.open(io.BytesIO(variants["1024.jpeg"])).format == "JPEG"
+
+    _, small = render_variants(png_bytes(40, 40, "RGB"))
+    assert Image.open(io.BytesIO(small["256.webp"])).size == (40, 40)
+
+
+def test_render_variants_rejects_non_images():
+    with pytest.raises(InvalidImage):
+        render_variants(b"definitely not an image")
+
+    # Pillow can decode BMP, but only PNG/JPEG/GIF/WebP are accepted
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffer, "BMP")
+    with pytest.raises(InvalidImage):
+        render_variants(buffer.getvalue())
+
+
+def test_sniff_image_type_ignores_declared_type():
+    assert sniff_image_type(png_bytes(4, 4)) == "image/png"
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4)).save(buffer, "GIF")
+    assert sniff_image_type(buffer.getvalue()) == "image/gif"
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4)).save(buffer, "WEBP")
+    assert sniff_image_type(buffer.getvalue()) == "image/webp"
+    assert sniff_image_type(b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>') is None
+    assert sniff_image_type(b"") is None
+
+
+class _Variants:
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        return self.docs.get(query["source"])
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs[query["source"]] = update["$set"]
+
+
+class _DB:
+    def __init__(self):
+        self.image_variants = _Variants()
+
+
+def test_pipeline_caches_variants_by_content_hash(tmp_path):
+    store = LocalBlobStore(tmp_path)
+    pipeline = ImagePipeline(store, _DB(), max_workers=1)
+
+    async def source():
+        yield png_bytes(300, 300)
+
+    async def run():
+        blob = await store.put_stream(source(), "image/jpeg", max_size=1024 * 1024)
+        first = await pipeline.variants_for(blob.digest, lambda digest: f"/api/blobs/{digest}")
+        pipeline.shutdown()
+        # Second lookup is served from the cache without re-rendering
+        second = await pipeline.variants_for(blob.digest, lambda digest: f"/api/blobs/{digest}")
+        return first, second, await store.stat(blob.digest)
+
+    first, second, stored = asyncio.run(run())
+    assert first == second
+    assert first["content_type"] == "image/png"
+    # The declared type is replaced by the decoded one
+    assert stored.content_type == "image/png"
+    assert pipeline._executor is None
+
+
+def test_pipeline_deletes_sources_that_fail_to_decode(tmp_path):
+    store = LocalBlobStore(tmp_path)
+    pipeline = ImagePipeline(store, _DB(), max_workers=1)
+
+    async def source():
+        # PNG signature followed by garbage
+        yield b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+    async def run():
+        blob = await store.put_stream(source(), "image/png", max_size=1024 * 1024)
+        try:
+            with pytest.raises(InvalidImage):
+                await pipeline.variants_for(blob.digest, lambda digest: f"/api/blobs/{digest}")
+        finally:
+            pipeline.shutdown()
+        return await store.stat(blob.digest)
+
+    assert asyncio.run(run()) is None
+    assert not [p for p in tmp_path.rglob("*") if p.is_file()]
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from leaderboard import METRICS, Leaderboard, WindowBoard, rebuild_leaderboard, window_pipeline, window_start
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# A Wednesday
+NOW = datetime(2024, 5, 15, 14, 0)
+
+
+def test_window_starts():
+    assert window_start("daily", NOW) == datetime(2024, 5, 15)
+    assert window_start("weekly", NOW) == datetime(2024, 5, 13)
+    assert window_start("all", NOW) is None
+    with pytest.raises(ValueError):
+        window_start("monthly", NOW)
+
+
+def test_top_and_rank_match_a_full_sort():
+    rng = random.Random(11)
+    board = WindowBoard()
+    for _ in range(3000):
+        user_id = f"u{rng.randint(1, 300)}"
+        board.add(user_id, None if rng.random() < 0.5 else round(rng.uniform(-500, 600), 2))
+
+    for metric in METRICS:
+        expected = sorted(((-values[metric], user_id) for user_id, values in board._values.items()))
+        top = board.top(metric, offset=40, limit=20)
+        assert [(rank, user_id) for rank, user_id, _ in top] == [(41 + i, user_id) for i, (_, user_id) in enumerate(expected[40:60])]
+        for rank, (negated, user_id) in enumerate(expected, start=1):
+            assert board.rank(metric, user_id) == (rank, -negated)
+
+
+def test_trades_count_in_their_windows_and_boards_roll_over():
+    clock = FakeClock(NOW)
+    leaderboard = Leaderboard(clock=clock)
+
+    leaderboard.record("alice", NOW, 100.0)
+    leaderboard.record("bob", NOW, None)
+    leaderboard.record("bob", NOW, 250.0)
+    # Late event from last week only counts all-time
+    leaderboard.record("carol", NOW - timedelta(days=7), 900.0)
+
+    assert [user_id for _, user_id, _ in leaderboard.top("daily", "total_profit")] == ["bob", "alice"]
+    assert [user_id for _, user_id, _ in leaderboard.top("all", "total_profit")] == ["carol", "bob", "alice"]
+    assert leaderboard.rank("weekly", "bob")["trades_count"] == (1, 2)
+    # Tied with alice, so ordered by user id
+    assert leaderboard.rank("daily", "bob")["win_percentage"] == (2, 100.0)
+    assert leaderboard.rank("daily", "carol")["total_profit"] is None
+
+    clock.now = NOW + timedelta(days=1)
+    assert leaderboard.top("daily", "total_profit") == []
+    assert len(leaderboard.board("weekly")) == 2
+
+    clock.now = NOW + timedelta(days=5)
+    assert len(leaderboard.board("weekly")) == 0
+    assert len(leaderboard.board("all")) == 3
+
+
+def test_all_time_takes_full_totals_from_the_event():
+    leaderboard = Leaderboard(clock=FakeClock(NOW))
+    all_time = {"realized_pnl": 1200.0, "completed": 6, "wins": 4, "trades": 15}
+
+    # The board never saw dave's earlier trades, but the event carries his totals
+    leaderboard.record("dave", NOW, 200.0, all_time)
+    leaderboard.record("dave", NOW, 200.0, all_time)
+
+    assert leaderboard.rank("all", "dave")["trades_count"] == (1, 15)
+    assert leaderboard.rank("all", "dave")["average_gain"] == (1, 200.0)
+    assert leaderboard.rank("daily", "dave")["trades_count"] == (1, 2)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for doc in self._docs:
+            yield doc
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipelines = []
+
+    def find(self, query, projection):
+        return _Cursor(self.docs)
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        start = pipeline[0]["$match"]["timestamp"]["$gte"] if "$match" in pipeline[0] else None
+        return _Cursor([dict(doc) for doc in self.docs if doc["start"] == start])
+
+
+class _DB:
+    def __init__(self):
+        self.performance_stats = _Collection([
+            {"user_id": "alice", "realized_pnl": 1000.0, "completed_trades": 4, "winning_trades": 3, "trades_count": 9},
+            {"user_id": "bob", "realized_pnl": -50.0, "completed_trades": 1, "winning_trades": 0, "trades_count": 2},
+        ])
+        self.paper_trades = _Collection([
+            {"start": datetime(2024, 5, 15), "user_id": "bob", "realized_pnl": 30.0, "completed": 1, "wins": 1, "trades": 1},
+            {"start": datetime(2024, 5, 13), "user_id": "bob", "realized_pnl": -50.0, "completed": 1, "wins": 0, "trades": 2},
+            # Full history: carol has never had her stats computed
+            {"start": None, "user_id": "bob", "realized_pnl": -80.0, "completed": 1, "wins": 0, "trades": 2},
+            {"start": None, "user_id": "carol", "realized_pnl": 90.0, "completed": 3, "wins": 2, "trades": 7},
+        ])
+
+
+def test_rebuild_loads_every_trader_and_prefers_stored_stats():
+    db = _DB()
+    leaderboard = Leaderboard(clock=FakeClock(NOW))
+
+    asyncio.run(rebuild_leaderboard(db, leaderboard))
+
+    assert leaderboard.top("all", "average_gain") == [(1, "alice", 250.0), (2, "carol", 30.0), (3, "bob", -50.0)]
+    assert leaderboard.top("daily", "total_profit") == [(1, "bob", 30.0)]
+    assert leaderboard.rank("weekly", "bob")["trades_count"] == (1, 2)
+    assert len(db.paper_trades.pipelines) == 3
+
+
+def test_startup_pipeline_counts_trades_like_the_live_path():
+    mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    trades = [
+        {"user_id": "alice", "action": "BUY", "realized_pnl": None, "timestamp": NOW},
+        {"user_id": "alice", "action": "SELL", "realized_pnl": 40.0, "timestamp": NOW},
+        {"user_id": "alice", "action": "SELL", "realized_pnl": -15.0, "timestamp": NOW},
+        # Unmatched SELL and a SELL from before lot tracking (no realized_pnl field at all)
+        {"user_id": "alice", "action": "SELL", "realized_pnl": None, "timestamp": NOW},
+        {"user_id": "bob", "action": "SELL", "timestamp": NOW},
+    ]
+
+    async def run():
+        client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=500)
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            pytest.skip("MongoDB is not reachable")
+        db = client[f"leaderboard_test_{uuid.uuid4().hex[:8]}"]
+        try:
+            await db.paper_trades.insert_many([dict(trade) for trade in trades])
+            return [row async for row in db.paper_trades.aggregate(window_pipeline(None))]
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    rebuilt = WindowBoard()
+    for row in asyncio.run(run()):
+        rebuilt.set(row["user_id"], row["realized_pnl"], row["completed"], row["wins"], row["trades"])
+    live = WindowBoard()
+    for trade in trades:
+        live.add(trade["user_id"], trade.get("realized_pnl"))
+
+    for metric in METRICS:
+        assert rebuilt.top(metric) == live.top(metric)
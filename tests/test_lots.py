@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from lots import LotBook
+
+
+def test_fifo_matches_oldest_lots_first_and_splits_partially():
+    book = LotBook("fifo")
+    book.buy(10, 100.0, "t1")
+    book.buy(10, 120.0, "t2")
+
+    fill = book.sell(15, 130.0)
+
+    assert fill.quantity == 15
+    assert fill.matched == [
+        {"trade_id": "t1", "quantity": 10, "price": 100.0},
+        {"trade_id": "t2", "quantity": 5, "price": 120.0},
+    ]
+    assert fill.realized_pnl == pytest.approx(10 * 30 + 5 * 10)
+    assert book.to_document() == [{"trade_id": "t2", "quantity": 5, "price": 120.0}]
+    assert book.avg_price == pytest.approx(120.0)
+
+
+def test_lifo_matches_newest_lots_first():
+    book = LotBook("lifo", [
+        {"trade_id": "t1", "quantity": 10, "price": 100.0},
+        {"trade_id": "t2", "quantity": 10, "price": 120.0},
+    ])
+
+    fill = book.sell(12, 110.0)
+
+    assert [lot["trade_id"] for lot in fill.matched] == ["t2", "t1"]
+    assert fill.realized_pnl == pytest.approx(10 * -10 + 2 * 10)
+    assert book.quantity == 8
+
+
+def test_average_keeps_one_merged_lot():
+    book = LotBook("average")
+    book.buy(10, 100.0, "t1")
+    book.buy(30, 120.0, "t2")
+
+    fill = book.sell(20, 125.0)
+
+    assert fill.matched == [{"trade_id": None, "quantity": 20, "price": 115.0}]
+    assert fill.realized_pnl == pytest.approx(20 * 10)
+    assert book.to_document() == [{"trade_id": None, "quantity": 20, "price": 115.0}]
+
+
+def test_overselling_only_matches_held_shares_and_empties_the_book():
+    book = LotBook("fifo", [{"trade_id": "t1", "quantity": 3, "price": 0.1}])
+    book.buy(7, 0.2, "t2")
+
+    fill = book.sell(50, 1.0)
+
+    assert fill.quantity == 10
+    assert book.quantity == 0
+    assert book.cost == 0.0
+    assert book.to_document() == []
+
+
+def test_positions_without_lots_become_one_lot():
+    book = LotBook.from_position({"quantity": 40, "avg_price": 12.5})
+
+    assert book.method == "fifo"
+    assert book.to_document() == [{"trade_id": None, "quantity": 40, "price": 12.5}]
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        LotBook("hifo")
+
+
+def test_random_fills_conserve_shares_and_cost():
+    rng = random.Random(3)
+    for method in ("fifo", "lifo", "average"):
+        book = LotBook(method)
+        bought = sold = 0
+        paid = received = realized = 0.0
+        for i in range(2000):
+            quantity, price = rng.randint(1, 50), round(rng.uniform(1, 500), 2)
+            if rng.random() < 0.55:
+                book.buy(quantity, price, f"t{i}")
+                bought += quantity
+                paid += quantity * price
+            else:
+                fill = book.sell(quantity, price)
+                sold += fill.quantity
+                received += fill.quantity * price
+                realized += fill.realized_pnl
+
+        assert book.quantity == bought - sold == sum(lot["quantity"] for lot in book.to_document())
+        # Whatever was paid is either still held as cost basis or came back as proceeds less P&L
+        assert paid == pytest.approx(book.cost + received - realized)
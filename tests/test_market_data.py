@@ -0,0 +1,78 @@
+import asyncio
+
+from market_data import MockQuoteProvider, QuoteCache, QuoteProvider
+
+
+class CountingProvider(QuoteProvider):
+    def __init__(self, delay: float = 0.0):
+        self.calls = {}
+        self.delay = delay
+
+    async def get_price(self, symbol: str) -> float:
+        self.calls[symbol] = self.calls.get(symbol, 0) + 1
+        await asyncio.sleep(self.delay)
+        return float(len(symbol) * 10 + self.calls[symbol])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_mock_provider_is_deterministic_with_seed():
+    async def prices(seed):
+        provider = MockQuoteProvider(seed=seed)
+        return [await provider.get_price("TSLA") for _ in range(5)]
+
+    assert asyncio.run(prices(7)) == asyncio.run(prices(7))
+
+
+def test_ttl_expiry_refetches():
+    provider = CountingProvider()
+    clock = FakeClock()
+    cache = QuoteCache(provider, ttl=5, clock=clock)
+
+    async def run():
+        first = await cache.get_price("aapl")
+        clock.now = 4
+        assert await cache.get_price("AAPL") == first
+        clock.now = 10
+        assert await cache.get_price("AAPL") != first
+
+    asyncio.run(run())
+    assert provider.calls == {"AAPL": 2}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_concurrent_misses_are_coalesced():
+    provider = CountingProvider(delay=0.01)
+    cache = QuoteCache(provider, ttl=60)
+
+    async def run():
+        return await asyncio.gather(*(cache.get_price("NVDA") for _ in range(50)))
+
+    prices = asyncio.run(run())
+    assert len(set(prices)) == 1
+    assert provider.calls == {"NVDA": 1}
+    assert cache.stats()["coalesced"] == 49
+
+
+def test_lru_eviction_is_bounded():
+    provider = CountingProvider()
+    cache = QuoteCache(provider, ttl=60, max_symbols=2)
+
+    async def run():
+        await cache.get_prices(["A", "B"])
+        await cache.get_price("A")  # A becomes most recently used
+        await cache.get_price("C")  # evicts B
+        await cache.get_price("A")
+        await cache.get_price("B")
+
+    asyncio.run(run())
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["evictions"] == 2
+    assert provider.calls == {"A": 1, "B": 2, "C": 1}
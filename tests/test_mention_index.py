@@ -0,0 +1,75 @@
+from mention_index import MentionIndex
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_trending_windows_slide():
+    clock = FakeClock()
+    index = MentionIndex(bucket_seconds=30, clock=clock)
+    start = clock.now
+
+    index.add("m1", ["TSLA", "NVDA"], start)
+    index.add("m2", ["TSLA"], start)
+    clock.now = start + 10 * 60
+    index.add("m3", ["AAPL"], clock.now)
+    index.add("m4", ["AAPL"], clock.now)
+    index.add("m5", ["AAPL"], clock.now)
+
+    assert index.trending("5m") == [{"symbol": "AAPL", "mentions": 3}]
+    assert index.trending("1h") == [
+        {"symbol": "AAPL", "mentions": 3},
+        {"symbol": "TSLA", "mentions": 2},
+        {"symbol": "NVDA", "mentions": 1},
+    ]
+    assert index.trending("1h", limit=1) == [{"symbol": "AAPL", "mentions": 3}]
+
+    clock.now = start + 2 * 60 * 60
+    assert index.trending("1h") == []
+    assert [t["symbol"] for t in index.trending("24h")] == ["AAPL", "TSLA", "NVDA"]
+
+    clock.now = start + 25 * 60 * 60
+    assert index.trending("24h") == []
+    assert index._buckets == {}
+
+
+def test_late_and_duplicate_messages():
+    clock = FakeClock()
+    index = MentionIndex(bucket_seconds=30, clock=clock)
+
+    index.add("m1", ["GME"], clock.now)
+    # Relayed twice, and one message timestamped before the 5m window
+    index.add("m1", ["GME"], clock.now)
+    index.add("old", ["GME"], clock.now - 30 * 60)
+
+    assert index.trending("5m") == [{"symbol": "GME", "mentions": 1}]
+    assert index.trending("1h") == [{"symbol": "GME", "mentions": 2}]
+    assert index.message_ids("GME", 2) == ["old", "m1"]
+
+
+def test_message_ids_page_backwards_and_defer_to_db():
+    clock = FakeClock()
+    index = MentionIndex(recent_per_symbol=3, clock=clock)
+    for i in range(8):
+        index.add(f"m{i}", ["AMD"], clock.now + i)
+
+    assert index.message_ids("AMD", 2) == ["m6", "m7"]
+    assert index.message_ids("AMD", 2, before="m6") == ["m4", "m5"]
+    # Not enough retained ids before the cursor, or an unknown cursor: caller asks the database
+    assert index.message_ids("AMD", 10) is None
+    assert index.message_ids("AMD", 2, before="m0") is None
+    assert index.message_ids("ZZZ", 1) is None
+
+
+def test_load_replaces_state():
+    clock = FakeClock()
+    index = MentionIndex(clock=clock)
+    index.add("stale", ["XOM"], clock.now)
+
+    index.load([("m1", ["SPY"], clock.now - 60), ("m2", ["SPY", "QQQ"], clock.now)])
+    assert index.trending("5m") == [{"symbol": "SPY", "mentions": 2}, {"symbol": "QQQ", "mentions": 1}]
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from message_buffer import RecentMessages
+
+
+START = datetime(2024, 1, 2, 9, 30)
+
+
+def make_messages(count):
+    return [SimpleNamespace(id=f"m{i:04d}", timestamp=START + timedelta(seconds=i)) for i in range(count)]
+
+
+def ids(messages):
+    return [message.id for message in messages]
+
+
+def test_latest_and_cursor_pages_are_served_from_memory():
+    buffer = RecentMessages(capacity=100)
+    messages = make_messages(30)
+    buffer.load(messages[:20], complete=True)
+    for message in messages[20:]:
+        buffer.add(message)
+
+    assert ids(buffer.latest(5)) == ["m0025", "m0026", "m0027", "m0028", "m0029"]
+    assert ids(buffer.after("m0027", 50)) == ["m0028", "m0029"]
+    assert ids(buffer.before("m0003", 50)) == ["m0000", "m0001", "m0002"]
+    assert buffer.after("unknown", 50) is None
+
+
+def test_buffer_defers_to_database_outside_its_window():
+    buffer = RecentMessages(capacity=10)
+    messages = make_messages(40)
+    buffer.load(messages[:10], complete=False)
+    for message in messages[10:]:
+        buffer.add(message)
+
+    # Trimmed back to at most 2x capacity, never below capacity
+    assert 10 <= len(buffer) < 20
+    assert buffer.latest(len(buffer) + 1) is None
+    oldest = ids(buffer.latest(len(buffer)))[0]
+    assert buffer.before(oldest, 5) is None
+    assert buffer.after("m0005", 5) is None
+
+
+def test_out_of_order_and_duplicate_messages():
+    buffer = RecentMessages(capacity=10)
+    first, second, third = make_messages(3)
+    buffer.load([first, third], complete=True)
+    buffer.add(second)
+    buffer.add(third)
+
+    assert ids(buffer.latest(10)) == ["m0000", "m0001", "m0002"]
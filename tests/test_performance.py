@@ -0,0 +1,155 @@
+import asyncio
+import random
+import uuid
+
+from performance import PerformanceStats, rebuild_performance_stats, record_trade, record_trades
+
+
+SYMBOLS = ["TSLA", "AAPL", "NVDA", "AMD"]
+
+
+def random_trades(rng: random.Random, count: int):
+    trades = []
+    for i in range(count):
+        trades.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "user_id": "u1",
+            "symbol": rng.choice(SYMBOLS),
+            "action": rng.choice(["BUY", "BUY", "SELL"]),
+            "quantity": rng.randint(1, 200),
+            "price": round(rng.uniform(5, 900), 2),
+            "timestamp": i,
+        })
+    return trades
+
+
+def replay(trades):
+    """Reference full-history replay of the average-cost ledger"""
+    positions = {}
+    completed = []
+    for trade in sorted(trades, key=lambda x: x["timestamp"]):
+        pos = positions.setdefault(trade["symbol"], {"shares": 0, "total_cost": 0.0})
+        if trade["action"] == "BUY":
+            pos["shares"] += trade["quantity"]
+            pos["total_cost"] += trade["quantity"] * trade["price"]
+        elif pos["shares"] > 0:
+            avg_cost = pos["total_cost"] / pos["shares"]
+            qty = min(trade["quantity"], pos["shares"])
+            completed.append((trade["price"] - avg_cost) * qty)
+            pos["shares"] -= qty
+            pos["total_cost"] = avg_cost * pos["shares"] if pos["shares"] else 0.0
+
+    if not completed:
+        return {"total_profit": 0.0, "win_percentage": 0.0, "trades_count": len(trades), "average_gain": 0.0}
+    total = sum(completed)
+    return {
+        "total_profit": round(total, 2),
+        "win_percentage": round(sum(1 for p in completed if p > 0) / len(completed) * 100, 2),
+        "trades_count": len(trades),
+        "average_gain": round(total / len(completed), 2),
+    }
+
+
+def test_incremental_matches_full_replay():
+    rng = random.Random(1234)
+    for _ in range(200):
+        trades = random_trades(rng, rng.randint(0, 300))
+
+        # Persist and reload the aggregate between trades, as the server does
+        doc = PerformanceStats("u1").to_document()
+        for trade in trades:
+            stats = PerformanceStats.from_document(doc)
+            stats.apply_trade(trade)
+            doc = stats.to_document()
+
+        assert PerformanceStats.from_document(doc).to_metrics() == replay(trades)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction):
+        self._docs = sorted(self._docs, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for doc in self._docs:
+            yield doc
+
+
+class _Collection:
+    def __init__(self, docs=None):
+        self.docs = docs or []
+
+    def find(self, query, projection=None):
+        return _Cursor([d for d in self.docs if d["user_id"] == query["user_id"]])
+
+    async def find_one(self, query, projection=None):
+        return next((d for d in self.docs if d["user_id"] == query["user_id"]), None)
+
+    async def replace_one(self, query, doc, upsert=False):
+        matched = [d for d in self.docs if all(d.get(field) == value for field, value in query.items())]
+        if matched or upsert:
+            self.docs = [d for d in self.docs if d["user_id"] != query["user_id"]] + [doc]
+        return _ReplaceResult(len(matched))
+
+
+class _ReplaceResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class _DB:
+    def __init__(self, trades):
+        self.paper_trades = _Collection(trades)
+        self.performance_stats = _Collection()
+
+
+def test_rebuild_streams_history_without_cap():
+    rng = random.Random(99)
+    trades = random_trades(rng, 2500)
+    rng.shuffle(trades)
+
+    stats = asyncio.run(rebuild_performance_stats(_DB(trades), "u1"))
+
+    assert stats.to_metrics() == replay(trades)
+    assert stats.trades_count == 2500
+
+
+def test_recorded_realized_pnl_is_summed_instead_of_replayed():
+    stats = PerformanceStats("u1")
+    stats.apply_trade({"id": "t1", "symbol": "TSLA", "action": "BUY", "quantity": 10, "price": 100.0})
+    stats.apply_trade({"id": "t2", "symbol": "TSLA", "action": "BUY", "quantity": 10, "price": 200.0})
+    # FIFO sell of the first lot: average cost would have said -300
+    stats.apply_trade({
+        "id": "t3", "symbol": "TSLA", "action": "SELL", "quantity": 10, "price": 120.0,
+        "realized_pnl": 200.0, "matched_lots": [{"trade_id": "t1", "quantity": 10, "price": 100.0}],
+    })
+
+    assert stats.to_metrics() == {"total_profit": 200.0, "win_percentage": 100.0, "trades_count": 3, "average_gain": 200.0}
+    assert stats.holdings["TSLA"]["shares"] == 10
+
+
+def test_batch_after_bulk_insert_rebuilds_once_without_double_counting():
+    rng = random.Random(7)
+    history = random_trades(rng, 50)
+    sells = [
+        {"id": f"s{i}", "user_id": "u1", "symbol": symbol, "action": "SELL", "quantity": 500, "price": 300.0, "timestamp": 50 + i}
+        for i, symbol in enumerate(SYMBOLS)
+    ]
+    db = _DB(history + sells)
+
+    # No aggregate yet: the rebuild already sees every inserted sell
+    stats = asyncio.run(record_trades(db, "u1", sells))
+    assert stats.to_metrics() == replay(history + sells)
+
+    # With an aggregate in place, later trades are applied incrementally
+    buy = {"id": "b", "user_id": "u1", "symbol": "TSLA", "action": "BUY", "quantity": 5, "price": 10.0, "timestamp": 60}
+    db.paper_trades.docs.append(buy)
+    stats = asyncio.run(record_trade(db, buy))
+    assert stats.to_metrics() == replay(history + sells + [buy])
+    assert db.performance_stats.docs[0]["trades_count"] == len(history) + len(sells) + 1
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+from connection_manager import ConnectionManager
+from position_stream import PositionStreamer
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        self.frames.append(frame)
+
+
+def test_streamer_pushes_one_coalesced_delta_per_user_and_skips_unchanged():
+    positions = {
+        "alice": [
+            {"id": "p1", "symbol": "TSLA", "quantity": 10, "avg_price": 200.0},
+            {"id": "p2", "symbol": "AAPL", "quantity": 5, "avg_price": 180.0},
+        ],
+        "bob": [{"id": "p3", "symbol": "AAPL", "quantity": 1, "avg_price": 190.0}],
+    }
+    prices = {"TSLA": 210.0, "AAPL": 185.0}
+    price_requests = []
+
+    async def load_positions(user_id):
+        return positions[user_id]
+
+    async def get_prices(symbols):
+        price_requests.append(sorted(symbols))
+        return dict(prices)
+
+    async def run():
+        manager = ConnectionManager()
+        sockets = {user_id: FakeWebSocket() for user_id in positions}
+        streamer = PositionStreamer(manager, load_positions, get_prices)
+        for user_id, socket in sockets.items():
+            await manager.connect(socket, user_id)
+            await streamer.watch(user_id)
+
+        first = await streamer.tick()
+        second = await streamer.tick()  # nothing moved
+        prices["TSLA"] = 220.0
+        third = await streamer.tick()  # only alice holds TSLA
+        await asyncio.sleep(0.01)
+        return sockets, (first, second, third)
+
+    sockets, pushed = asyncio.run(run())
+
+    assert pushed == (2, 0, 1)
+    assert price_requests[0] == ["AAPL", "TSLA"]
+    assert len(sockets["alice"].frames) == 2
+    assert len(sockets["bob"].frames) == 1
+    assert '"unrealized_pnl": 200.0' in sockets["alice"].frames[1]
+    assert '"AAPL"' not in sockets["alice"].frames[1]
+
+
+def test_refresh_pushes_removals_for_positions_closed_elsewhere():
+    positions = {"alice": [
+        {"id": "p1", "symbol": "TSLA", "quantity": 10, "avg_price": 200.0},
+        {"id": "p2", "symbol": "AAPL", "quantity": 5, "avg_price": 180.0},
+    ]}
+
+    async def load_positions(user_id):
+        return list(positions[user_id])
+
+    async def get_prices(symbols):
+        return {"TSLA": 210.0, "AAPL": 185.0}
+
+    async def run():
+        manager = ConnectionManager()
+        socket = FakeWebSocket()
+        streamer = PositionStreamer(manager, load_positions, get_prices)
+        await manager.connect(socket, "alice")
+        await streamer.watch("alice")
+        await streamer.tick()
+
+        # A manual close (not the sweeper) takes p1 off the open list
+        positions["alice"].pop(0)
+        await streamer.refresh("alice")
+        # Nothing else changed, so the next tick pushes nothing
+        pushed = await streamer.tick()
+        await asyncio.sleep(0.01)
+        return socket.frames, pushed
+
+    frames, pushed = asyncio.run(run())
+
+    assert pushed == 0
+    assert len(frames) == 2
+    assert json.loads(frames[1]) == {"type": "positions", "data": [], "removed": ["p1"]}
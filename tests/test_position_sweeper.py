@@ -0,0 +1,54 @@
+import asyncio
+
+from position_sweeper import PositionSweeper
+from trigger_book import TriggerBook
+
+
+def test_sweep_fetches_each_symbol_once_and_closes_crossed_positions():
+    book = TriggerBook()
+    book.load([
+        {"id": "sl", "symbol": "TSLA", "stop_loss": 260.0, "take_profit": None},
+        {"id": "tp", "symbol": "TSLA", "stop_loss": 100.0, "take_profit": 240.0},
+        {"id": "both", "symbol": "AAPL", "stop_loss": 190.0, "take_profit": 180.0},
+        {"id": "zero", "symbol": "AAPL", "stop_loss": 0, "take_profit": 500.0},
+        {"id": "quiet", "symbol": "AMD", "stop_loss": 150.0, "take_profit": 250.0},
+        {"id": "unarmed", "symbol": "NVDA", "stop_loss": None, "take_profit": None},
+    ])
+    price_requests = []
+    closed = []
+
+    async def get_prices(symbols):
+        price_requests.append(sorted(symbols))
+        return {"TSLA": 250.0, "AAPL": 185.0, "AMD": 200.0}
+
+    async def close_positions(triggered):
+        closed.extend((position["id"], price, reason) for position, price, reason in triggered)
+
+    sweeper = PositionSweeper(book, get_prices, close_positions)
+    assert asyncio.run(sweeper.sweep_once()) == 3
+
+    assert price_requests == [["AAPL", "AMD", "TSLA"]]
+    assert sorted(closed) == [
+        ("both", 185.0, "STOP_LOSS"),
+        ("sl", 250.0, "STOP_LOSS"),
+        ("tp", 250.0, "TAKE_PROFIT"),
+    ]
+
+
+def test_trigger_book_tracks_modifications_and_removals():
+    book = TriggerBook()
+    book.upsert({"id": "a", "symbol": "TSLA", "quantity": 10, "stop_loss": 200.0, "take_profit": 300.0})
+    book.upsert({"id": "b", "symbol": "TSLA", "quantity": 5, "stop_loss": 200.0, "take_profit": None})
+
+    assert {entry["id"] for entry, _ in book.crossed("TSLA", 199.0)} == {"a", "b"}
+
+    # Modify levels and quantity in place
+    book.upsert({"id": "a", "symbol": "TSLA", "quantity": 4, "stop_loss": 150.0, "take_profit": 300.0})
+    assert [(entry["id"], reason) for entry, reason in book.crossed("TSLA", 199.0)] == [("b", "STOP_LOSS")]
+    assert [(entry["quantity"], reason) for entry, reason in book.crossed("TSLA", 301.0)] == [(4, "TAKE_PROFIT")]
+
+    book.remove("b")
+    book.remove("a")
+    assert book.crossed("TSLA", 1.0) == []
+    assert book.symbols() == []
+    assert len(book) == 0
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import random
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from db_indexes import INDEXES, ensure_indexes
+from position_updates import apply_trade, merge_duplicate_open_positions, trade_lock
+
+
+def new_position(user_id="u1", symbol="TSLA", price=100.0):
+    return {
+        "id": str(uuid.uuid4()), "user_id": user_id, "symbol": symbol, "quantity": 0,
+        "avg_price": price, "entry_price": price, "stop_loss": None, "take_profit": None,
+        "is_open": True, "closed_at": None, "auto_close_reason": None,
+    }
+
+
+class RacingPositions:
+    """Fake collection whose first upsert loses the race to a concurrent insert"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise DuplicateKeyError("E11000 duplicate key")
+        return {"id": "p1", "quantity": 5, "is_open": True}
+
+    async def find_one(self, query, projection=None):
+        return None
+
+
+class ContendedPositions:
+    """Fake collection where another worker sells once between the first read and write"""
+
+    def __init__(self, position):
+        self.position = position
+        self.writes = 0
+
+    async def find_one(self, query, projection=None):
+        return dict(self.position)
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.writes += 1
+        if self.writes == 1:
+            self.position.update(quantity=7, version=1, lots=[{"trade_id": "b1", "quantity": 7, "price": 100.0}])
+        if query["version"] != self.position.get("version", {"$exists": False}):
+            return None
+        self.position.update(update["$set"])
+        return dict(self.position)
+
+
+def test_buy_retries_after_losing_the_open_race_and_sell_without_position():
+    positions = RacingPositions()
+
+    async def run():
+        bought = await apply_trade(positions, new_position(), "BUY", 5, 100.0)
+        sold = await apply_trade(positions, new_position(), "SELL", 5, 100.0)
+        return bought, sold
+
+    bought, sold = asyncio.run(run())
+    assert bought == ({"id": "p1", "quantity": 5, "is_open": True}, False, None)
+    assert positions.calls == 2
+    assert sold == (None, False, None)
+
+
+def test_sell_rematches_lots_after_a_concurrent_change():
+    positions = ContendedPositions({
+        "id": "p1", "quantity": 10, "avg_price": 100.0, "is_open": True,
+    })
+
+    position, closed, fill = asyncio.run(
+        apply_trade(positions, new_position(), "SELL", None, 110.0, close_fields={"current_price": 110.0})
+    )
+
+    assert positions.writes == 2
+    assert closed and position["current_price"] == 110.0
+    assert fill.matched == [{"trade_id": "b1", "quantity": 7, "price": 100.0}]
+    assert position["realized_pnl"] == 70.0
+    assert position["version"] == 2
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for doc in self._docs:
+            yield doc
+
+
+class _Result:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class DuplicatedPositions:
+    """Fake collection holding open positions written before the unique index existed"""
+
+    def __init__(self, docs):
+        self.docs = {doc["id"]: doc for doc in docs}
+
+    def aggregate(self, pipeline):
+        groups = {}
+        for doc in sorted(self.docs.values(), key=lambda doc: (doc["opened_at"], doc["id"])):
+            if doc["is_open"]:
+                groups.setdefault((doc["user_id"], doc["symbol"]), []).append(doc["id"])
+        return _Cursor([{"ids": ids} for ids in groups.values() if len(ids) > 1])
+
+    async def find_one_and_update(self, query, update, projection=None):
+        doc = self.docs.get(query["id"])
+        if doc is None or not doc["is_open"]:
+            return None
+        before = dict(doc)
+        doc.update(update["$set"])
+        return before
+
+    async def find_one(self, query, projection=None):
+        return dict(self.docs[query["id"]])
+
+    async def update_one(self, query, update):
+        doc = self.docs[query["id"]]
+        if doc.get("version", {"$exists": False}) != query["version"]:
+            return _Result(0)
+        doc.update(update["$set"])
+        return _Result(1)
+
+    async def create_indexes(self, indexes):
+        for index in indexes:
+            if index.document["name"] == "open_position_unique":
+                open_keys = [(doc["user_id"], doc["symbol"]) for doc in self.docs.values() if doc["is_open"]]
+                if len(open_keys) != len(set(open_keys)):
+                    raise OperationFailure("E11000 duplicate key error", code=11000)
+
+
+class _IndexDB:
+    def __init__(self, positions):
+        self.positions = positions
+        self.others = DuplicatedPositions([])
+
+    def __getitem__(self, name):
+        return self.positions if name == "positions" else self.others
+
+
+def test_duplicate_open_positions_are_merged_before_the_unique_index():
+    positions = DuplicatedPositions([
+        {"id": "a", "user_id": "u1", "symbol": "TSLA", "opened_at": 1, "is_open": True, "quantity": 10, "avg_price": 100.0},
+        {"id": "b", "user_id": "u1", "symbol": "TSLA", "opened_at": 2, "is_open": True, "quantity": 5, "avg_price": 130.0,
+         "lots": [{"trade_id": "t2", "quantity": 5, "price": 130.0}], "realized_pnl": 12.5, "version": 3},
+        {"id": "c", "user_id": "u1", "symbol": "AAPL", "opened_at": 3, "is_open": True, "quantity": 1, "avg_price": 50.0},
+    ])
+
+    asyncio.run(ensure_indexes(_IndexDB(positions)))
+
+    kept, merged = positions.docs["a"], positions.docs["b"]
+    assert kept["quantity"] == 15 and kept["avg_price"] == 110.0
+    assert kept["lots"] == [{"trade_id": None, "quantity": 10, "price": 100.0}, {"trade_id": "t2", "quantity": 5, "price": 130.0}]
+    assert (kept["realized_pnl"], kept["version"]) == (12.5, 1)
+    # The folded duplicate is closed but keeps its lots for audit
+    assert (merged["is_open"], merged["merged_into"], merged["quantity"]) == (False, "a", 5)
+    assert positions.docs["c"]["is_open"]
+    # Nothing left to merge on a second run
+    assert asyncio.run(merge_duplicate_open_positions(positions)) == 0
+
+
+def test_startup_fails_if_the_open_position_index_still_cannot_be_built():
+    class Unbuildable(DuplicatedPositions):
+        async def create_indexes(self, indexes):
+            if indexes[0].document["name"] == "open_position_unique":
+                raise OperationFailure("index build failed", code=1)
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(ensure_indexes(_IndexDB(Unbuildable([]))))
+
+
+def test_trade_lock_is_shared_per_user():
+    assert trade_lock("u1") is trade_lock("u1")
+    assert trade_lock("u1") is not trade_lock("u2")
+
+
+def test_parallel_trades_leave_exact_quantities():
+    """1,000 concurrent BUY/SELLs against MongoDB with no lost updates and one open position"""
+    mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+    async def run():
+        client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=500, maxPoolSize=200)
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            pytest.skip("MongoDB is not reachable")
+        db = client[f"positions_test_{uuid.uuid4().hex[:8]}"]
+        try:
+            await db.positions.create_indexes(INDEXES["positions"])
+            rng = random.Random(7)
+
+            # Fresh symbol: every BUY races to open the position
+            buys = [rng.randint(1, 100) for _ in range(500)]
+            await asyncio.gather(*(
+                apply_trade(db.positions, new_position(symbol="NVDA"), "BUY", quantity, 50.0) for quantity in buys
+            ))
+
+            # Mixed trades on an existing position, never selling it down to zero
+            await apply_trade(db.positions, new_position(symbol="AMD"), "BUY", 100000, 10.0)
+            trades = [("BUY" if rng.random() < 0.5 else "SELL", rng.randint(1, 100)) for _ in range(500)]
+
+            async def trade(action, quantity):
+                if action == "BUY":
+                    return await apply_trade(db.positions, new_position(symbol="AMD"), action, quantity, 10.0)
+                # Sells retry on version conflicts; the server serializes each user's trades like this
+                async with trade_lock("u1"):
+                    return await apply_trade(db.positions, new_position(symbol="AMD"), action, quantity, 10.0)
+
+            await asyncio.gather(*(trade(action, quantity) for action, quantity in trades))
+
+            nvda = await db.positions.find({"user_id": "u1", "symbol": "NVDA"}).to_list(None)
+            amd = await db.positions.find({"user_id": "u1", "symbol": "AMD", "is_open": True}).to_list(None)
+            return buys, trades, nvda, amd
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    buys, trades, nvda, amd = asyncio.run(run())
+    assert len(nvda) == 1
+    assert nvda[0]["quantity"] == sum(buys)
+    assert nvda[0]["avg_price"] == 50.0
+    assert len(amd) == 1
+    assert amd[0]["quantity"] == 100000 + sum(q if action == "BUY" else -q for action, q in trades)
+    assert sum(lot["quantity"] for lot in amd[0]["lots"]) == amd[0]["quantity"]
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from rate_limit import InMemoryRateLimiter, rules_from_env
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def hits(limiter, route, key, count):
+    async def run():
+        return [await limiter.hit(route, key) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_burst_then_refill_with_retry_after():
+    clock = FakeClock()
+    limiter = InMemoryRateLimiter({"messages": (3, 1.0)}, clock=clock)
+
+    assert hits(limiter, "messages", "u1", 3) == [0.0, 0.0, 0.0]
+    assert hits(limiter, "messages", "u1", 1) == [pytest.approx(1.0)]
+
+    clock.now = 0.5
+    assert hits(limiter, "messages", "u1", 1) == [pytest.approx(0.5)]
+    clock.now = 1.0
+    assert hits(limiter, "messages", "u1", 2) == [0.0, pytest.approx(1.0)]
+
+    # Refill caps at the burst size
+    clock.now = 100.0
+    assert hits(limiter, "messages", "u1", 4)[-1] > 0
+    assert limiter.stats()["allowed"] == 7
+
+
+def test_buckets_are_per_user_and_route():
+    limiter = InMemoryRateLimiter({"messages": (1, 1.0), "trades": (1, 1.0)}, clock=FakeClock())
+
+    assert hits(limiter, "messages", "spammer", 2)[1] > 0
+    assert hits(limiter, "messages", "friend", 1) == [0.0]
+    assert hits(limiter, "trades", "spammer", 1) == [0.0]
+
+
+def test_evicts_least_recently_used_bucket_at_the_cap():
+    clock = FakeClock()
+    limiter = InMemoryRateLimiter({"messages": (2, 1.0)}, max_keys=2, clock=clock)
+
+    hits(limiter, "messages", "busy", 2)
+    hits(limiter, "messages", "idle", 1)
+    # busy is used again, so idle becomes the least recently used
+    hits(limiter, "messages", "busy", 1)
+    hits(limiter, "messages", "new", 1)
+
+    assert list(key for _, key in limiter._buckets) == ["busy", "new"]
+    assert limiter.stats()["evictions"] == 1
+    # The busy user's empty bucket survived eviction
+    assert hits(limiter, "messages", "busy", 1)[0] > 0
+
+
+def test_rules_from_env(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_MESSAGES_BURST", "5")
+    assert rules_from_env({"messages": (10, 1), "trades": (20, 2)}) == {
+        "messages": (5.0, 1.0),
+        "trades": (20.0, 2.0),
+    }
@@ -0,0 +1,138 @@
+import asyncio
+
+import server
+from lots import Fill
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class _Positions:
+    def __init__(self, docs):
+        self.docs = {doc["id"]: doc for doc in docs}
+        self.writes = []
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.writes.append(request._doc)
+            doc = self.docs[request._filter["id"]]
+            if all(doc.get(field) == value for field, value in request._filter.items()):
+                doc.update(request._doc["$set"])
+
+    def find(self, query, projection=None):
+        return _Cursor([
+            {field: doc[field] for field in projection if field in doc}
+            for doc in self.docs.values()
+            if all(doc.get(field) == value for field, value in query.items())
+        ])
+
+
+class _Trades:
+    def __init__(self):
+        self.docs = []
+
+    async def bulk_write(self, requests, ordered=True):
+        self.docs.extend(request._doc for request in requests)
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+class _DB:
+    def __init__(self, positions):
+        self.positions = _Positions(positions)
+        self.paper_trades = _Trades()
+
+
+def _run_sweep(monkeypatch, positions, triggered):
+    db = _DB(positions)
+    recorded = []
+
+    async def record_trades_performance(user_id, trades):
+        recorded.append((user_id, [trade.id for trade in trades]))
+
+    async def ignore(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "record_trades_performance", record_trades_performance)
+    monkeypatch.setattr(server, "publish_trigger_change", ignore)
+    monkeypatch.setattr(server, "notify_positions_changed", ignore)
+    monkeypatch.setattr(server.manager, "publish", ignore)
+    asyncio.run(server.close_triggered_positions(triggered))
+    return db, recorded
+
+
+def test_auto_close_records_the_filled_quantity_and_realized_pnl(monkeypatch):
+    position = {
+        "id": "p1", "user_id": "u1", "symbol": "TSLA", "quantity": 15, "avg_price": 106.67, "is_open": True,
+        "cost_method": "fifo", "realized_pnl": 5.0, "version": 2,
+        "lots": [{"trade_id": "b1", "quantity": 10, "price": 100.0}, {"trade_id": "b2", "quantity": 5, "price": 120.0}],
+    }
+    db, recorded = _run_sweep(monkeypatch, [position], [(dict(position), 90.0, "STOP_LOSS")])
+
+    [trade] = db.paper_trades.docs
+    assert trade["action"] == "SELL"
+    assert trade["quantity"] == 15
+    assert trade["realized_pnl"] == -250.0
+    assert [lot["quantity"] for lot in trade["matched_lots"]] == [10, 5]
+    assert recorded == [("u1", [trade["id"]])]
+
+    closed = db.positions.docs["p1"]
+    assert closed["is_open"] is False
+    assert closed["quantity"] == 0
+    assert closed["realized_pnl"] == -245.0
+    assert closed["auto_close_reason"] == "STOP_LOSS"
+
+
+def test_auto_close_updates_each_users_stats_once_per_sweep(monkeypatch):
+    positions = [
+        {"id": f"p{i}", "user_id": user_id, "symbol": symbol, "quantity": 10, "avg_price": 100.0, "is_open": True}
+        for i, (user_id, symbol) in enumerate([("u1", "TSLA"), ("u2", "TSLA"), ("u1", "AAPL")])
+    ]
+    db, recorded = _run_sweep(monkeypatch, positions, [(dict(position), 110.0, "TAKE_PROFIT") for position in positions])
+
+    ids = {trade["position_id"]: trade["id"] for trade in db.paper_trades.docs}
+    assert recorded == [("u1", [ids["p0"], ids["p2"]]), ("u2", [ids["p1"]])]
+
+
+def test_auto_close_skips_positions_closed_elsewhere(monkeypatch):
+    position = {"id": "p1", "user_id": "u1", "symbol": "TSLA", "quantity": 10, "avg_price": 100.0, "is_open": False}
+    db, recorded = _run_sweep(monkeypatch, [position], [(dict(position, is_open=True), 90.0, "STOP_LOSS")])
+
+    assert db.paper_trades.docs == []
+    assert recorded == []
+
+
+def test_oversized_sell_records_only_the_shares_held(monkeypatch):
+    db = _DB([])
+    fill = Fill(10, 50.0, [{"trade_id": "b1", "quantity": 10, "price": 100.0}])
+
+    async def get_user(user_id):
+        return {"id": user_id, "status": server.UserStatus.APPROVED}
+
+    async def update_or_create_position(**kwargs):
+        return "p1", True, fill
+
+    async def ignore(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "get_user", get_user)
+    monkeypatch.setattr(server, "enforce_rate_limit", ignore)
+    monkeypatch.setattr(server, "update_or_create_position", update_or_create_position)
+    monkeypatch.setattr(server, "record_trade_performance", ignore)
+    monkeypatch.setattr(server, "notify_positions_changed", ignore)
+    trade = asyncio.run(server.create_paper_trade(
+        server.PaperTradeCreate(symbol="TSLA", action="SELL", quantity=25, price=105.0), "u1"
+    ))
+
+    [stored] = db.paper_trades.docs
+    assert trade.quantity == stored["quantity"] == 10
+    assert stored["realized_pnl"] == 50.0
+    assert stored["position_id"] == "p1" and stored["is_closed"] is True
@@ -0,0 +1,77 @@
+import asyncio
+
+from tickers import TickerExtractor, backfill_message_tickers, load_symbol_universe
+
+
+def test_uppercase_only_deduped_in_order():
+    extractor = TickerExtractor()
+    content = "$NVDA ripping, $tsla flat, $AAPL then $NVDA again and $nvda"
+    assert extractor.extract(content) == ["NVDA", "AAPL"]
+
+
+def test_rejects_overlong_symbols_and_bare_dollars():
+    extractor = TickerExtractor()
+    assert extractor.extract("paid $100 for $TOOLONG, $GME's run, $F.") == ["GME", "F"]
+    assert extractor.extract("no tickers here") == []
+
+
+def test_universe_filters_unlisted_symbols(tmp_path):
+    path = tmp_path / "symbols.txt"
+    path.write_text("# listed\nAAPL\nmsft  # lower-cased in file is fine\n\n")
+    universe = load_symbol_universe(str(path))
+    assert universe == frozenset({"AAPL", "MSFT"})
+
+    extractor = TickerExtractor(universe)
+    assert extractor.extract("$LOL $MSFT $AAPL $WAT") == ["MSFT", "AAPL"]
+    assert load_symbol_universe(None) is None
+
+
+def test_extract_many():
+    extractor = TickerExtractor()
+    assert extractor.extract_many(["$A $B", "", "$B $A $B"]) == [["A", "B"], [], ["B", "A"]]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeMessages:
+    def __init__(self, docs):
+        self.docs = docs
+        self.writes = []
+
+    def find(self, query, projection):
+        return FakeCursor(self.docs)
+
+    async def bulk_write(self, requests, ordered=True):
+        self.writes.append(requests)
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.messages = FakeMessages(docs)
+
+
+def test_backfill_updates_only_changed_messages_in_batches():
+    docs = [
+        {"_id": 1, "content": "$tsla $TSLA $TSLA", "highlighted_tickers": ["TSLA", "TSLA", "TSLA"]},
+        {"_id": 2, "content": "$AMD", "highlighted_tickers": ["AMD"]},
+        {"_id": 3, "content": "hello $spy", "highlighted_tickers": ["SPY"]},
+    ]
+    db = FakeDb(docs)
+
+    changed = asyncio.run(backfill_message_tickers(db, TickerExtractor(), batch_size=2))
+    assert changed == 2
+    updates = [op._doc["$set"]["highlighted_tickers"] for batch in db.messages.writes for op in batch]
+    assert updates == [["TSLA"], []]
@@ -0,0 +1,93 @@
+import asyncio
+import csv
+import io
+import json
+import resource
+from datetime import datetime, timedelta
+
+import pytest
+
+from trade_export import EXPORT_FIELDS, csv_chunks, export_chunks, ndjson_chunks
+
+START = datetime(2024, 1, 1)
+
+
+class FakeCursor:
+    """Async cursor that generates `count` trade documents lazily, like a Motor cursor"""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for i in range(self.count):
+            selling = i % 3 == 2
+            yield {
+                "id": f"trade-{i:07d}", "timestamp": START + timedelta(seconds=i), "symbol": "TSLA",
+                "action": "SELL" if selling else "BUY", "quantity": 10, "price": 100.0 + i % 50,
+                "realized_pnl": 12.5 if selling else None,
+                "matched_lots": [{"trade_id": f"trade-{i - 1:07d}", "quantity": 10, "price": 100.0}] if selling else None,
+                "position_id": "p1", "is_closed": False, "stop_loss": None, "take_profit": None, "notes": None,
+            }
+            # Let the event loop breathe the way a real cursor does between batches
+            if i % 1000 == 0:
+                await asyncio.sleep(0)
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+def test_ndjson_rows():
+    lines = asyncio.run(collect(ndjson_chunks(FakeCursor(3), rows_per_chunk=2))).decode().splitlines()
+
+    assert len(lines) == 3
+    last = json.loads(lines[2])
+    assert list(last) == EXPORT_FIELDS
+    assert last["timestamp"] == "2024-01-01T00:00:02"
+    assert last["matched_lots"] == [{"trade_id": "trade-0000001", "quantity": 10, "price": 100.0}]
+
+
+def test_csv_rows():
+    text = asyncio.run(collect(csv_chunks(FakeCursor(5), rows_per_chunk=2))).decode()
+    rows = list(csv.DictReader(io.StringIO(text)))
+
+    assert len(rows) == 5
+    assert rows[0]["realized_pnl"] == "" and rows[2]["realized_pnl"] == "12.5"
+    assert json.loads(rows[2]["matched_lots"])[0]["trade_id"] == "trade-0000001"
+
+
+def test_parquet_rows():
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = asyncio.run(collect(export_chunks(FakeCursor(7), "parquet")))
+
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 7
+    assert table.column("realized_pnl").to_pylist()[2] == 12.5
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        export_chunks(FakeCursor(1), "xlsx")
+
+
+def test_million_row_export_keeps_memory_flat():
+    """1M trades stream out as ~250MB of NDJSON while the process's peak RSS barely moves"""
+
+    async def run():
+        total = peak_chunk = 0
+        async for chunk in ndjson_chunks(FakeCursor(1_000_000)):
+            total += len(chunk)
+            peak_chunk = max(peak_chunk, len(chunk))
+        return total, peak_chunk
+
+    # ru_maxrss is the high-water mark in KiB on Linux
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    total, peak_chunk = asyncio.run(run())
+    grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+    assert total > 200 * 1024 * 1024
+    assert grown < 32 * 1024
+    assert peak_chunk < 1024 * 1024
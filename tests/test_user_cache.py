@@ -0,0 +1,134 @@
+import asyncio
+
+from broadcast_bus import InProcessBus
+from user_cache import UserCache
+
+
+class FakeUsers:
+    """Stands in for db.users: find_one by id, counting round trips"""
+
+    def __init__(self, users, delay: float = 0.0):
+        self.users = {user["id"]: dict(user) for user in users}
+        self.delay = delay
+        self.loads = 0
+
+    async def find_one(self, user_id):
+        self.loads += 1
+        snapshot = self.users.get(user_id)
+        snapshot = dict(snapshot) if snapshot else None
+        await asyncio.sleep(self.delay)
+        return snapshot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hits_within_ttl_and_reloads_after():
+    users = FakeUsers([{"id": "u1", "status": "approved"}])
+    clock = FakeClock()
+    cache = UserCache(users.find_one, ttl=30, clock=clock)
+
+    async def run():
+        for _ in range(3):
+            assert (await cache.get("u1"))["status"] == "approved"
+        clock.now = 31
+        await cache.get("u1")
+
+    asyncio.run(run())
+    assert users.loads == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction_and_unknown_users_not_cached():
+    users = FakeUsers([{"id": f"u{i}"} for i in range(3)])
+    cache = UserCache(users.find_one, max_entries=2)
+
+    async def run():
+        await cache.get("u0")
+        await cache.get("u1")
+        await cache.get("u0")
+        await cache.get("u2")
+        assert await cache.get("missing") is None
+        users.users["missing"] = {"id": "missing"}
+        assert await cache.get("missing") == {"id": "missing"}
+
+    asyncio.run(run())
+    # u1 then u0 were least recently used when u2 and the new user arrived
+    assert set(cache._entries) == {"u2", "missing"}
+    assert cache.stats()["evictions"] == 2
+
+
+def test_returned_records_are_copies():
+    users = FakeUsers([{"id": "u1", "is_admin": False}])
+    cache = UserCache(users.find_one)
+
+    async def run():
+        (await cache.get("u1"))["is_admin"] = True
+        return await cache.get("u1")
+
+    assert asyncio.run(run())["is_admin"] is False
+
+
+def test_invalidation_over_bus_stops_stale_approval_and_role():
+    users = FakeUsers([{"id": "u1", "status": "approved", "is_admin": True}])
+    cache = UserCache(users.find_one, ttl=3600)
+    bus = InProcessBus()
+
+    async def on_invalidate(event):
+        cache.invalidate(event["user_id"])
+
+    bus.subscribe("users.invalidate", on_invalidate)
+
+    async def run():
+        assert (await cache.get("u1"))["is_admin"]
+        # Revoke both, the way set-role and approve do: write, then invalidate
+        users.users["u1"].update(status="rejected", is_admin=False)
+        await bus.publish("users.invalidate", {"user_id": "u1"})
+        return await cache.get("u1")
+
+    user = asyncio.run(run())
+    assert user["status"] == "rejected"
+    assert user["is_admin"] is False
+
+
+def test_load_racing_an_invalidation_is_not_cached():
+    users = FakeUsers([{"id": "u1", "status": "approved"}], delay=0.01)
+    cache = UserCache(users.find_one, ttl=3600)
+
+    async def run():
+        # Reader snapshots the old record, then the write + invalidation land before it returns
+        reader = asyncio.create_task(cache.get("u1"))
+        await asyncio.sleep(0)
+        users.users["u1"]["status"] = "rejected"
+        cache.invalidate("u1")
+        assert (await reader)["status"] == "approved"
+        return await cache.get("u1")
+
+    assert asyncio.run(run())["status"] == "rejected"
+    assert users.loads == 2
+
+
+def test_invalidation_bookkeeping_is_dropped_once_loads_finish():
+    users = FakeUsers([{"id": f"u{i}", "status": "approved"} for i in range(100)], delay=0.001)
+    cache = UserCache(users.find_one, ttl=3600)
+
+    async def run():
+        for i in range(100):
+            reader = asyncio.create_task(cache.get(f"u{i}"))
+            await asyncio.sleep(0)
+            cache.invalidate(f"u{i}")
+            await reader
+        # Invalidating users with no load in flight leaves nothing behind
+        for i in range(1000):
+            cache.invalidate(f"gone{i}")
+
+    asyncio.run(run())
+    assert cache._versions == {} and cache._loading == {}
+    assert cache.stats()["invalidations"] == 1100
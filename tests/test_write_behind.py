@@ -0,0 +1,86 @@
+import asyncio
+
+from write_behind import WriteBehindQueue
+
+
+class RecordingSink:
+    def __init__(self, fail_times: int = 0, delay: float = 0.0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.delay = delay
+
+    async def __call__(self, batch):
+        await asyncio.sleep(self.delay)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("mongo unavailable")
+        self.batches.append(list(batch))
+
+
+def test_batches_by_size_then_by_time():
+    sink = RecordingSink()
+    writer = WriteBehindQueue(sink, max_batch=3, max_delay=0.02)
+
+    async def run():
+        writer.start()
+        for i in range(4):
+            await writer.put({"id": i})
+        await asyncio.sleep(0.05)
+        await writer.stop()
+
+    asyncio.run(run())
+    assert sink.batches == [[{"id": 0}, {"id": 1}, {"id": 2}], [{"id": 3}]]
+    assert writer.stats()["written"] == 4
+
+
+def test_put_blocks_when_queue_is_full():
+    sink = RecordingSink(delay=0.05)
+    writer = WriteBehindQueue(sink, max_batch=1, max_delay=0, max_pending=2)
+
+    async def run():
+        writer.start()
+        for i in range(3):
+            await writer.put({"id": i})
+        # Writer holds one document in flight and the queue is at capacity
+        blocked = asyncio.create_task(writer.put({"id": 3}))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await blocked
+        await writer.stop()
+
+    asyncio.run(run())
+    assert [doc["id"] for batch in sink.batches for doc in batch] == [0, 1, 2, 3]
+
+
+def test_failed_batches_are_retried_and_stop_flushes_everything():
+    sink = RecordingSink(fail_times=2)
+    writer = WriteBehindQueue(sink, max_batch=100, max_delay=10)
+
+    async def run():
+        writer.start()
+        for i in range(10):
+            await writer.put({"id": i})
+        # Long max_delay: nothing would be written yet without the shutdown flush
+        await writer.stop()
+
+    asyncio.run(run())
+    assert [doc["id"] for batch in sink.batches for doc in batch] == list(range(10))
+    assert writer.stats()["failures"] == 2
+    assert writer.stats()["pending"] == 0
+
+
+def test_batches_that_keep_failing_are_dropped():
+    sink = RecordingSink(fail_times=3)
+    writer = WriteBehindQueue(sink, max_batch=2, max_delay=0, max_retries=2, retry_delay=0)
+
+    async def run():
+        writer.start()
+        for i in range(4):
+            await writer.put({"id": i})
+        await writer.stop()
+
+    asyncio.run(run())
+    # The first batch fails three times and is dropped; the writer carries on with the next
+    assert [doc["id"] for batch in sink.batches for doc in batch] == [2, 3]
+    assert writer.stats()["dropped"] == 2
+    assert writer.stats()["failures"] == 3